@@ -2,7 +2,7 @@ import React, { createContext, useContext, useState, ReactNode } from "react";
 
 interface DeviceData {
   device_id: string;
-  timestamp: string;
+  ts: number;
   metrics: {
     [key: string]: any;
   };
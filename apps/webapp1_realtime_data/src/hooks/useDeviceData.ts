@@ -16,7 +16,7 @@ export const useDeviceData = () => {
       allMetricsRef.current.push(msg);
       updateDeviceData(msg);
 
-      const ts = new Date(msg.timestamp).getTime();
+      const ts = msg.ts;
 
       if (msg.device_id === "co2.ch0.capnograph") {
         const value = msg.metrics["co2.ch0.capnograph"] as number;
@@ -1,5 +1,23 @@
 import { useState, useRef, useCallback } from "react";
 import type { MetricMessage } from "../types/device-types";
+import {
+  decodeWaveformChunk,
+  waveformToMessage,
+} from "../utils/waveform-codec";
+
+// Backend sends one envelope per device report (several handles at once);
+// the dashboard state is keyed per handle, so split it on the metric keys.
+export const splitEnvelope = (data: MetricMessage): MetricMessage[] => {
+  const handles = Object.keys(data.metrics ?? {});
+  if (handles.length <= 1) {
+    return [{ ...data, device_id: handles[0] ?? data.device_id }];
+  }
+  return handles.map((handle) => ({
+    ...data,
+    device_id: handle,
+    metrics: { [handle]: data.metrics[handle] },
+  }));
+};
 
 interface UseWebSocketProps {
   onMessage: (msg: MetricMessage) => void;
@@ -14,14 +32,19 @@ export const useWebSocket = ({ onMessage }: UseWebSocketProps) => {
       const ws = new WebSocket(
         `wss://data.or-ecosystem.eu/ws/medical-device/${uuid}`
       );
+      ws.binaryType = "arraybuffer";
       wsRef.current = ws;
 
       ws.onopen = () => setConnected(true);
       ws.onmessage = (e: MessageEvent) => {
         try {
+          if (e.data instanceof ArrayBuffer) {
+            onMessage(waveformToMessage(decodeWaveformChunk(e.data)));
+            return;
+          }
           const data = JSON.parse(e.data);
-          const messages = Array.isArray(data) ? data : [data];
-          messages.forEach(onMessage);
+          const messages: MetricMessage[] = Array.isArray(data) ? data : [data];
+          messages.flatMap(splitEnvelope).forEach(onMessage);
         } catch (err) {
           console.error("Failed to parse message", err);
         }
@@ -11,9 +11,13 @@ import NoDevicesWarning from "../../components/dashboard/NoDeviceWarning";
 import DeviceGrid from "../../components/dashboard/DeviceGrid";
 
 import { useFullscreen } from "../../hooks/useFullScreen";
-import { useWebSocket } from "../../hooks/useWebSocket";
+import { useWebSocket, splitEnvelope } from "../../hooks/useWebSocket";
 import { useDeviceData } from "../../hooks/useDeviceData";
 import { generateDynamicLayout } from "../../utils/grid-layout";
+import {
+	decodeWaveformChunk,
+	waveformToMessage,
+} from "../../utils/waveform-codec";
 import {
 	ALL_MODULES,
 	type DeviceModule,
@@ -89,14 +93,19 @@ const OperationRoomPageNew: React.FC = () => {
 	const connect = () => {
 		wsRef.current?.close();
 		const ws = new WebSocket("wss://data.or-ecosystem.eu/ws/medical-device");
+		ws.binaryType = "arraybuffer";
 		wsRef.current = ws;
 
 		ws.onopen = () => setConnected(true);
 		ws.onmessage = (e: MessageEvent) => {
 			try {
+				if (e.data instanceof ArrayBuffer) {
+					handleMetric(waveformToMessage(decodeWaveformChunk(e.data)));
+					return;
+				}
 				const data = JSON.parse(e.data);
 				const messages = Array.isArray(data) ? data : [data];
-				messages.forEach(handleMetric);
+				messages.flatMap(splitEnvelope).forEach(handleMetric);
 			} catch (err) {
 				console.error("Failed to parse message", err);
 			}
@@ -4,9 +4,11 @@ export interface DataPoint {
 }
 
 export interface MetricMessage {
-  timestamp: string;
+  ts: number;
   metrics: Record<string, number | number[]>;
   device_id: string;
+  device_epr?: string;
+  room_id?: string;
 }
 
 export interface ModuleVisibility {
@@ -0,0 +1,73 @@
+import type { MetricMessage } from "../types/device-types";
+
+// Mirrors services/sdc_backend/app/services/waveform_codec.py
+// header <BBHdff: version, encoding, n_samples, t0 [s], sample_period [s], scale
+// then device EPR and handle, each as u8 length + utf-8
+const HEADER_SIZE = 20;
+const WAVEFORM_CHUNK_VERSION = 2;
+const ENC_INT16 = 0;
+const ENC_DELTA = 1;
+
+export interface WaveformChunk {
+  device: string;
+  handle: string;
+  t0: number;
+  samplePeriod: number;
+  samples: number[];
+}
+
+export const decodeWaveformChunk = (buffer: ArrayBuffer): WaveformChunk => {
+  const view = new DataView(buffer);
+  const version = view.getUint8(0);
+  if (version !== WAVEFORM_CHUNK_VERSION) {
+    throw new Error(`Unsupported waveform chunk version ${version}`);
+  }
+  const encoding = view.getUint8(1);
+  const count = view.getUint16(2, true);
+  const t0 = view.getFloat64(4, true);
+  const samplePeriod = view.getFloat32(12, true);
+  const scale = view.getFloat32(16, true);
+
+  const decoder = new TextDecoder();
+  let pos = HEADER_SIZE;
+  const readString = (): string => {
+    const len = view.getUint8(pos);
+    const value = decoder.decode(new Uint8Array(buffer, pos + 1, len));
+    pos += 1 + len;
+    return value;
+  };
+  const device = readString();
+  const handle = readString();
+
+  const samples = new Array<number>(count);
+  if (encoding === ENC_INT16) {
+    for (let i = 0; i < count; i++, pos += 2) {
+      samples[i] = view.getInt16(pos, true) * scale;
+    }
+  } else if (encoding === ENC_DELTA) {
+    let prev = 0;
+    for (let i = 0; i < count; i++) {
+      let z = 0;
+      let shift = 0;
+      let b: number;
+      do {
+        b = view.getUint8(pos++);
+        z += (b & 0x7f) * 2 ** shift;
+        shift += 7;
+      } while (b >= 0x80);
+      prev += z % 2 === 0 ? z / 2 : -(z + 1) / 2;
+      samples[i] = prev * scale;
+    }
+  } else {
+    throw new Error(`Unknown waveform encoding ${encoding}`);
+  }
+
+  return { device, handle, t0, samplePeriod, samples };
+};
+
+export const waveformToMessage = (chunk: WaveformChunk): MetricMessage => ({
+  device_id: chunk.handle,
+  ...(chunk.device ? { device_epr: chunk.device } : {}),
+  ts: Math.round(chunk.t0 * 1000),
+  metrics: { [chunk.handle]: chunk.samples },
+});
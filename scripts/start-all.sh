@@ -1,13 +1,9 @@
 #!/bin/bash
 
-# Zaženi providerje v ozadju
-python /app/providers/provider_spo2.py & 
-python /app/providers/provider_temperature.py &
-python /app/providers/provider_infusion.py &
-python /app/providers/provider_ecg.py &
-python /app/providers/provider_nibp.py &
-python /app/providers/provider_capnograph.py &
-python /app/providers/provider_ventilator.py &
+# Zaženi vse simulirane naprave v enem procesu (seznam naprav v providers.json).
+# UUID-ji naprav so privzeto tisti, ki jih soba pricakuje (DEVICE_UUIDS), po vrstnem redu v providers.json.
+export PROVIDER_UUIDS="${PROVIDER_UUIDS:-${DEVICE_UUIDS:-}}"
+python /app/providers/provider_host.py --config "${PROVIDER_HOST_CONFIG:-/app/providers/providers.json}" &
 
 # Zaženi FastAPI consumer
 exec python /app/sdc_backend/run.py --host 0.0.0.0 --reload
@@ -5,6 +5,8 @@ const url = process.env.INFLUX_URL;
 const token = process.env.INFLUX_TOKEN;
 const org = process.env.INFLUX_ORG;
 const bucket = "vital_signs";
+// "kafka_consumer" (Telegraf) ali "sdc_vitals" (neposredni sink v sdc_backend)
+const measurement = process.env.INFLUX_MEASUREMENT || "kafka_consumer";
 
 const client = new InfluxDB({ url, token });
 
@@ -14,7 +16,7 @@ async function queryMeasurements(roomId, start, stop) {
   const fluxQuery = `
     from(bucket: "${bucket}")
       |> range(start: time(v: "${start}"), stop: time(v: "${stop}"))
-      |> filter(fn: (r) => r["_measurement"] == "kafka_consumer")
+      |> filter(fn: (r) => r["_measurement"] == "${measurement}")
       |> filter(fn: (r) => r["room_id"] == "${roomId}")
   `;
 
@@ -1,40 +1,63 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
+from typing import Dict, List, Optional
 import logging
 import os
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 import pathlib
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse, JSONResponse
+from pydantic import BaseModel
 
 from app.services.sdc_consumer_service import sdc_consumer_service
+from app.services import consumers
+from app.services.rooms import RoomConfig, room_registry, load_room_configs
 from app.websockets.medical_device_ws import medical_device_ws
+from app.services.latency import latency_tracker
+from app.services.latest_values import latest_values
+from app.services.descriptor_index import descriptor_index
+from app.services.trends import trend_store, TREND_DEFAULT_POINTS, METHOD_LTTB
+from app.services.log_setup import setup_logging
+from app.services.loop_handoff import LoopHandoff
+from app.services.replay import replay_indexer, ReplaySession, parse_time, REPLAY
+from app.services.recorder import FORMAT_PARQUET
 
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("sdc_backend")
 logger = logging.getLogger(__name__)
 
-_main_loop = None
+# paketi in valovne oblike za WebSocket gredo v zanko v skupinah (en wakeup na skupino)
+_ws_handoff = LoopHandoff("websocket")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _main_loop
-    _main_loop = asyncio.get_running_loop()
-    await sdc_consumer_service.start()
+    _ws_handoff.bind(asyncio.get_running_loop())
+    if not room_registry.rooms():
+        room_registry.load(load_room_configs())
+
+    def forward_to_websocket(batch: List[Dict]):
+        _ws_handoff.post(medical_device_ws.broadcast_data, batch)
 
-    def forward_to_websocket(data: Dict):
-        asyncio.run_coroutine_threadsafe(
-            medical_device_ws.broadcast_data(data),
-            _main_loop
-        )
+    def forward_waveform_to_websocket(chunk: bytes, room_id: Optional[str], device_epr: Optional[str], handle: str):
+        _ws_handoff.post(medical_device_ws.broadcast_bytes, chunk, room_id, device_epr, handle)
 
     sdc_consumer_service.add_data_callback(forward_to_websocket)
+    def forget_device(room_id: Optional[str], device_epr: str):
+        _ws_handoff.post(medical_device_ws.remove_device, room_id, device_epr)
+
+    sdc_consumer_service.add_waveform_callback(forward_waveform_to_websocket)
+    sdc_consumer_service.add_device_removed_callback(forget_device)
+    await sdc_consumer_service.start()
+    if replay_indexer:
+        replay_indexer.start()
 
     yield
 
+    if replay_indexer:
+        replay_indexer.stop()
     await sdc_consumer_service.stop()
+    _ws_handoff.unbind()
 
 app = FastAPI(
     title="SDC Medical Device API",
@@ -58,17 +81,243 @@ app.mount("/static", StaticFiles(directory=pathlib.Path(__file__).parent.parent
 async def root():
     return RedirectResponse(url="/static/prikaz.html")
 
-ROOM_UUID = os.getenv("ROOM_UUID")
+class RoomRequest(BaseModel):
+    device_uuids: List[str] = []
+    targets: List[str] = []
+
+@app.get("/rooms")
+async def list_rooms():
+    managers = consumers.get_connection_managers()
+    rooms = []
+    for room in room_registry.rooms():
+        manager = managers.get(room.room_id)
+        rooms.append({
+            "room_id": room.room_id,
+            "devices": room.target_eprs,
+            "connected": sorted(manager.get_connected_eprs()) if manager else [],
+            "connect_timings": manager.get_connect_timings() if manager else {},
+        })
+    return {"rooms": rooms}
+
+@app.put("/rooms/{room_id}")
+async def put_room(room_id: str, request: RoomRequest):
+    try:
+        config = RoomConfig.from_dict({"room_id": room_id, **request.dict()})
+        await asyncio.get_running_loop().run_in_executor(None, room_registry.add_room, config)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"room_id": room_id}
+
+@app.delete("/rooms/{room_id}")
+async def delete_room(room_id: str):
+    if room_registry.get(room_id) is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    await asyncio.get_running_loop().run_in_executor(None, room_registry.remove_room, room_id)
+    latest_values.remove_room(room_id)
+    trend_store.remove_room(room_id)
+    medical_device_ws.remove_room(room_id)
+    if sdc_consumer_service.deadband:
+        sdc_consumer_service.deadband.remove_room(room_id)
+    if sdc_consumer_service.recorder:
+        sdc_consumer_service.recorder.close_room(room_id)
+    return {"room_id": room_id}
+
+@app.get("/rooms/{room_id}/latest")
+async def room_latest(room_id: str, request: Request):
+    if room_registry.get(room_id) is None and not latest_values.has_room(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    headers = {"Cache-Control": "no-cache"}
+    etag = latest_values.etag(room_id)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    etag, devices = latest_values.room_snapshot(room_id)
+    return JSONResponse({"room_id": room_id, "devices": devices}, headers={**headers, "ETag": etag})
+
+@app.get("/rooms/{room_id}/trends")
+async def room_trends(room_id: str, handles: str = "", devices: str = "", minutes: float = 30.0,
+                      points: int = TREND_DEFAULT_POINTS, method: str = METHOD_LTTB):
+    if room_registry.get(room_id) is None and not trend_store.has_room(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    handle_set = {h.strip() for h in handles.split(",") if h.strip()}
+    device_set = {d.strip() for d in devices.split(",") if d.strip()}
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, trend_store.query, room_id, device_set, handle_set, minutes, points, method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+@app.get("/rooms/{room_id}/replay")
+async def room_replay_range(room_id: str):
+    if not replay_indexer:
+        raise HTTPException(status_code=404, detail="Replay index disabled")
+    available = replay_indexer.room_range(room_id)
+    if available is None:
+        raise HTTPException(status_code=404, detail="No recorded data for room")
+    return {"room_id": room_id, **available}
+
+def _recorder():
+    if not sdc_consumer_service.recorder:
+        raise HTTPException(status_code=404, detail="Recorder disabled")
+    return sdc_consumer_service.recorder
+
+@app.get("/recordings")
+async def recordings(room: Optional[str] = None):
+    recorder = _recorder()
+    return {"sessions": recorder.sessions(room), "stats": recorder.get_stats()}
+
+@app.get("/recordings/{room_id}/{session_id}")
+async def recording_read(room_id: str, session_id: str, handles: str = "", devices: str = "",
+                         start: str = "", end: str = ""):
+    recorder = _recorder()
+    handle_set = {h.strip() for h in handles.split(",") if h.strip()}
+    device_set = {d.strip() for d in devices.split(",") if d.strip()}
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, recorder.read, room_id, session_id, device_set, handle_set, parse_time(start), parse_time(end))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/recordings/{room_id}/{session_id}/export")
+async def recording_export(room_id: str, session_id: str, format: str = FORMAT_PARQUET, handles: str = "",
+                           devices: str = "", start: str = "", end: str = ""):
+    recorder = _recorder()
+    handle_set = {h.strip() for h in handles.split(",") if h.strip()}
+    device_set = {d.strip() for d in devices.split(",") if d.strip()}
+    try:
+        data = await asyncio.get_running_loop().run_in_executor(
+            None, recorder.export, room_id, session_id, format, device_set, handle_set,
+            parse_time(start), parse_time(end))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    filename = f"{session_id}.{format}"
+    return Response(data, media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/kafka/stats")
+async def kafka_stats():
+    return sdc_consumer_service.kafka.get_stats()
+
+@app.get("/influx/stats")
+async def influx_stats():
+    if not sdc_consumer_service.influx:
+        return {"enabled": False}
+    return {"enabled": True, **sdc_consumer_service.influx.get_stats()}
+
+@app.get("/ecg/stats")
+async def ecg_stats():
+    if not sdc_consumer_service.ecg:
+        return {"enabled": False}
+    return sdc_consumer_service.ecg.get_stats()
+
+@app.get("/descriptors")
+async def descriptors(device: Optional[str] = None):
+    # slovar kompaktnih id-jev (device_cid, handle_id, code, unit_code) za bralce Kafka zapisov
+    devices = descriptor_index.describe(device)
+    if device is not None and not devices[device]["metrics"]:
+        raise HTTPException(status_code=404, detail="Device not indexed")
+    return {"devices": devices, "stats": descriptor_index.get_stats()}
+
+@app.get("/filter/stats")
+async def filter_stats():
+    if not sdc_consumer_service.deadband:
+        return {"enabled": False}
+    return sdc_consumer_service.deadband.get_stats()
+
+@app.get("/replay/stats")
+async def replay_stats():
+    if not replay_indexer:
+        return {"enabled": REPLAY, "indexed": False}
+    return replay_indexer.get_stats()
+
+@app.get("/trends/stats")
+async def trend_stats():
+    return trend_store.get_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(latency_tracker.render_prometheus(), media_type="text/plain; version=0.0.4")
 
-@app.websocket("/ws/medical-device/{ROOM_UUID}")
-async def websocket_endpoint(websocket: WebSocket):
-    await medical_device_ws.connect(websocket)
+@app.get("/latency")
+async def latency_stats():
+    return {"enabled": latency_tracker.enabled, "histograms": latency_tracker.snapshot()}
+
+@app.get("/ws/stats")
+async def websocket_stats():
+    return {"connections": medical_device_ws.get_stats(), "handoff": _ws_handoff.get_stats()}
+
+async def _serve_websocket(websocket: WebSocket, room_id: Optional[str], format: str,
+                           devices: str, handles: str, waveform_rate: float, waveform_px: float):
+    await medical_device_ws.connect(websocket, room_id, format, devices, handles, waveform_rate, waveform_px)
     try:
         while True:
-            await websocket.receive_text()
+            medical_device_ws.handle_control(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         medical_device_ws.disconnect(websocket)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         medical_device_ws.disconnect(websocket)
 
+@app.websocket("/ws/medical-device/{room_uuid}")
+async def websocket_endpoint(websocket: WebSocket, room_uuid: str, format: str = "json",
+                             devices: str = "", handles: str = "",
+                             waveform_rate: float = 0.0, waveform_px: float = 0.0):
+    await _serve_websocket(websocket, room_uuid, format, devices, handles, waveform_rate, waveform_px)
+
+@app.websocket("/ws/medical-device")
+async def websocket_all_rooms_endpoint(websocket: WebSocket, format: str = "json",
+                                       devices: str = "", handles: str = "",
+                                       waveform_rate: float = 0.0, waveform_px: float = 0.0):
+    await _serve_websocket(websocket, None, format, devices, handles, waveform_rate, waveform_px)
+
+@app.websocket("/ws/replay/{room_id}")
+async def websocket_replay_endpoint(websocket: WebSocket, room_id: str, start: str, end: str = "",
+                                    speed: float = 1.0):
+    # predvajanje iz Kafke; kontrolna sporocila: seek/speed/pause/resume
+    await websocket.accept()
+    if not REPLAY:
+        await websocket.close(code=1008, reason="Replay disabled")
+        return
+    try:
+        session = ReplaySession(websocket, room_id, parse_time(start), parse_time(end), speed, replay_indexer)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    task = asyncio.create_task(session.run())
+    receiver = asyncio.create_task(websocket.receive_json())
+    try:
+        while True:
+            done, _ = await asyncio.wait({task, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                task.result()
+                await websocket.close()
+                break
+            try:
+                session.control(receiver.result())
+            except (ValueError, TypeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+            receiver = asyncio.create_task(websocket.receive_json())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Replay WebSocket error: {e}")
+    finally:
+        receiver.cancel()
+        # brez task.cancel(): branje iz Kafke v niti mora koncati, preden se consumer zapre
+        session.stop()
+        try:
+            await asyncio.wait_for(task, timeout=5.0)
+        except Exception:
+            pass
+    logger.info(f"⏹️ Replay for room {room_id} ended after {session.frames_sent} frames")
@@ -0,0 +1,86 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+#Zdruzevanje porocil vec naprav v en paket na sobo (micro-batching)
+class ReportBatcher:
+    def __init__(self, window_s: float, on_flush: Callable[[Optional[str], List[Dict[str, Any]]], None]):
+        self.window_s = window_s
+        self._on_flush = on_flush
+        self._pending: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        self._deadlines: Dict[Optional[str], float] = {}
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0
+
+    def start(self):
+        if not self.enabled or self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ReportBatcher")
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self._flush_all()
+
+    def add(self, room_id: Optional[str], envelope: Dict[str, Any]):
+        if not self._running:
+            self._emit(room_id, [envelope])
+            return
+
+        with self._cond:
+            batch = self._pending.get(room_id)
+            if batch is None:
+                self._pending[room_id] = [envelope]
+                self._deadlines[room_id] = time.monotonic() + self.window_s
+                self._cond.notify()
+            else:
+                batch.append(envelope)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                due = [room for room, deadline in self._deadlines.items() if deadline <= now]
+                if not due:
+                    timeout = min(self._deadlines.values()) - now if self._deadlines else None
+                    self._cond.wait(timeout)
+                    continue
+                ready = []
+                for room in due:
+                    del self._deadlines[room]
+                    ready.append((room, self._pending.pop(room)))
+
+            for room, batch in ready:
+                self._emit(room, batch)
+
+    def _flush_all(self):
+        with self._cond:
+            ready = list(self._pending.items())
+            self._pending.clear()
+            self._deadlines.clear()
+        for room, batch in ready:
+            self._emit(room, batch)
+
+    def _emit(self, room_id: Optional[str], batch: List[Dict[str, Any]]):
+        try:
+            self._on_flush(room_id, batch)
+        except Exception as e:
+            logger.error(f"❌ Error flushing batch for room {room_id}: {e}")
@@ -1,9 +1,11 @@
 import os
 import time
 import logging
-import json
 import threading
 import gc
+import functools
+import random
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
 from typing import Dict, Set, Optional, Callable
 from sdc11073 import network, observableproperties
@@ -11,49 +13,71 @@ from sdc11073.consumer import SdcConsumer
 from sdc11073.mdib import ConsumerMdib
 from sdc11073.wsdiscovery import WSDiscovery
 from sdc11073.definitions_sdc import SdcV1Definitions
-from sdc11073.loghelper import basic_logging_setup
+
+from app.services.rooms import RoomConfig, room_registry, load_room_configs
+from app.services.log_setup import setup_logging
+from app.services.descriptor_index import descriptor_index
  
  
-ROOM_UUID = os.getenv("ROOM_UUID")
- 
-device_list = os.getenv("DEVICE_UUIDS", "[]")
-try:
-    raw = json.loads(device_list)
-    if not isinstance(raw, list):
-        raise ValueError("must be a JSON list")
-    TARGET_EPRS = {
-        u if u.startswith("urn:uuid:") else f"urn:uuid:{u}"
-        for u in raw
-    }
-except ValueError as e:
-    raise RuntimeError(f"Invalid DEVICE_UUIDS: {device_list!r} — {e}")
- 
 USE_DISCOVERY = os.getenv("SDC_USE_DISCOVERY", "true").lower() == "true"
-TARGETS = [t for t in os.getenv("SDC_TARGETS", "").split(",") if t]
  
 # Optimizacija za real-time
 CONNECTION_TIMEOUT = float(os.getenv("SDC_CONNECTION_TIMEOUT", "5.0")) 
 HEALTH_CHECK_INTERVAL = float(os.getenv("SDC_HEALTH_CHECK_INTERVAL", "60.0"))  
-MAX_RETRY_ATTEMPTS = int(os.getenv("SDC_MAX_RETRY_ATTEMPTS", "3"))
+# ponovno povezovanje: eksponentni zamik z nakljucnim raztrosom, brez trajne blokade naprave
+RECONNECT_BACKOFF_BASE = float(os.getenv("SDC_RECONNECT_BACKOFF_BASE", "1.0"))
+RECONNECT_BACKOFF_MAX = float(os.getenv("SDC_RECONNECT_BACKOFF_MAX", "30.0"))
+# tisina: ce ni obvestil dlje od max(MIN, FACTOR * povprecni interval), napravo preverimo (GetMdState);
+# epizodna porocila pridejo samo ob spremembi, zato je stabilna naprava lahko dolgo tiha in
+# tisina sama ni razlog za prekinitev. Odstranimo jo sele, ko preverjanje ne uspe.
+SILENCE_MIN = float(os.getenv("SDC_SILENCE_MIN", "60.0"))
+SILENCE_FACTOR = float(os.getenv("SDC_SILENCE_FACTOR", "5.0"))
+MONITOR_INTERVAL = float(os.getenv("SDC_MONITOR_INTERVAL", "1.0"))
+PROBE_MIN_INTERVAL = float(os.getenv("SDC_PROBE_MIN_INTERVAL", "2.0"))
 MEMORY_CLEANUP_INTERVAL = float(os.getenv("SDC_MEMORY_CLEANUP_INTERVAL", "120.0"))  
 DISCOVERY_INTERVAL = float(os.getenv("SDC_DISCOVERY_INTERVAL", "30.0")) 
+# vzporedno vzpostavljanje povezav; nakljucni zamik razprsi povezave po ponovnem zagonu
+CONNECT_WORKERS = int(os.getenv("SDC_CONNECT_WORKERS", "8"))
+CONNECT_JITTER = float(os.getenv("SDC_CONNECT_JITTER", "1.0"))
  
 on_metric_update = None
 on_waveform_update = None
+# (room_id, epr) ob odstranitvi povezave; stanje po napravi drugje (piramide, filtri) se pocisti
+on_device_removed = None
+# (room_id, epr, handles) ob spremembi ali izbrisu deskriptorjev
+on_descriptors_changed = None
  
-_connection_manager = None
+_connection_managers: Dict[str, "ConnectionManager"] = {}
+_managers_lock = threading.Lock()
 _logger = None
 _discovery_thread = None
 _shutdown_event = threading.Event()
+_wake_event = threading.Event()
+_known_services: Dict[str, object] = {}
+_known_services_lock = threading.Lock()
+_connect_pool: Optional[ThreadPoolExecutor] = None
+_connects_in_flight: Set[str] = set()
+_in_flight_lock = threading.Lock()
  
 #Razred za povezavo z ciscenjem in nadzorom
 class ConnectionManager:    
-    def __init__(self, logger):
+    def __init__(self, room: RoomConfig, logger):
+        self.room = room
+        self.room_id = room.room_id
         self.logger = logger
         self.consumers: Dict[str, SdcConsumer] = {}
         self.mdibs: Dict[str, ConsumerMdib] = {}
         self.bindings: Dict[str, bool] = {} 
+        self.callbacks: Dict[str, tuple] = {}
         self.retry_counts: Dict[str, int] = {}
+        self.connect_timings: Dict[str, dict] = {}
+        self.next_attempt: Dict[str, float] = {}
+        self.last_seen: Dict[str, float] = {}
+        self.mean_interval: Dict[str, float] = {}
+        self._probing: Set[str] = set()
+        self.watchers: Dict[str, tuple] = {}
+        self._lost: Dict[str, tuple] = {}
+        self._lost_lock = threading.Lock()
         self.last_health_check = time.time()
         self.last_memory_cleanup = time.time()
         self.connection_lock = threading.Lock()
@@ -103,8 +127,10 @@ class ConnectionManager:
                         if hasattr(mdib, '_observers'):
                             mdib._observers.clear()
                 except Exception as e:
-                    self.logger.warning(f"[room={ROOM_UUID}] Failed to unbind observables for {epr}: {e}")
+                    self.logger.warning(f"[room={self.room_id}] Failed to unbind observables for {epr}: {e}")
                 del self.bindings[epr]
+            self.callbacks.pop(epr, None)
+            descriptor_index.remove_device(epr)
             
             if epr in self.consumers:
                 try:
@@ -112,7 +138,7 @@ class ConnectionManager:
                     if hasattr(client, 'stop_all'):
                         client.stop_all()
                 except Exception as e:
-                    self.logger.warning(f"[room={ROOM_UUID}] Failed to stop consumer {epr}: {e}")
+                    self.logger.warning(f"[room={self.room_id}] Failed to stop consumer {epr}: {e}")
                 del self.consumers[epr]
             
             if epr in self.mdibs:
@@ -121,14 +147,122 @@ class ConnectionManager:
                     if hasattr(mdib, 'close'):
                         mdib.close()
                 except Exception as e:
-                    self.logger.warning(f"[room={ROOM_UUID}] Failed to close MDIB {epr}: {e}")
+                    self.logger.warning(f"[room={self.room_id}] Failed to close MDIB {epr}: {e}")
                 del self.mdibs[epr]
             
             if epr in self.retry_counts:
                 del self.retry_counts[epr]
+            self.watchers.pop(epr, None)
+            self.last_seen.pop(epr, None)
+            self.mean_interval.pop(epr, None)
+        
+        self.logger.info(f"[room={self.room_id}] Connection to {epr} removed ({reason})")
+        if callable(on_device_removed):
+            try:
+                on_device_removed(self.room_id, epr)
+            except Exception as e:
+                self.logger.warning(f"[room={self.room_id}] Device removal callback failed for {epr}: {e}")
+        request_discovery()
+    
+    def mark_lost(self, epr: str, reason: str, client: Optional[SdcConsumer] = None):
+        # klicano iz niti sdc11073, zato samo zabelezimo; odstrani discovery_worker
+        with self._lost_lock:
+            self._lost.setdefault(epr, (reason, client))
+        request_discovery()
+    
+    def note_activity(self, epr: str, *_):
+        now = time.time()
+        previous = self.last_seen.get(epr)
+        self.last_seen[epr] = now
+        if previous is not None:
+            interval = now - previous
+            mean = self.mean_interval.get(epr)
+            self.mean_interval[epr] = interval if mean is None else 0.9 * mean + 0.1 * interval
+    
+    def _watch_connection(self, epr: str, client: SdcConsumer):
+        def on_connected_changed(is_connected: bool):
+            if not is_connected:
+                self.mark_lost(epr, "subscription lost", client)
+        
+        def on_subscription_end(_):
+            self.mark_lost(epr, "subscription ended by device", client)
+        
+        activity = functools.partial(self.note_activity, epr)
+        self.watchers[epr] = (on_connected_changed, on_subscription_end, activity)
+        for name, callback in (("is_connected", on_connected_changed),
+                               ("subscription_end_data", on_subscription_end),
+                               ("episodic_metric_report", activity),
+                               ("waveform_report", activity)):
+            try:
+                observableproperties.bind(client, **{name: callback})
+            except Exception as e:
+                self.logger.debug(f"[room={self.room_id}] Cannot observe {name} for {epr}: {e}")
+    
+    def is_silent(self, epr: str, now: float) -> bool:
+        last = self.last_seen.get(epr)
+        if last is None:
+            return False
+        threshold = max(SILENCE_MIN, SILENCE_FACTOR * self.mean_interval.get(epr, 0.0))
+        return now - last > threshold
+    
+    def probe(self, epr: str, silence: float):
+        # tece v bazenu povezav: majhna zahteva GetMdState pove, ali je naprava se dosegljiva
+        client = self.consumers.get(epr)
+        try:
+            if client is None:
+                return
+            if getattr(client, 'is_connected', True) is False:
+                raise ConnectionError("consumer reports disconnected")
+            client.get_service_client.get_md_state()
+            # naprava odgovarja, le vrednosti se ne spreminjajo
+            self.last_seen[epr] = time.time()
+            self.logger.debug(f"[room={self.room_id}] {epr} silent for {silence:.1f}s but answered GetMdState")
+        except Exception as e:
+            self.mark_lost(epr, f"no notifications for {silence:.1f}s and probe failed: {e}", client)
+        finally:
+            with self._lost_lock:
+                self._probing.discard(epr)
+    
+    def process_connection_events(self):
+        with self._lost_lock:
+            lost, self._lost = self._lost, {}
+        now = time.time()
+        for epr in self.get_connected_eprs():
+            if epr not in lost and self.is_silent(epr, now):
+                with self._lost_lock:
+                    if epr in self._probing:
+                        continue
+                    self._probing.add(epr)
+                try:
+                    _connect_pool.submit(self.probe, epr, now - self.last_seen.get(epr, now))
+                except Exception:
+                    with self._lost_lock:
+                        self._probing.discard(epr)
+        for epr, (reason, client) in lost.items():
+            current = self.consumers.get(epr)
+            # dogodek se lahko nanasa na ze zamenjano povezavo
+            if current is not None and (client is None or client is current):
+                self.remove_connection(epr, reason=reason)
+                self.reset_backoff(epr)
+                self.all_targets_connected = False
+    
+    def connect_due(self, epr: str, now: float) -> bool:
+        return now >= self.next_attempt.get(epr, 0.0)
+    
+    def reset_backoff(self, epr: str):
+        self.retry_counts.pop(epr, None)
+        self.next_attempt.pop(epr, None)
+    
+    def _record_failure(self, epr: str):
+        attempts = self.retry_counts.get(epr, 0) + 1
+        self.retry_counts[epr] = attempts
+        delay = min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_BASE * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        self.next_attempt[epr] = time.time() + delay
+        self.logger.info(f"[room={self.room_id}] Next connect attempt for {epr} in {delay:.1f}s (attempt {attempts})")
     
     def rebind_all_observables(self):
-        self.logger.info(f"[room={ROOM_UUID}] Rebinding observables for all connections...")
+        self.logger.info(f"[room={self.room_id}] Rebinding observables for all connections...")
         
         with self.connection_lock:
             for epr in list(self.mdibs.keys()):
@@ -138,7 +272,7 @@ class ConnectionManager:
         try:
             mdib = self.mdibs.get(epr)
             if not mdib:
-                self.logger.warning(f"[room={ROOM_UUID}] No MDIB found for {epr}")
+                self.logger.warning(f"[room={self.room_id}] No MDIB found for {epr}")
                 return False
             
             if epr in self.bindings:
@@ -148,28 +282,44 @@ class ConnectionManager:
                     elif hasattr(mdib, '_observers'):
                         mdib._observers.clear()
                 except Exception as e:
-                    self.logger.debug(f"[room={ROOM_UUID}] Failed to unbind existing observables for {epr}: {e}")
+                    self.logger.debug(f"[room={self.room_id}] Failed to unbind existing observables for {epr}: {e}")
                 del self.bindings[epr]
             
+            # indeks deskriptorjev (enota, koda, tip naprave) za pot zajema
+            try:
+                descriptor_index.build_from_mdib(epr, mdib)
+            except Exception as e:
+                self.logger.warning(f"[room={self.room_id}] Failed to index descriptors for {epr}: {e}")
+            
             if not on_metric_update and not on_waveform_update:
-                self.logger.debug(f"[room={ROOM_UUID}] No callbacks available for {epr}")
+                self.logger.debug(f"[room={self.room_id}] No callbacks available for {epr}")
                 return False
             
             try:
-                metric_callback = on_metric_update if callable(on_metric_update) else None
-                waveform_callback = on_waveform_update if callable(on_waveform_update) else None
+                # callbacki dobijo EPR naprave; reference hranimo, da jih GC ne pobere
+                metric_callback = functools.partial(on_metric_update, epr=epr, room_id=self.room_id) if callable(on_metric_update) else None
+                waveform_callback = functools.partial(on_waveform_update, epr=epr, room_id=self.room_id) if callable(on_waveform_update) else None
+                described = functools.partial(self._on_descriptors_changed, epr, mdib)
+                deleted = functools.partial(self._on_descriptors_deleted, epr, mdib)
+                self.callbacks[epr] = (metric_callback, waveform_callback, described, deleted)
                 
                 observableproperties.bind(
                     mdib,
                     metrics_by_handle=metric_callback,
                     waveform_by_handle=waveform_callback
                 )
+                observableproperties.bind(
+                    mdib,
+                    new_descriptors_by_handle=described,
+                    updated_descriptors_by_handle=described,
+                    deleted_descriptors_by_handle=deleted
+                )
                 
                 self.bindings[epr] = True
                 return True
                 
             except Exception as bind_error:
-                self.logger.error(f"[room={ROOM_UUID}] ❌ Failed to bind observables for {epr}: {bind_error}")
+                self.logger.error(f"[room={self.room_id}] ❌ Failed to bind observables for {epr}: {bind_error}")
                 
                 try:
                     if hasattr(mdib, 'add_observer') and metric_callback:
@@ -178,21 +328,35 @@ class ConnectionManager:
                         return True
                     
                 except Exception as alt_error:
-                    self.logger.error(f"[room={ROOM_UUID}] ❌ Alternative binding also failed for {epr}: {alt_error}")
+                    self.logger.error(f"[room={self.room_id}] ❌ Alternative binding also failed for {epr}: {alt_error}")
                 
                 return False
                 
         except Exception as e:
-            self.logger.error(f"[room={ROOM_UUID}] ❌ Failed to bind observables for {epr}: {e}")
+            self.logger.error(f"[room={self.room_id}] ❌ Failed to bind observables for {epr}: {e}")
             return False
     
+    def _on_descriptors_changed(self, epr: str, mdib, descriptors: dict):
+        try:
+            descriptor_index.refresh(epr, mdib, changed=descriptors)
+            if callable(on_descriptors_changed):
+                on_descriptors_changed(self.room_id, epr, list(descriptors))
+        except Exception as e:
+            self.logger.warning(f"[room={self.room_id}] Failed to refresh descriptor index for {epr}: {e}")
+    
+    def _on_descriptors_deleted(self, epr: str, mdib, descriptors: dict):
+        try:
+            descriptor_index.refresh(epr, mdib, deleted=list(descriptors))
+            if callable(on_descriptors_changed):
+                on_descriptors_changed(self.room_id, epr, list(descriptors))
+        except Exception as e:
+            self.logger.warning(f"[room={self.room_id}] Failed to refresh descriptor index for {epr}: {e}")
+    
     def add_connection(self, svc) -> bool:
         epr = svc.epr
         
-        if self.retry_counts.get(epr, 0) >= MAX_RETRY_ATTEMPTS:
-            self.logger.warning(f"[room={ROOM_UUID}] Max retry attempts reached for {epr}, skipping")
-            return False
-        
+        timing = {"started_at": time.time(), "ok": False}
+        self.connect_timings[epr] = timing
         try:
             start_time = time.time()
             client = SdcConsumer.from_wsd_service(
@@ -203,34 +367,45 @@ class ConnectionManager:
                 client.set_timeout(CONNECTION_TIMEOUT)
             
             client.start_all()
+            timing["start_all_s"] = round(time.time() - start_time, 3)
             
             if time.time() - start_time > CONNECTION_TIMEOUT:
-                self.logger.warning(f"[room={ROOM_UUID}] Connection to {epr} took too long, stopping")
+                self.logger.warning(f"[room={self.room_id}] Connection to {epr} took too long, stopping")
                 client.stop_all()
+                self._record_failure(epr)
                 return False
             
+            mdib_start = time.time()
             mdib = ConsumerMdib(client)
             mdib.init_mdib()
+            timing["init_mdib_s"] = round(time.time() - mdib_start, 3)
             
             with self.connection_lock:
+                if epr not in self.room.target_eprs:
+                    # naprava je bila med povezovanjem odstranjena iz sobe
+                    client.stop_all()
+                    return False
                 self.consumers[epr] = client
                 self.mdibs[epr] = mdib
                 
                 binding_success = self._bind_observables_for_epr(epr)
+                self._watch_connection(epr, client)
+                self.reset_backoff(epr)
                 
-                if epr in self.retry_counts:
-                    del self.retry_counts[epr]
-                
-                if len(self.consumers) == len(TARGET_EPRS):
+                if len(self.consumers) == len(self.room.target_eprs):
                     self.all_targets_connected = True
             
-            self.logger.info(f"✅ Successfully connected to {epr} (binding: {'✅' if binding_success else '❌'})")
+            timing["ok"] = True
+            timing["total_s"] = round(time.time() - start_time, 3)
+            self.logger.info(f"[room={self.room_id}] ✅ Successfully connected to {epr} in {timing['total_s']}s (binding: {'✅' if binding_success else '❌'})")
             return True
             
         except Exception as e:
-            self.logger.error(f"❌ Failed to connect to {epr}: {e}")
+            timing["total_s"] = round(time.time() - start_time, 3)
+            timing["error"] = str(e)
+            self.logger.error(f"[room={self.room_id}] ❌ Failed to connect to {epr}: {e}")
             
-            self.retry_counts[epr] = self.retry_counts.get(epr, 0) + 1
+            self._record_failure(epr)
             
             try:
                 if 'client' in locals():
@@ -241,149 +416,277 @@ class ConnectionManager:
             return False
     
     def periodic_maintenance(self):
+        self.process_connection_events()
         current_time = time.time()
         
         if current_time - self.last_health_check >= HEALTH_CHECK_INTERVAL:
-            self.logger.debug(f"[room={ROOM_UUID}] Performing health check...")
+            self.logger.debug(f"[room={self.room_id}] Performing health check...")
             self.cleanup_dead_connections()
             self.last_health_check = current_time
         
         if current_time - self.last_memory_cleanup >= MEMORY_CLEANUP_INTERVAL:
-            self.logger.debug(f"[room={ROOM_UUID}] Performing memory cleanup...")
+            self.logger.debug(f"[room={self.room_id}] Performing memory cleanup...")
             gc.collect()  
             self.last_memory_cleanup = current_time
     
     def get_connected_eprs(self) -> Set[str]:
         with self.connection_lock:
             return set(self.consumers.keys())
+
+    def get_missing_eprs(self) -> Set[str]:
+        return set(self.room.target_eprs) - self.get_connected_eprs()
+    
+    def get_connect_timings(self) -> Dict[str, dict]:
+        return {epr: dict(timing) for epr, timing in list(self.connect_timings.items())}
     
     def get_binding_status(self) -> Dict[str, bool]:
         with self.connection_lock:
             return dict(self.bindings)
     
     def shutdown_all(self):
-        with self.connection_lock:
-            for epr in list(self.consumers.keys()):
-                self.remove_connection(epr, reason="shutdown")
+        for epr in self.get_connected_eprs():
+            self.remove_connection(epr, reason="shutdown")
  
  
+def _on_room_changed(room_id: str, config: Optional[RoomConfig]):
+    with _managers_lock:
+        manager = _connection_managers.get(room_id)
+        if config is None:
+            _connection_managers.pop(room_id, None)
+        elif manager is None:
+            _connection_managers[room_id] = ConnectionManager(config, _logger or logging.getLogger('sdc'))
+            return
+        else:
+            manager.room = config
+            manager.all_targets_connected = False
+
+    if manager is None:
+        return
+    if config is None:
+        manager.shutdown_all()
+    else:
+        for epr in manager.get_connected_eprs() - set(config.target_eprs):
+            manager.remove_connection(epr, reason="removed from room")
+    request_discovery()
+
+
+room_registry.add_listener(_on_room_changed)
+
+
+def get_connection_managers() -> Dict[str, ConnectionManager]:
+    with _managers_lock:
+        return dict(_connection_managers)
+ 
+ 
+def request_discovery():
+    _wake_event.set()
+
+
+def _on_hello(addr_from: str, service):
+    room_id = room_registry.room_for_epr(service.epr)
+    if room_id is None:
+        return
+    manager = get_connection_managers().get(room_id)
+    if manager is None:
+        return
+    if service.x_addrs:
+        with _known_services_lock:
+            _known_services[service.epr] = service
+    # naprava se je (ponovno) javila: takoj poskusimo znova
+    manager.reset_backoff(service.epr)
+    request_discovery()
+
+
+def _on_bye(addr_from: str, epr: str):
+    with _known_services_lock:
+        _known_services.pop(epr, None)
+    room_id = room_registry.room_for_epr(epr)
+    manager = get_connection_managers().get(room_id) if room_id else None
+    if manager is not None:
+        manager.mark_lost(epr, "WS-Discovery Bye")
+
+
 def rebind_callbacks():
-    global _connection_manager, _logger
-    if _connection_manager:
-        _connection_manager.rebind_all_observables()
+    for manager in get_connection_managers().values():
+        manager.rebind_all_observables()
+
+
+def _connect_static_targets(manager: ConnectionManager, missing_eprs: Set[str], logger):
+    for epr, target in zip(manager.room.target_eprs, manager.room.targets):
+        if epr not in missing_eprs:
+            continue
+        
+        if _shutdown_event.is_set():
+            break
+        
+        host, port = target.split(":")
+        uuid_part = epr.replace('urn:uuid:', '')
+        svc = SimpleNamespace(
+            epr=epr,
+            x_addrs=[f"http://{host}:{port}/{uuid_part}"],
+            types=[SdcV1Definitions.MedicalDeviceQNames.MedicalDevice]
+        )
+        _schedule_connect(manager, svc, logger)
+
+
+def _schedule_connect(manager: ConnectionManager, svc, logger):
+    # ena povezava na EPR naenkrat; ostale tecejo vzporedno v omejenem bazenu
+    with _in_flight_lock:
+        if svc.epr in _connects_in_flight:
+            return
+        _connects_in_flight.add(svc.epr)
+    try:
+        _connect_pool.submit(_connect_task, manager, svc, random.uniform(0, CONNECT_JITTER), logger)
+    except RuntimeError:
+        with _in_flight_lock:
+            _connects_in_flight.discard(svc.epr)
+
+
+def _connect_task(manager: ConnectionManager, svc, delay: float, logger):
+    try:
+        if _shutdown_event.wait(delay):
+            return
+        if not manager.add_connection(svc):
+            logger.error(f"[room={manager.room_id}] ❌ Failed to connect to {svc.epr}")
+            # naslov je morda zastarel; naslednji poskus gre prek WS-Discovery
+            with _known_services_lock:
+                if _known_services.get(svc.epr) is svc:
+                    del _known_services[svc.epr]
+    except Exception as e:
+        logger.error(f"[room={manager.room_id}] ❌ Error connecting to {svc.epr}: {e}")
+    finally:
+        with _in_flight_lock:
+            _connects_in_flight.discard(svc.epr)
  
  
-def discovery_worker(connection_manager, wsd, logger):
+def discovery_worker(wsd, logger):
     iteration = 0
+    last_probe = 0.0
+    probe_interval = PROBE_MIN_INTERVAL
     
     while not _shutdown_event.is_set():
         try:
             iteration += 1
-            logger.debug(f"[room={ROOM_UUID}] Discovery worker iteration #{iteration}")
+            woken = _wake_event.is_set()
+            _wake_event.clear()
+            if woken:
+                probe_interval = PROBE_MIN_INTERVAL
             
-            if connection_manager.all_targets_connected:
-                connected_eprs = connection_manager.get_connected_eprs()
-                if len(connected_eprs) == len(TARGET_EPRS):
-                    connection_manager.periodic_maintenance()
-                    _shutdown_event.wait(DISCOVERY_INTERVAL)
+            #Manjkajoce povezave po sobah, ki jim je potekel zamik
+            now = time.time()
+            due_by_room: Dict[str, Set[str]] = {}
+            for room_id, manager in get_connection_managers().items():
+                manager.periodic_maintenance()
+                if manager.all_targets_connected and not manager.get_missing_eprs():
                     continue
-                else:
-                    connection_manager.all_targets_connected = False
-            
-            connection_manager.periodic_maintenance()
-            
-            #Trenutno povezani ERP 
-            connected_eprs = connection_manager.get_connected_eprs()
-            
-            #Poglej ce katera povezava manjka in se povezi
-            missing_eprs = TARGET_EPRS - connected_eprs
-            if not missing_eprs:
-                logger.debug(f"[room={ROOM_UUID}] All targets connected, skipping discovery")
-                _shutdown_event.wait(DISCOVERY_INTERVAL)
-                continue
+                manager.all_targets_connected = False
+                with _in_flight_lock:
+                    due = {epr for epr in manager.get_missing_eprs()
+                           if manager.connect_due(epr, now) and epr not in _connects_in_flight}
+                if due:
+                    due_by_room[room_id] = due
             
-            logger.debug(f"[room={ROOM_UUID}] Missing connections: {missing_eprs}")
-            
-            if USE_DISCOVERY:
-                try:
-                    services = wsd.search_services(types=SdcV1Definitions.MedicalDeviceTypesFilter)
-                    discovered_eprs = {s.epr for s in services}
-                    
-                    matching_services = [s for s in services if s.epr in missing_eprs]
-                    
-                    if matching_services:
-                        for svc in matching_services:
-                            if _shutdown_event.is_set():
-                                break
-                            success = connection_manager.add_connection(svc)
-                            if success:
-                                logger.info(f"✅ Successfully connected to {svc.epr}")
-                            else:
-                                logger.error(f"❌ Failed to connect to {svc.epr}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error during WS-Discovery: {e}")
-            else:
-                for epr, target in zip(TARGET_EPRS, TARGETS):
-                    if epr not in missing_eprs:
-                        continue
-                    
-                    if _shutdown_event.is_set():
-                        break
-                    
-                    host, port = target.split(":")
-                    uuid_part = epr.replace('urn:uuid:', '')
-                    svc = SimpleNamespace(
-                        epr=epr,
-                        x_addrs=[f"http://{host}:{port}/{uuid_part}"],
-                        types=[SdcV1Definitions.MedicalDeviceQNames.MedicalDevice]
-                    )
-                    success = connection_manager.add_connection(svc)
-                    if success:
-                        logger.info(f"✅ Successfully connected to {epr}")
-                    else:
-                        logger.error(f"❌ Failed to connect to {epr}")
+            if due_by_room:
+                logger.debug(f"Discovery worker iteration #{iteration}, due connections: {due_by_room}")
+                if USE_DISCOVERY:
+                    unresolved = _connect_known_services(due_by_room, logger)
+                    if unresolved and now - last_probe >= probe_interval:
+                        last_probe = now
+                        # ce naprave ni, iscemo vse redkeje (do DISCOVERY_INTERVAL)
+                        probe_interval = min(DISCOVERY_INTERVAL, probe_interval * 2)
+                        _probe_services(wsd, unresolved, logger)
+                else:
+                    for room_id, due in due_by_room.items():
+                        manager = get_connection_managers().get(room_id)
+                        if manager is not None:
+                            _connect_static_targets(manager, due, logger)
             
-            _shutdown_event.wait(DISCOVERY_INTERVAL)
+            _wake_event.wait(MONITOR_INTERVAL)
             
         except Exception as e:
             logger.error(f"❌ Error in discovery worker: {e}")
             _shutdown_event.wait(5.0) 
  
  
+def _connect_known_services(due_by_room: Dict[str, Set[str]], logger) -> Dict[str, Set[str]]:
+    # naprave z znanim naslovom (Hello ali prejsnje iskanje) povezemo brez novega Probe
+    unresolved: Dict[str, Set[str]] = {}
+    for room_id, due in due_by_room.items():
+        manager = get_connection_managers().get(room_id)
+        if manager is None:
+            continue
+        for epr in due:
+            with _known_services_lock:
+                svc = _known_services.get(epr)
+            if svc is not None:
+                _schedule_connect(manager, svc, logger)
+            else:
+                unresolved.setdefault(room_id, set()).add(epr)
+    return unresolved
+
+
+def _probe_services(wsd, unresolved: Dict[str, Set[str]], logger):
+    try:
+        # en sam WS-Discovery iskalnik za vse sobe
+        services = wsd.search_services(types=SdcV1Definitions.MedicalDeviceTypesFilter)
+    except Exception as e:
+        logger.error(f"❌ Error during WS-Discovery: {e}")
+        return
+    
+    for svc in services:
+        if _shutdown_event.is_set():
+            break
+        room_id = room_registry.room_for_epr(svc.epr)
+        if room_id is None:
+            continue
+        with _known_services_lock:
+            _known_services[svc.epr] = svc
+        if svc.epr not in unresolved.get(room_id, ()):
+            continue
+        manager = get_connection_managers().get(room_id)
+        if manager is not None:
+            _schedule_connect(manager, svc, logger)
+
+
 def run_multi_provider_consumer(discovery_interval: float = None):
-    global _connection_manager, _logger, _discovery_thread
+    global _logger, _discovery_thread, _connect_pool
     
     if discovery_interval is None:
         discovery_interval = DISCOVERY_INTERVAL
     
-    basic_logging_setup()
+    setup_logging("sdc_backend")
     _logger = logging.getLogger('sdc')
- 
-    _logger.info(f"   ROOM_UUID: {ROOM_UUID}")
+
+    if not room_registry.rooms():
+        room_registry.load(load_room_configs())
+    rooms = room_registry.rooms()
+
+    _logger.info(f"   Rooms: {[r.room_id for r in rooms]}")
  
     adapters = list(network.get_adapters())
     adapter = next(a for a in adapters if not a.is_loopback)
  
-    if not TARGET_EPRS:
-        _logger.error("❌ No TARGET_EPRS configured!")
-        return
+    if not rooms or not any(r.target_eprs for r in rooms):
+        _logger.warning("⚠️ No rooms with target devices configured yet, waiting for PUT /rooms/{room_id}")
     
-    if not USE_DISCOVERY and not TARGETS:
-        _logger.error("❌ Static mode enabled but no TARGETS configured!")
-        return
+    if not USE_DISCOVERY:
+        for room in rooms:
+            if len(room.targets) < len(room.target_eprs):
+                _logger.error(f"[room={room.room_id}] ❌ Static mode enabled but not all TARGETS configured!")
  
-    _connection_manager = ConnectionManager(_logger)
     wsd = None
+    _connect_pool = ThreadPoolExecutor(max_workers=CONNECT_WORKERS, thread_name_prefix="SDC-Connect")
  
     try:
         if USE_DISCOVERY:
             wsd = WSDiscovery(adapter.ip)
             wsd.start()
+            wsd.set_remote_service_hello_callback(_on_hello, types=SdcV1Definitions.MedicalDeviceTypesFilter)
+            wsd.set_remote_service_bye_callback(_on_bye)
  
         _discovery_thread = threading.Thread(
             target=discovery_worker,
-            args=(_connection_manager, wsd, _logger),
+            args=(wsd, _logger),
             daemon=True,
             name="DiscoveryWorker"
         )
@@ -393,24 +696,27 @@ def run_multi_provider_consumer(discovery_interval: float = None):
             while not _shutdown_event.is_set():
                 _shutdown_event.wait(1.0)  
         except KeyboardInterrupt:
-            _logger.info(f"[room={ROOM_UUID}] Interrupted by user, shutting down...")
+            _logger.info("Interrupted by user, shutting down...")
  
     finally:
         _shutdown_event.set()
+        _wake_event.set()
         
         if _discovery_thread and _discovery_thread.is_alive():
             _discovery_thread.join(timeout=5.0)
+        _connect_pool.shutdown(wait=True, cancel_futures=True)
         
-        _connection_manager.shutdown_all()
+        for manager in get_connection_managers().values():
+            manager.shutdown_all()
         if wsd:
             wsd.stop()
  
 def get_consumers():
-    global _connection_manager
-    if _connection_manager:
-        return _connection_manager.consumers
-    return {}
+    consumers = {}
+    for manager in get_connection_managers().values():
+        consumers.update(manager.consumers)
+    return consumers
  
  
 if __name__ == '__main__':
-    run_multi_provider_consumer()
\ No newline at end of file
+    run_multi_provider_consumer()
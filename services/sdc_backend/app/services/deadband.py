@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Filter nespremenjenih vrednosti pred Kafko in WebSocketom (trendi, posnetki in Influx
+# dobijo vse vrednosti):
+#   SDC_DEADBAND         vklop ("true")
+#   SDC_DEADBAND_STEPS   numericne metrike: najmanjsa sprememba v korakih Resolution deskriptorja (0 = vsaka sprememba)
+#   SDC_DEADBAND_REL     numericne metrike: relativni prag (0.01 = 1 %)
+#   SDC_DEADBAND_RULES   pravila po handlu, "handle=abs" ali "handle=abs:rel" (csv)
+#   SDC_HEARTBEAT_S      nespremenjeno vrednost vseeno posljemo po toliko sekundah (0 = nikoli)
+DEADBAND = os.getenv("SDC_DEADBAND", "true").lower() == "true"
+DEADBAND_STEPS = float(os.getenv("SDC_DEADBAND_STEPS", "0"))
+DEADBAND_REL = float(os.getenv("SDC_DEADBAND_REL", "0"))
+DEADBAND_RULES = os.getenv("SDC_DEADBAND_RULES", "")
+HEARTBEAT_S = float(os.getenv("SDC_HEARTBEAT_S", "10"))
+
+KIND_NUMERIC = "numeric"
+KIND_STRING = "string"
+KIND_OTHER = "other"
+
+
+@dataclass(frozen=True)
+class DeadbandRule:
+    kind: str
+    absolute: float = 0.0
+    relative: float = 0.0
+
+    def unchanged(self, last: Any, value: Any) -> bool:
+        if last is None or value is None or self.kind != KIND_NUMERIC:
+            return last == value
+        if not isinstance(last, (int, float)) or not isinstance(value, (int, float)):
+            return last == value
+        if not self.absolute and not self.relative:
+            return last == value
+        return abs(value - last) <= max(self.absolute, self.relative * abs(last))
+
+
+def parse_rules(spec: str) -> Dict[str, Tuple[float, float]]:
+    # "temperature.ch0.temperature_gauge=0.2,bps.ch0.nibp_module=1:0.02"
+    rules = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        handle, sep, value = item.partition("=")
+        if not sep:
+            raise RuntimeError(f"Invalid SDC_DEADBAND_RULES entry: {item!r}")
+        absolute, _, relative = value.partition(":")
+        rules[handle.strip()] = (float(absolute or 0), float(relative or 0))
+    return rules
+
+
+def rule_for_descriptor(descriptor: Any, steps: float = DEADBAND_STEPS, relative: float = DEADBAND_REL) -> DeadbandRule:
+    # tip deskriptorja doloci pravilo; nizi in enumeracije samo tocno ujemanje
+    name = type(descriptor).__name__ if descriptor is not None else ""
+    if name.startswith(("StringMetric", "EnumStringMetric")):
+        return DeadbandRule(KIND_STRING)
+    if name.startswith("NumericMetric"):
+        resolution = getattr(descriptor, "Resolution", None)
+        absolute = float(resolution) * steps if resolution else 0.0
+        return DeadbandRule(KIND_NUMERIC, absolute, relative)
+    return DeadbandRule(KIND_OTHER)
+
+
+#Stanje po (soba, naprava, handle): zadnja poslana vrednost in cas
+class DeadbandFilter:
+    def __init__(self, rules: str = DEADBAND_RULES, heartbeat_s: float = HEARTBEAT_S):
+        self.heartbeat_s = heartbeat_s
+        self._overrides = parse_rules(rules)
+        self._rules: Dict[Tuple[Optional[str], str], DeadbandRule] = {}
+        self._last: Dict[Tuple[Optional[str], Optional[str], str], Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.passed = 0
+        self.suppressed = 0
+        self.heartbeats = 0
+        self._suppressed_by_kind: Dict[str, int] = {}
+
+    def rule(self, epr: Optional[str], handle: str, descriptor: Any = None) -> DeadbandRule:
+        key = (epr, handle)
+        rule = self._rules.get(key)
+        if rule is None:
+            rule = rule_for_descriptor(descriptor)
+            if handle in self._overrides:
+                absolute, relative = self._overrides[handle]
+                rule = DeadbandRule(KIND_STRING if rule.kind == KIND_STRING else KIND_NUMERIC, absolute, relative)
+            self._rules[key] = rule
+        return rule
+
+    def learn(self, epr: Optional[str], descriptors: Dict[str, Any]):
+        # pravila iz deskriptorjev ob prejemu; filter kasneje dobi samo vrednosti
+        with self._lock:
+            for handle, descriptor in descriptors.items():
+                if descriptor is not None and (epr, handle) not in self._rules:
+                    self.rule(epr, handle, descriptor)
+
+    def filter(self, room_id: Optional[str], epr: Optional[str], values: Dict[str, Any],
+               descriptors: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # vrne samo vrednosti, ki jih je treba poslati naprej
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for handle, value in values.items():
+                rule = self.rule(epr, handle, (descriptors or {}).get(handle))
+                key = (room_id, epr, handle)
+                last = self._last.get(key)
+                if last is not None and rule.unchanged(last[0], value):
+                    if not self.heartbeat_s or now - last[1] < self.heartbeat_s:
+                        self.suppressed += 1
+                        self._suppressed_by_kind[rule.kind] = self._suppressed_by_kind.get(rule.kind, 0) + 1
+                        continue
+                    # heartbeat: odjemalci locijo "nespremenjeno" od "mrtvo"
+                    self.heartbeats += 1
+                self._last[key] = (value, now)
+                out[handle] = value
+            self.seen += len(values)
+            self.passed += len(out)
+        return out
+
+    def remove_device(self, epr: Optional[str], handles: Optional[Iterable[str]] = None):
+        # ob prekinitvi ali spremembi opisa: pravila iz novih deskriptorjev, prva vrednost gre naprej
+        handles = set(handles) if handles is not None else None
+        with self._lock:
+            for key in [k for k in self._rules if k[0] == epr and (handles is None or k[1] in handles)]:
+                del self._rules[key]
+            for key in [k for k in self._last if k[1] == epr and (handles is None or k[2] in handles)]:
+                del self._last[key]
+
+    def remove_room(self, room_id: str):
+        with self._lock:
+            for key in [k for k in self._last if k[0] == room_id]:
+                del self._last[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": True,
+                "heartbeat_s": self.heartbeat_s,
+                "seen": self.seen,
+                "passed": self.passed,
+                "suppressed": self.suppressed,
+                "suppressed_ratio": round(self.suppressed / self.seen, 4) if self.seen else 0.0,
+                "suppressed_by_kind": dict(self._suppressed_by_kind),
+                "heartbeats": self.heartbeats,
+                "tracked": len(self._last),
+            }
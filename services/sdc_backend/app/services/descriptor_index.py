@@ -0,0 +1,190 @@
+import re
+import threading
+import zlib
+from typing import Any, Dict, Iterable, Optional
+
+# Indeks deskriptorjev po napravi: handle -> metapodatki (enota, koda, tip naprave).
+# Zgradi se ob vezavi MDIB (ConnectionManager) in osvezi ob porocilih o spremembi
+# opisa, zato pot zajema ne isce po MDIB za vsako sporocilo.
+#
+# Kompaktni id-ji so stabilni med procesi (brez slovarja v sporocilih):
+#   device_cid crc32(EPR) (device_id ostane handle, kot ga pricakujejo odjemalci)
+#   handle_id  crc32(handle), enako kot record_codec.handle_id
+#   code/unit  MDC koda kot stevilo (npr. 147842), nenumericne kode kot crc32
+
+KIND_NUMERIC = "numeric"
+KIND_STRING = "string"
+KIND_ENUM = "enum"
+KIND_WAVEFORM = "waveform"
+
+_KINDS = (
+    ("EnumStringMetric", KIND_ENUM),
+    ("StringMetric", KIND_STRING),
+    ("NumericMetric", KIND_NUMERIC),
+    ("RealTimeSampleArrayMetric", KIND_WAVEFORM),
+    ("DistributionSampleArrayMetric", KIND_WAVEFORM),
+)
+_DIGITS = re.compile(r"\d+")
+_BIDI = re.compile("[\u200e\u200f\u202a-\u202e]")
+
+
+def stable_id(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def code_id(code: Optional[str]) -> int:
+    # MDC kode so stevilke; nevidni znaki v MDIB (npr. U+202C) ne smejo spremeniti id-ja
+    if not code:
+        return 0
+    match = _DIGITS.fullmatch(_BIDI.sub("", code).strip())
+    if match and int(match.group()) <= 0xFFFFFFFF:
+        return int(match.group())
+    return stable_id(code)
+
+
+def _coded(value: Any) -> Optional[str]:
+    code = getattr(value, "Code", None) if value is not None else None
+    return str(code).strip() if code else None
+
+
+class MetricInfo:
+    __slots__ = ("handle", "handle_id", "device_epr", "device_cid", "device_type", "kind", "code", "code_id",
+                 "unit", "unit_id")
+
+    def __init__(self, handle: str, device_epr: Optional[str], device_type: Optional[str], kind: str,
+                 code: Optional[str], unit: Optional[str]):
+        self.handle = handle
+        self.handle_id = stable_id(handle)
+        self.device_epr = device_epr
+        self.device_cid = stable_id(device_epr) if device_epr else 0
+        self.device_type = device_type
+        self.kind = kind
+        self.code = code
+        self.code_id = code_id(code)
+        self.unit = unit
+        self.unit_id = code_id(unit)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _kind(descriptor: Any) -> Optional[str]:
+    name = type(descriptor).__name__
+    for prefix, kind in _KINDS:
+        if name.startswith(prefix):
+            return kind
+    return None
+
+
+def _device_type(descriptor: Any, by_handle: Dict[str, Any]) -> Optional[str]:
+    # tip naprave je VMD (modul), v katerem je metrika; koda VMD, ce jo ima, sicer handle
+    parent = by_handle.get(getattr(descriptor, "parent_handle", None))
+    while parent is not None:
+        if type(parent).__name__.startswith("Vmd"):
+            return _coded(getattr(parent, "Type", None)) or parent.Handle
+        if type(parent).__name__.startswith("Mds"):
+            return _coded(getattr(parent, "Type", None)) or parent.Handle
+        parent = by_handle.get(getattr(parent, "parent_handle", None))
+    return None
+
+
+def metric_info(descriptor: Any, device_epr: Optional[str], by_handle: Dict[str, Any]) -> Optional[MetricInfo]:
+    kind = _kind(descriptor)
+    if kind is None:
+        return None
+    return MetricInfo(
+        handle=descriptor.Handle,
+        device_epr=device_epr,
+        device_type=_device_type(descriptor, by_handle),
+        kind=kind,
+        code=_coded(getattr(descriptor, "Type", None)),
+        unit=_coded(getattr(descriptor, "Unit", None)),
+    )
+
+
+#Metapodatki vseh povezanih naprav; branje brez zaklepanja (zamenjava celotnega slovarja)
+class DescriptorIndex:
+    def __init__(self):
+        self._devices: Dict[str, Dict[str, MetricInfo]] = {}
+        # handle_id -> handle za branje zapisov v2 (brez nizov); id-ji so stabilni, zato ne brisemo
+        self._handles: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.refreshes = 0
+
+    def build(self, device_epr: str, descriptors: Iterable[Any]):
+        descriptors = list(descriptors)
+        by_handle = {d.Handle: d for d in descriptors}
+        index = {}
+        for descriptor in descriptors:
+            info = metric_info(descriptor, device_epr, by_handle)
+            if info is not None:
+                index[info.handle] = info
+        with self._lock:
+            self._devices[device_epr] = index
+            self._handles.update((info.handle_id, handle) for handle, info in index.items())
+            self.builds += 1
+
+    def build_from_mdib(self, device_epr: str, mdib: Any):
+        self.build(device_epr, mdib.descriptions.objects)
+
+    def refresh(self, device_epr: str, mdib: Any, changed: Optional[Dict[str, Any]] = None,
+                deleted: Iterable[str] = ()):
+        # sprememba opisa: nove/spremenjene deskriptorje ponovno indeksiramo, izbrisane odstranimo
+        by_handle = {d.Handle: d for d in mdib.descriptions.objects}
+        with self._lock:
+            index = dict(self._devices.get(device_epr, {}))
+            for handle in deleted:
+                index.pop(handle, None)
+            for handle, descriptor in (changed or {}).items():
+                info = metric_info(descriptor, device_epr, by_handle)
+                if info is None:
+                    index.pop(handle, None)
+                else:
+                    index[handle] = info
+                    self._handles[info.handle_id] = handle
+            self._devices[device_epr] = index
+            self.refreshes += 1
+
+    def remove_device(self, device_epr: str):
+        with self._lock:
+            self._devices.pop(device_epr, None)
+
+    def get(self, device_epr: Optional[str], handle: str) -> Optional[MetricInfo]:
+        return self._devices.get(device_epr, {}).get(handle)
+
+    def device_cid(self, device_epr: Optional[str]) -> Optional[int]:
+        return stable_id(device_epr) if device_epr else None
+
+    def handle_for(self, handle_id: int) -> Optional[str]:
+        return self._handles.get(handle_id)
+
+    def unit(self, device_epr: Optional[str], handle: str) -> Optional[str]:
+        info = self.get(device_epr, handle)
+        return info.unit if info else None
+
+    def device_type(self, device_epr: Optional[str], handles: Iterable[str]) -> Optional[str]:
+        index = self._devices.get(device_epr, {})
+        for handle in handles:
+            info = index.get(handle)
+            if info is not None and info.device_type:
+                return info.device_type
+        return None
+
+    def describe(self, device_epr: Optional[str] = None) -> Dict[str, Any]:
+        devices = dict(self._devices) if device_epr is None else {device_epr: self._devices.get(device_epr, {})}
+        return {
+            epr: {"device_cid": stable_id(epr), "metrics": [info.as_dict() for info in index.values()]}
+            for epr, index in devices.items()
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "devices": len(self._devices),
+            "metrics": sum(len(index) for index in self._devices.values()),
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+        }
+
+
+descriptor_index = DescriptorIndex()
@@ -0,0 +1,239 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Callable, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from app.services.waveform_codec import decode_quantized
+
+logger = logging.getLogger(__name__)
+
+# Analiza EKG v drsecem oknu (R-vrhovi, frekvenca, kakovost signala):
+#   SDC_ECG_ANALYSIS     vklop ("true")
+#   SDC_ECG_HANDLES      handli valovnih oblik, ki jih analiziramo (csv)
+#   SDC_ECG_WINDOW_S     dolzina okna v sekundah
+#   SDC_ECG_MIN_WINDOW_S najmanj podatkov pred prvo analizo
+#   SDC_ECG_WORKERS      st. procesov v bazenu
+#   SDC_ECG_MIN_SQI      pod to kakovostjo signala HR in RR ne objavimo (samo sqi)
+ECG_ANALYSIS = os.getenv("SDC_ECG_ANALYSIS", "true").lower() == "true"
+ECG_HANDLES = {h.strip() for h in os.getenv("SDC_ECG_HANDLES", "ecgWaveform.ch0.ecg_module").split(",") if h.strip()}
+ECG_WINDOW_S = float(os.getenv("SDC_ECG_WINDOW_S", "10"))
+ECG_MIN_WINDOW_S = float(os.getenv("SDC_ECG_MIN_WINDOW_S", "4"))
+ECG_WORKERS = int(os.getenv("SDC_ECG_WORKERS", "2"))
+ECG_MIN_SQI = float(os.getenv("SDC_ECG_MIN_SQI", "0.6"))
+
+_REFRACTORY_S = 0.25
+_MIN_HR, _MAX_HR = 30.0, 220.0
+
+
+def _moving_average(x: np.ndarray, width: int) -> np.ndarray:
+    width = max(1, width)
+    c = np.cumsum(np.concatenate(([0.0], x)))
+    out = (c[width:] - c[:-width]) / width
+    # poravnava na sredino okna, robove zapolnimo
+    pad = len(x) - len(out)
+    return np.pad(out, (pad // 2, pad - pad // 2), mode="edge")
+
+
+def detect_r_peaks(x: np.ndarray, fs: float) -> np.ndarray:
+    # Pan-Tompkins v poenostavljeni obliki: odstranitev bazne linije, odvod, kvadrat, integracija
+    baseline = x - _moving_average(x, int(0.2 * fs))
+    energy = _moving_average(np.gradient(baseline) ** 2, int(0.15 * fs))
+    mean = energy.mean()
+    threshold = mean + 0.3 * (np.percentile(energy, 99) - mean)
+    above = np.concatenate(([False], energy > threshold, [False]))
+    edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    if not len(starts):
+        return np.empty(0, dtype=np.int64)
+
+    # R-vrh je najvecja amplituda v obmocju nad pragom (razsirjeno za zamik integracije)
+    reach = int(0.1 * fs)
+    magnitude = np.abs(baseline)
+    peaks = np.array([
+        s + int(magnitude[s:e].argmax())
+        for s, e in zip(np.maximum(starts - reach, 0), np.minimum(ends + reach, len(x)))
+    ], dtype=np.int64)
+
+    refractory = int(_REFRACTORY_S * fs)
+    kept = [peaks[0]]
+    for p in peaks[1:]:
+        if p - kept[-1] >= refractory:
+            kept.append(p)
+        elif magnitude[p] > magnitude[kept[-1]]:
+            kept[-1] = p
+    return np.unique(np.array(kept, dtype=np.int64))
+
+
+def signal_quality(x: np.ndarray, rr: np.ndarray) -> float:
+    # kurtoza (cist EKG je koniciast, sum ~3) in pravilnost RR intervalov
+    z = x - x.mean()
+    std = z.std()
+    if std == 0 or len(rr) < 2:
+        return 0.0
+    kurtosis = float(np.mean((z / std) ** 4))
+    k_sqi = min(max((kurtosis - 3.0) / 5.0, 0.0), 1.0)
+    median = np.median(rr)
+    rr_sqi = float(np.mean(np.abs(rr - median) <= 0.15 * median))
+    return round(0.5 * k_sqi + 0.5 * rr_sqi, 3)
+
+
+def analyze_window(samples: np.ndarray, fs: float, min_sqi: float = ECG_MIN_SQI) -> Dict[str, Any]:
+    # tece v procesu bazena; vrne samo stevila
+    peaks = detect_r_peaks(samples, fs)
+    rr = np.diff(peaks) / fs
+    result = {"beats": int(len(peaks)), "hr": None, "hr_last": None, "rr_ms": None, "sqi": 0.0}
+    if len(rr) < 2:
+        return result
+    hr = 60.0 / float(np.median(rr))
+    hr_last = 60.0 / float(rr[-1])
+    plausible = _MIN_HR <= hr <= _MAX_HR
+    result.update(
+        hr=round(hr, 1) if plausible else None,
+        hr_last=round(hr_last, 1) if _MIN_HR <= hr_last <= _MAX_HR else None,
+        rr_ms=round(float(rr[-1]) * 1000.0, 1),
+        sqi=signal_quality(samples, rr) if plausible else 0.0,
+    )
+    if result["sqi"] < min_sqi:
+        # sum ali motnje: izmerjen HR bi bil izmisljen
+        result.update(hr=None, hr_last=None, rr_ms=None)
+    return result
+
+
+def derived_handles(handle: str) -> Dict[str, str]:
+    # ecgWaveform.ch0.ecg_module -> derivedHeartRate.ch0.ecg_module, ...
+    suffix = handle.split(".", 1)[1] if "." in handle else handle
+    return {
+        "hr": f"derivedHeartRate.{suffix}",
+        "hr_last": f"derivedBeatHeartRate.{suffix}",
+        "rr_ms": f"derivedRrInterval.{suffix}",
+        "sqi": f"ecgSignalQuality.{suffix}",
+    }
+
+
+#Drseca okna po toku; analiza v loceni skupini procesov
+class EcgAnalysisStage:
+    def __init__(self, publish: Callable[[Optional[str], Dict[str, Any]], None],
+                 handles=ECG_HANDLES, workers: int = ECG_WORKERS):
+        self._publish = publish
+        self.handles = set(handles)
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._windows: Dict[Tuple, Tuple[np.ndarray, float, float]] = {}
+        self._in_flight: set = set()
+        self._lock = threading.Lock()
+        self.analyses = 0
+        self.skipped = 0
+        self.late = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._pool is not None
+
+    def start(self):
+        if self._pool is None and self.handles and self.workers > 0:
+            # "spawn": ne kopiramo niti in stanja procesa (uvicorn, sdc11073)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def feed(self, encoded: bytes, room_id: Optional[str], epr: Optional[str], handle: str):
+        # klice se v niti obvestil naprave, zato kosi ene naprave pridejo po vrsti
+        if self._pool is None or handle not in self.handles:
+            return
+        _, _, t0, period, scale, ints = decode_quantized(encoded)
+        if period <= 0:
+            return
+        fs = 1.0 / period
+        chunk = np.asarray(ints, dtype=np.float64) * scale
+        key = (room_id, epr, handle)
+
+        with self._lock:
+            window, start, last_period = self._windows.get(key, (None, 0.0, period))
+            if window is not None and last_period == period and t0 < start + (len(window) - 1) * period:
+                # kos, ki je prisel za novejsim (ali podvojen): okna ne zacnemo znova
+                self.late += 1
+                return
+            # ob vrzeli ali spremembi frekvence zacnemo znova
+            if window is None or abs(start + len(window) * period - t0) > 2 * period or last_period != period:
+                window, start = chunk, t0
+            else:
+                window = np.concatenate((window, chunk))
+            limit = int(ECG_WINDOW_S * fs)
+            if len(window) > limit:
+                start += (len(window) - limit) * period
+                window = window[-limit:]
+            self._windows[key] = (window, start, period)
+            # cas zadnjega vzorca v oknu po uri naprave
+            t_end = start + (len(window) - 1) * period
+
+            if len(window) < ECG_MIN_WINDOW_S * fs:
+                return
+            if key in self._in_flight:
+                # prejsnja analiza se tece: to okno preskocimo, nova bo zajela vec podatkov
+                self.skipped += 1
+                return
+            self._in_flight.add(key)
+
+        try:
+            future = self._pool.submit(analyze_window, window, fs, ECG_MIN_SQI)
+        except Exception as e:
+            with self._lock:
+                self._in_flight.discard(key)
+            logger.debug(f"ECG analysis not submitted: {e}")
+            return
+        future.add_done_callback(lambda f: self._on_result(key, t_end, f))
+
+    def _on_result(self, key: Tuple, t_end: float, future: Future):
+        with self._lock:
+            self._in_flight.discard(key)
+        room_id, epr, handle = key
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"❌ ECG analysis failed: {e}", extra={"room_id": room_id, "epr": epr, "handle": handle})
+            return
+        self.analyses += 1
+
+        names = derived_handles(handle)
+        metrics = {names[k]: result[k] for k in ("hr", "hr_last", "rr_ms", "sqi") if result[k] is not None}
+        if not metrics:
+            return
+        # izpeljane vrednosti veljajo za konec analiziranega okna, ne za cas izracuna
+        t_end_ns = int(t_end * 1e9)
+        self._publish(room_id, {
+            "device_epr": epr,
+            "ts": t_end_ns // 1_000_000,
+            "metrics": metrics,
+            "dts": {name: t_end_ns for name in metrics},
+            "derived": True,
+        })
+
+    def remove_device(self, room_id: Optional[str], epr: str):
+        with self._lock:
+            for key in [k for k in self._windows if k[0] == room_id and k[1] == epr]:
+                del self._windows[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            streams = len(self._windows)
+            in_flight = len(self._in_flight)
+        return {
+            "enabled": self.enabled,
+            "handles": sorted(self.handles),
+            "streams": streams,
+            "in_flight": in_flight,
+            "analyses": self.analyses,
+            "skipped": self.skipped,
+            "late": self.late,
+            "failures": self.failures,
+        }
@@ -0,0 +1,223 @@
+import os
+import gzip
+import time
+import random
+import threading
+import logging
+import urllib.request
+import urllib.error
+import urllib.parse
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Neposredno pisanje v InfluxDB (v2 /api/v2/write), brez Telegrafa.
+# Ce INFLUX_URL ni nastavljen, je sink izklopljen.
+INFLUX_URL = os.getenv("INFLUX_URL")
+INFLUX_TOKEN = os.getenv("INFLUX_TOKEN", "")
+INFLUX_ORG = os.getenv("INFLUX_ORG", "")
+INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "vital_signs")
+
+# Sink in Telegraf (Kafka -> kafka_consumer) bi isto meritev zapisala dvakrat, z razlicnimi casi.
+# Zato sink privzeto pise v svojo meritev; predpona polj ostane enaka kot pri Telegrafu, tako da
+# services/backend preklopi z INFLUX_MEASUREMENT=sdc_vitals. Pisanje v kafka_consumer je dovoljeno
+# samo, ce Telegraf ne tece (ob zagonu izpisemo opozorilo).
+TELEGRAF_MEASUREMENT = "kafka_consumer"
+INFLUX_MEASUREMENT = os.getenv("INFLUX_MEASUREMENT", "sdc_vitals")
+INFLUX_FIELD_PREFIX = os.getenv("INFLUX_FIELD_PREFIX", "metrics_")
+
+INFLUX_BATCH_LINES = int(os.getenv("INFLUX_BATCH_LINES", "5000"))
+INFLUX_FLUSH_INTERVAL = float(os.getenv("INFLUX_FLUSH_INTERVAL", "1.0"))
+INFLUX_MAX_BUFFER_LINES = int(os.getenv("INFLUX_MAX_BUFFER_LINES", "200000"))
+INFLUX_MAX_RETRIES = int(os.getenv("INFLUX_MAX_RETRIES", "5"))
+INFLUX_RETRY_BASE = float(os.getenv("INFLUX_RETRY_BASE", "0.5"))
+INFLUX_RETRY_MAX = float(os.getenv("INFLUX_RETRY_MAX", "30"))
+INFLUX_TIMEOUT = float(os.getenv("INFLUX_TIMEOUT", "10"))
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _escape_key(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def _escape_measurement(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(" ", "\\ ")
+
+
+def _format_field(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{float(value)!r}"
+    if isinstance(value, float):
+        if value != value or value in (float("inf"), float("-inf")):
+            return None
+        return repr(value)
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def envelope_to_lines(envelope: Dict[str, Any],
+                      unit_lookup: Optional[Callable[[Optional[str], str], Optional[str]]] = None,
+                      measurement: str = INFLUX_MEASUREMENT,
+                      field_prefix: str = INFLUX_FIELD_PREFIX,
+                      type_lookup: Optional[Callable[[Optional[str], Iterable[str]], Optional[str]]] = None) -> List[str]:
+    # ena vrstica na (enota, cas naprave); vsak handle je svoje (numericno) polje
+    room_id = envelope.get("room_id")
+    device_epr = envelope.get("device_epr")
+    default_ns = int(envelope.get("ts", time.time() * 1000)) * 1_000_000
+    dts = envelope.get("dts") or {}
+
+    base_tags = _escape_measurement(measurement)
+    if device_epr:
+        base_tags += f",device_epr={_escape_key(device_epr)}"
+    if room_id:
+        base_tags += f",room_id={_escape_key(room_id)}"
+    device_type = envelope.get("device_type") or (type_lookup(device_epr, envelope.get("metrics", {})) if type_lookup else None)
+    if device_type:
+        base_tags += f",device_type={_escape_key(device_type)}"
+
+    points: Dict[tuple, List[str]] = {}
+    for handle, value in envelope.get("metrics", {}).items():
+        formatted = _format_field(value)
+        if formatted is None:
+            continue
+        unit = unit_lookup(device_epr, handle) if unit_lookup else None
+        ts_ns = dts.get(handle, default_ns)
+        points.setdefault((unit, ts_ns), []).append(f"{_escape_key(field_prefix + handle)}={formatted}")
+
+    lines = []
+    for (unit, ts_ns), fields in points.items():
+        tags = f"{base_tags},unit={_escape_key(unit)}" if unit else base_tags
+        lines.append(f"{tags} {','.join(fields)} {ts_ns}")
+    return lines
+
+
+class InfluxWriteError(Exception):
+    def __init__(self, message: str, retryable: bool, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+#Paketno pisanje line protocola (gzip) z lastno nitjo in ponovnimi poskusi
+class InfluxLineSink:
+    def __init__(self, url: str, token: str = INFLUX_TOKEN, org: str = INFLUX_ORG, bucket: str = INFLUX_BUCKET,
+                 unit_lookup: Optional[Callable[[Optional[str], str], Optional[str]]] = None,
+                 type_lookup: Optional[Callable[[Optional[str], Iterable[str]], Optional[str]]] = None):
+        query = urllib.parse.urlencode({"org": org, "bucket": bucket, "precision": "ns"})
+        self.write_url = f"{url.rstrip('/')}/api/v2/write?{query}"
+        self.token = token
+        self.unit_lookup = unit_lookup
+        self.type_lookup = type_lookup
+
+        self._lines: deque = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+        self.stats = {
+            "lines_written": 0,
+            "batches_written": 0,
+            "bytes_sent": 0,
+            "retries": 0,
+            "lines_dropped": 0,
+            "last_error": None,
+        }
+
+    def start(self):
+        if self._running:
+            return
+        if INFLUX_MEASUREMENT == TELEGRAF_MEASUREMENT:
+            logger.warning(f"⚠️ InfluxDB sink writes to Telegraf's measurement {TELEGRAF_MEASUREMENT!r}; "
+                           f"disable Telegraf's kafka_consumer input or every point is stored twice")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="InfluxLineSink")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def write(self, batch: List[Dict[str, Any]]):
+        lines = []
+        for envelope in batch:
+            lines.extend(envelope_to_lines(envelope, self.unit_lookup, type_lookup=self.type_lookup))
+        if not lines:
+            return
+        with self._cond:
+            self._lines.extend(lines)
+            overflow = len(self._lines) - INFLUX_MAX_BUFFER_LINES
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._lines.popleft()
+                self.stats["lines_dropped"] += overflow
+            if len(self._lines) >= INFLUX_BATCH_LINES:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._running and len(self._lines) < INFLUX_BATCH_LINES:
+                    self._cond.wait(INFLUX_FLUSH_INTERVAL)
+                if not self._lines:
+                    if not self._running:
+                        return
+                    continue
+                count = min(len(self._lines), INFLUX_BATCH_LINES)
+                batch = [self._lines.popleft() for _ in range(count)]
+            self._write_with_retry(batch)
+
+    def _write_with_retry(self, lines: List[str]):
+        body = gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=5)
+        for attempt in range(INFLUX_MAX_RETRIES + 1):
+            try:
+                self._post(body)
+                self.stats["lines_written"] += len(lines)
+                self.stats["batches_written"] += 1
+                self.stats["bytes_sent"] += len(body)
+                return
+            except InfluxWriteError as e:
+                self.stats["last_error"] = str(e)
+                if not e.retryable or attempt == INFLUX_MAX_RETRIES or not self._running:
+                    logger.error(f"❌ Dropping {len(lines)} lines after InfluxDB write failure: {e}")
+                    self.stats["lines_dropped"] += len(lines)
+                    return
+                delay = e.retry_after or min(INFLUX_RETRY_MAX, INFLUX_RETRY_BASE * 2 ** attempt)
+                delay *= random.uniform(0.8, 1.2)
+                self.stats["retries"] += 1
+                logger.warning(f"⚠️ InfluxDB write failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _post(self, body: bytes):
+        request = urllib.request.Request(self.write_url, data=body, method="POST", headers={
+            "Authorization": f"Token {self.token}",
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Encoding": "gzip",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=INFLUX_TIMEOUT) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+            detail = e.read().decode("utf-8", "replace")[:200]
+            raise InfluxWriteError(
+                f"HTTP {e.code}: {detail}",
+                retryable=e.code in _RETRYABLE_STATUS,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        except (urllib.error.URLError, OSError) as e:
+            raise InfluxWriteError(str(e), retryable=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            buffered = len(self._lines)
+        return {**self.stats, "buffered_lines": buffered}
+
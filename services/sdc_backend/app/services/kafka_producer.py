@@ -0,0 +1,168 @@
+import os
+import time
+import functools
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+from confluent_kafka import Producer, KafkaException
+
+from app.services.latency import latency_tracker, STAGE_KAFKA_DELIVERY
+
+logger = logging.getLogger(__name__)
+
+BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "127.0.0.1:9092")
+COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")
+
+VITALS_TOPIC = os.getenv("KAFKA_VITALS_TOPIC", "medical-device-data")
+WAVEFORM_TOPIC = os.getenv("KAFKA_WAVEFORM_TOPIC", "medical-device-waveforms")
+
+# vitalni znaki: nizka latenca; valovne oblike: cim vecji paketi
+VITALS_LINGER_MS = int(os.getenv("KAFKA_VITALS_LINGER_MS", "2"))
+VITALS_BATCH_SIZE = int(os.getenv("KAFKA_VITALS_BATCH_SIZE", "16384"))
+WAVEFORM_LINGER_MS = int(os.getenv("KAFKA_WAVEFORM_LINGER_MS", "50"))
+WAVEFORM_BATCH_SIZE = int(os.getenv("KAFKA_WAVEFORM_BATCH_SIZE", "262144"))
+
+POLL_INTERVAL = float(os.getenv("KAFKA_POLL_INTERVAL", "0.1"))
+
+
+@dataclass
+class StreamConfig:
+    name: str
+    topic: str
+    linger_ms: int
+    batch_size: int
+
+    def producer_config(self) -> Dict[str, Any]:
+        return {
+            'bootstrap.servers': BOOTSTRAP_SERVERS,
+            'client.id': f"sdc-backend-{self.name}",
+            'compression.type': COMPRESSION,
+            'linger.ms': self.linger_ms,
+            'batch.size': self.batch_size,
+            'acks': 1,
+            'retries': 2,
+        }
+
+
+class StreamCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    def add(self, queued: int = 0, delivered: int = 0, failed: int = 0, error: Optional[str] = None):
+        with self._lock:
+            self.queued += queued
+            self.delivered += delivered
+            self.failed += failed
+            if error:
+                self.last_error = error
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "in_flight": self.queued - self.delivered - self.failed,
+                "last_error": self.last_error,
+            }
+
+
+#Locena producerja za vitalne znake in valovne oblike + nit za delivery reporte
+class KafkaProducerPipeline:
+    def __init__(self):
+        self.streams = {
+            "vitals": StreamConfig("vitals", VITALS_TOPIC, VITALS_LINGER_MS, VITALS_BATCH_SIZE),
+            "waveforms": StreamConfig("waveforms", WAVEFORM_TOPIC, WAVEFORM_LINGER_MS, WAVEFORM_BATCH_SIZE),
+        }
+        self.producers: Dict[str, Producer] = {
+            name: Producer(stream.producer_config()) for name, stream in self.streams.items()
+        }
+        self.counters: Dict[str, StreamCounters] = {name: StreamCounters() for name in self.streams}
+        self._callbacks = {name: self._delivery_callback(c) for name, c in self.counters.items()}
+        self._stop_event = threading.Event()
+        self._poll_thread: threading.Thread | None = None
+
+    @staticmethod
+    def make_key(room_id: Optional[str], device_epr: Optional[str]) -> bytes:
+        return f"{room_id or ''}|{device_epr or ''}".encode("utf-8")
+
+    def start(self):
+        if self._poll_thread and self._poll_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._poll_thread = threading.Thread(target=self._poll_loop, daemon=True, name="KafkaDeliveryPoller")
+        self._poll_thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._poll_thread:
+            self._poll_thread.join(timeout=2.0)
+        for name, producer in self.producers.items():
+            remaining = producer.flush(timeout)
+            if remaining:
+                logger.warning(f"⚠️ {remaining} Kafka messages not delivered on shutdown ({name})")
+
+    def send_vitals(self, value: bytes, room_id: Optional[str], device_epr: Optional[str],
+                    arrival: Optional[float] = None):
+        trace = (room_id, device_epr, arrival) if arrival is not None and latency_tracker.enabled else None
+        self._produce("vitals", value, self.make_key(room_id, device_epr), trace)
+
+    def send_waveform(self, value: bytes, room_id: Optional[str], device_epr: Optional[str]):
+        self._produce("waveforms", value, self.make_key(room_id, device_epr))
+
+    def _produce(self, stream: str, value: bytes, key: bytes, trace: Optional[tuple] = None):
+        producer = self.producers[stream]
+        counters = self.counters[stream]
+        callback = self._callbacks[stream]
+        if trace is not None:
+            callback = functools.partial(self._traced_delivery, callback, trace)
+        topic = self.streams[stream].topic
+        counters.add(queued=1)
+        try:
+            producer.produce(topic, value, key=key, on_delivery=callback)
+        except BufferError:
+            # lokalna vrsta je polna: pocakamo na delivery reporte in poskusimo se enkrat
+            producer.poll(POLL_INTERVAL)
+            try:
+                producer.produce(topic, value, key=key, on_delivery=callback)
+            except (BufferError, KafkaException) as e:
+                counters.add(failed=1, error=str(e))
+                logger.error(f"❌ Kafka queue full, dropping {stream} message: {e}")
+        except KafkaException as e:
+            counters.add(failed=1, error=str(e))
+            logger.error(f"❌ Error producing {stream} message to Kafka: {e}")
+
+    @staticmethod
+    def _delivery_callback(counters: StreamCounters):
+        def on_delivery(err, msg):
+            if err is not None:
+                counters.add(failed=1, error=str(err))
+            else:
+                counters.add(delivered=1)
+        return on_delivery
+
+    @staticmethod
+    def _traced_delivery(callback, trace: tuple, err, msg):
+        callback(err, msg)
+        if err is None:
+            room_id, device_epr, arrival = trace
+            latency_tracker.observe(room_id, device_epr, STAGE_KAFKA_DELIVERY, time.time() - arrival)
+
+    def _poll_loop(self):
+        while not self._stop_event.is_set():
+            for producer in self.producers.values():
+                try:
+                    producer.poll(POLL_INTERVAL / len(self.producers))
+                except Exception as e:
+                    logger.error(f"❌ Error polling Kafka delivery reports: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            name: {"topic": self.streams[name].topic, **counters.snapshot()}
+            for name, counters in self.counters.items()
+        }
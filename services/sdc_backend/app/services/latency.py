@@ -0,0 +1,167 @@
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+# Zakasnitve po stopnjah cevovoda. Vsaka stopnja meri cas od prihoda obvestila v
+# consumers.py (ovojnica "ts") do te tocke; "provider" meri cas od dolocitve na
+# napravi ("dts") do prihoda, "end_to_end" pa od dolocitve do zapisa v socket.
+LATENCY_TRACING = os.getenv("SDC_LATENCY_TRACING", "true").lower() == "true"
+
+STAGE_PROVIDER = "provider"
+STAGE_DEQUEUE = "dequeue"
+STAGE_KAFKA_ENQUEUE = "kafka_enqueue"
+STAGE_KAFKA_DELIVERY = "kafka_delivery"
+STAGE_WS_ENQUEUE = "ws_enqueue"
+STAGE_WS_WRITE = "ws_write"
+STAGE_END_TO_END = "end_to_end"
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# HDR razdelitev: 2^SUB_BITS podrazredov na vsako potenco dvojke (~3 % natancnost)
+_SUB_BITS = 5
+_SUB_COUNT = 1 << _SUB_BITS
+_MAX_US = (1 << 31) - 1
+_BUCKETS = 2 * _SUB_COUNT + (_MAX_US.bit_length() - _SUB_BITS - 1) * _SUB_COUNT
+
+
+def _bucket_index(value_us: int) -> int:
+    if value_us < 2 * _SUB_COUNT:
+        return value_us
+    shift = value_us.bit_length() - _SUB_BITS - 1
+    return 2 * _SUB_COUNT + (shift - 1) * _SUB_COUNT + ((value_us >> shift) - _SUB_COUNT)
+
+
+def _bucket_value(index: int) -> int:
+    if index < 2 * _SUB_COUNT:
+        return index
+    shift = (index - 2 * _SUB_COUNT) // _SUB_COUNT + 1
+    top = (index - 2 * _SUB_COUNT) % _SUB_COUNT + _SUB_COUNT
+    # sredina razreda
+    return (top << shift) + (1 << (shift - 1))
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, value_us: int):
+        value_us = min(max(int(value_us), 0), _MAX_US)
+        self.counts[_bucket_index(value_us)] += 1
+        self.count += 1
+        self.total_us += value_us
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        target = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if not n:
+                continue
+            seen += n
+            if seen >= target:
+                return min(_bucket_value(index), self.max_us)
+        return self.max_us
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "min_ms": (self.min_us or 0) / 1000.0,
+            "max_ms": self.max_us / 1000.0,
+            "mean_ms": self.total_us / self.count / 1000.0 if self.count else 0.0,
+            **{f"p{q * 100:g}_ms": self.percentile(q) / 1000.0 for q in QUANTILES},
+        }
+
+
+def _label(value: Optional[str]) -> str:
+    return (value or "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+#Histogrami po (soba, naprava, stopnja)
+class LatencyTracker:
+    def __init__(self, enabled: bool = LATENCY_TRACING):
+        self.enabled = enabled
+        self._histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, room_id: Optional[str], device_epr: Optional[str], stage: str, seconds: float):
+        if not self.enabled:
+            return
+        key = (room_id or "", device_epr or "", stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(seconds * 1_000_000)
+
+    def observe_envelopes(self, envelopes: List[Dict[str, Any]], stage: str, now: float):
+        # cas od prihoda obvestila (ovojnica "ts" v ms)
+        if not self.enabled:
+            return
+        for envelope in envelopes:
+            ts = envelope.get("ts")
+            if ts is not None:
+                self.observe(envelope.get("room_id"), envelope.get("device_epr"), stage, now - ts / 1000.0)
+
+    def observe_provider(self, envelopes: List[Dict[str, Any]]):
+        if not self.enabled:
+            return
+        for envelope in envelopes:
+            dts = envelope.get("dts")
+            ts = envelope.get("ts")
+            if dts and ts is not None:
+                self.observe(envelope.get("room_id"), envelope.get("device_epr"), STAGE_PROVIDER,
+                             ts / 1000.0 - max(dts.values()) / 1e9)
+
+    def observe_end_to_end(self, envelopes: List[Dict[str, Any]], now: float):
+        if not self.enabled:
+            return
+        for envelope in envelopes:
+            dts = envelope.get("dts")
+            if dts:
+                self.observe(envelope.get("room_id"), envelope.get("device_epr"), STAGE_END_TO_END,
+                             now - max(dts.values()) / 1e9)
+
+    def remove_device(self, room_id: Optional[str], device_epr: str):
+        with self._lock:
+            for key in [k for k in self._histograms if k[0] == (room_id or "") and k[1] == device_epr]:
+                del self._histograms[key]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, h.snapshot()) for key, h in self._histograms.items()]
+        return [
+            {"room_id": room, "device_epr": device, "stage": stage, **data}
+            for (room, device, stage), data in sorted(items)
+        ]
+
+    def render_prometheus(self) -> str:
+        name = "sdc_stage_latency_seconds"
+        lines = [
+            f"# HELP {name} Latency from notification arrival (or device determination) to each pipeline stage.",
+            f"# TYPE {name} summary",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for (room, device, stage), histogram in items:
+                labels = f'room_id="{_label(room)}",device_epr="{_label(device)}",stage="{_label(stage)}"'
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {histogram.percentile(q) / 1e6:.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.total_us / 1e6:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            lines.append(f"# TYPE {name}_max gauge")
+            for (room, device, stage), histogram in items:
+                labels = f'room_id="{_label(room)}",device_epr="{_label(device)}",stage="{_label(stage)}"'
+                lines.append(f"{name}_max{{{labels}}} {histogram.max_us / 1e6:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+latency_tracker = LatencyTracker()
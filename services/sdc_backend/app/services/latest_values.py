@@ -0,0 +1,137 @@
+import threading
+import time
+from array import array
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+# Zadnja znana vrednost za vsak (soba, naprava, handle). Nove povezave dobijo
+# posnetek takoj, namesto da cakajo na naslednjo spremembo (npr. drugName).
+
+
+#Rezine ene naprave: handle -> indeks v vzporednih poljih
+class DeviceSlots:
+    __slots__ = ("index", "handles", "values", "ts", "dts")
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.handles: List[str] = []
+        self.values: List[Any] = []
+        self.ts = array("q")
+        self.dts = array("q")
+
+    def set(self, handle: str, value: Any, ts: int, dts: int):
+        slot = self.index.get(handle)
+        if slot is None:
+            self.index[handle] = len(self.handles)
+            self.handles.append(handle)
+            self.values.append(value)
+            self.ts.append(ts)
+            self.dts.append(dts)
+            return
+        self.values[slot] = value
+        self.ts[slot] = ts
+        self.dts[slot] = dts
+
+    def envelope(self, room_id: str, device_epr: str, handles: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        slots = range(len(self.handles)) if handles is None else \
+            [self.index[h] for h in handles if h in self.index]
+        if not slots:
+            return None
+        metrics, metric_ts, dts = {}, {}, {}
+        for slot in slots:
+            handle = self.handles[slot]
+            metrics[handle] = self.values[slot]
+            metric_ts[handle] = self.ts[slot]
+            if self.dts[slot]:
+                dts[handle] = self.dts[slot]
+        envelope = {
+            "room_id": room_id,
+            "device_epr": device_epr,
+            "ts": max(metric_ts.values()),
+            "metrics": metrics,
+            "metric_ts": metric_ts,
+            "snapshot": True,
+        }
+        if dts:
+            envelope["dts"] = dts
+        return envelope
+
+
+class LatestValueCache:
+    def __init__(self):
+        self._rooms: Dict[str, Dict[str, DeviceSlots]] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # ETag ostane unikaten tudi po ponovnem zagonu procesa
+        self._generation = format(int(time.time() * 1000), "x")
+
+    def update(self, batch: List[Dict[str, Any]]):
+        with self._lock:
+            for envelope in batch:
+                room_id = envelope.get("room_id") or ""
+                device_epr = envelope.get("device_epr") or ""
+                ts = int(envelope.get("ts") or time.time() * 1000)
+                dts = envelope.get("dts") or {}
+                devices = self._rooms.setdefault(room_id, {})
+                slots = devices.get(device_epr)
+                if slots is None:
+                    slots = devices[device_epr] = DeviceSlots()
+                metrics = envelope.get("metrics", {})
+                for handle, value in metrics.items():
+                    slots.set(handle, value, ts, dts.get(handle, 0))
+                if metrics:
+                    # verzija sobe doloca ETag za /rooms/{room}/latest
+                    self._versions[room_id] = self._versions.get(room_id, 0) + 1
+
+    def remove_room(self, room_id: str):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+            self._versions[room_id] = self._versions.get(room_id, 0) + 1
+
+    # odklopljena naprava ne sme ostati v posnetkih kot da je ziva
+    def remove_device(self, room_id: Optional[str], device_epr: str):
+        room_id = room_id or ""
+        with self._lock:
+            devices = self._rooms.get(room_id)
+            if devices is None or devices.pop(device_epr, None) is None:
+                return
+            self._versions[room_id] = self._versions.get(room_id, 0) + 1
+
+    def has_room(self, room_id: str) -> bool:
+        with self._lock:
+            return room_id in self._rooms
+
+    def etag(self, room_id: str) -> str:
+        with self._lock:
+            return self._etag(room_id)
+
+    def _etag(self, room_id: str) -> str:
+        return f'"{self._generation}-{self._versions.get(room_id, 0)}"'
+
+    def room_snapshot(self, room_id: str) -> Tuple[str, List[Dict[str, Any]]]:
+        with self._lock:
+            etag = self._etag(room_id)
+            envelopes = [
+                slots.envelope(room_id, device_epr)
+                for device_epr, slots in self._rooms.get(room_id, {}).items()
+            ]
+        return etag, [e for e in envelopes if e]
+
+    def snapshot(self, rooms: Iterable[str], devices: Iterable[str] = (), handles: Iterable[str] = (),
+                 all_rooms: str = "*") -> List[Dict[str, Any]]:
+        # enaka pravila kot pri razposiljanju: soba, nato naprave in handli (oboje skupaj = presek)
+        rooms, devices, handles = set(rooms), set(devices), set(handles)
+        envelopes = []
+        with self._lock:
+            for room_id, room_devices in self._rooms.items():
+                if all_rooms not in rooms and room_id not in rooms:
+                    continue
+                for device_epr, slots in room_devices.items():
+                    if devices and device_epr not in devices:
+                        continue
+                    envelope = slots.envelope(room_id, device_epr, handles or None)
+                    if envelope:
+                        envelopes.append(envelope)
+        return envelopes
+
+
+latest_values = LatestValueCache()
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+#Predaja dela iz niti v asyncio zanko: vec klicev en sam call_soon_threadsafe
+class LoopHandoff:
+    def __init__(self, name: str = "handoff"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[Callable[..., Any], tuple]] = []
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self.posted = 0
+        self.wakeups = 0
+        self.dropped = 0
+        self.max_batch = 0
+        self.last_drain_ms = 0.0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def unbind(self):
+        with self._lock:
+            self._loop = None
+            self._pending.clear()
+            self._scheduled = False
+
+    def post(self, fn: Callable[..., Any], *args):
+        # klice se iz poljubne niti; fn tece v zanki in ne sme blokirati
+        with self._lock:
+            loop = self._loop
+            if loop is None:
+                self.dropped += 1
+                return
+            self._pending.append((fn, args))
+            self.posted += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._drain)
+            self.wakeups += 1
+        except RuntimeError:
+            # zanka je zaprta (zaustavitev)
+            with self._lock:
+                self.dropped += len(self._pending)
+                self._pending.clear()
+                self._scheduled = False
+
+    def _drain(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._scheduled = False
+        start = time.perf_counter()
+        for fn, args in batch:
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"❌ Error in {self.name} callback: {e}")
+        self.max_batch = max(self.max_batch, len(batch))
+        self.last_drain_ms = (time.perf_counter() - start) * 1000.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "posted": self.posted,
+            "wakeups": self.wakeups,
+            "items_per_wakeup": round(self.posted / self.wakeups, 2) if self.wakeups else 0.0,
+            "max_batch": self.max_batch,
+            "dropped": self.dropped,
+            "last_drain_ms": round(self.last_drain_ms, 3),
+        }
@@ -0,0 +1,229 @@
+import struct
+import zlib
+import logging
+from typing import Dict, Any, List, Tuple, Optional, Callable, Set
+
+from app.services.schema_store import FileSchemaStore, SchemaError, get_schema_store
+from app.services.descriptor_index import stable_id
+
+logger = logging.getLogger(__name__)
+
+# Kompakten binarni zapis za medical-device-data
+#
+#   0x00 | schema_id (u32 BE) | header | count (u16) | records...
+#
+# Polja fiksne dolzine sheme se zapakirajo v en struct (LE), nizi/bytes sledijo
+# kot u16/u32 dolzina + vsebina. Bralec vedno uporabi shemo, s katero je bil zapis
+# napisan (id v glavi), zato starejsi zapisi ostanejo berljivi.
+SUBJECT = "medical-device-data"
+MAGIC = 0
+
+KIND_NONE = 0
+KIND_NUMERIC = 1
+KIND_STRING = 2
+KIND_WAVEFORM = 3
+
+_PREFIX = struct.Struct(">BI")
+_COUNT = struct.Struct("<H")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+_FIXED_FORMATS = {"uint8": "B", "uint16": "H", "uint32": "I", "int64": "q", "float64": "d"}
+_DEFAULTS = {"uint8": 0, "uint16": 0, "uint32": 0, "int64": 0, "float64": 0.0}
+
+
+def handle_id(handle: str) -> int:
+    # stabilen 32-bitni id handla (enak v vseh procesih), za filtriranje brez dekodiranja niza
+    return zlib.crc32(handle.encode("utf-8"))
+
+
+class _Section:
+    def __init__(self, fields: List[Dict[str, str]]):
+        self.fixed = [f["name"] for f in fields if f["type"] in _FIXED_FORMATS]
+        self.fixed_defaults = [_DEFAULTS[f["type"]] for f in fields if f["type"] in _FIXED_FORMATS]
+        self.variable = [(f["name"], f["type"]) for f in fields if f["type"] not in _FIXED_FORMATS]
+        self.struct = struct.Struct("<" + "".join(_FIXED_FORMATS[f["type"]] for f in fields if f["type"] in _FIXED_FORMATS))
+
+    def encode(self, values: Dict[str, Any], out: List[bytes]):
+        out.append(self.struct.pack(*[
+            values.get(name) if values.get(name) is not None else default
+            for name, default in zip(self.fixed, self.fixed_defaults)
+        ]))
+        for name, kind in self.variable:
+            value = values.get(name)
+            if kind == "string":
+                raw = value.encode("utf-8") if value else b""
+                out.append(_U16.pack(len(raw)))
+            else:
+                raw = bytes(value) if value else b""
+                out.append(_U32.pack(len(raw)))
+            out.append(raw)
+
+    def decode(self, view: memoryview, pos: int) -> Tuple[Dict[str, Any], int]:
+        values = dict(zip(self.fixed, self.struct.unpack_from(view, pos)))
+        pos += self.struct.size
+        for name, kind in self.variable:
+            if kind == "string":
+                (length,) = _U16.unpack_from(view, pos)
+                pos += 2
+                values[name] = bytes(view[pos:pos + length]).decode("utf-8") if length else None
+            else:
+                (length,) = _U32.unpack_from(view, pos)
+                pos += 4
+                values[name] = bytes(view[pos:pos + length]) if length else None
+            pos += length
+        return values, pos
+
+
+class RecordCodec:
+    def __init__(self, schema: Dict[str, Any], store: Optional[FileSchemaStore] = None):
+        self.schema = schema
+        self.schema_id = schema["id"]
+        self._header = _Section(schema.get("header", []))
+        self._fields = _Section(schema["fields"])
+        # shema brez niza handle: slovar handle_id -> handle zapisemo v shrambo shem,
+        # da bralci (replay, drugi procesi) ne potrebujejo indeksa deskriptorjev
+        self._store = store if not any(f["name"] == "handle" for f in schema["fields"]) else None
+        self._named: Set[int] = set()
+
+    def _remember_handles(self, records: List[Dict[str, Any]]):
+        new = {r["handle_id"]: r["handle"] for r in records
+               if r.get("handle") and r.get("handle_id") not in self._named}
+        if new:
+            try:
+                self._store.register_names(self.schema["subject"], new)
+            except OSError as e:
+                # zapis gre vseeno naprej; ime poskusimo zapisati ob naslednjem zapisu
+                logger.warning(f"⚠️ Could not store handle names: {e}")
+                return
+            self._named.update(new)
+
+    def encode(self, header: Dict[str, Any], records: List[Dict[str, Any]]) -> bytes:
+        if len(records) > 0xFFFF:
+            raise ValueError(f"Too many records in one batch: {len(records)}")
+        if self._store is not None:
+            self._remember_handles(records)
+        out = [_PREFIX.pack(MAGIC, self.schema_id)]
+        self._header.encode(header, out)
+        out.append(_COUNT.pack(len(records)))
+        for record in records:
+            self._fields.encode(record, out)
+        return b"".join(out)
+
+    def decode_body(self, view: memoryview, pos: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        header, pos = self._header.decode(view, pos)
+        (count,) = _COUNT.unpack_from(view, pos)
+        pos += _COUNT.size
+        records = []
+        for _ in range(count):
+            record, pos = self._fields.decode(view, pos)
+            records.append(record)
+        return header, records
+
+
+_codecs: Dict[int, RecordCodec] = {}
+
+
+def _codec_for_id(schema_id: int, store: FileSchemaStore) -> RecordCodec:
+    codec = _codecs.get(schema_id)
+    if codec is None or codec._store is not store:
+        codec = _codecs[schema_id] = RecordCodec(store.get_by_id(schema_id), store)
+    return codec
+
+
+def get_encoder(subject: str = SUBJECT, store: Optional[FileSchemaStore] = None) -> RecordCodec:
+    store = store or get_schema_store()
+    return _codec_for_id(store.latest(subject)["id"], store)
+
+
+def decode_records(data: bytes, store: Optional[FileSchemaStore] = None) -> Tuple[int, Dict[str, Any], List[Dict[str, Any]]]:
+    store = store or get_schema_store()
+    view = memoryview(data)
+    magic, schema_id = _PREFIX.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise SchemaError(f"Not a medical-device record (magic byte {magic})")
+    header, records = _codec_for_id(schema_id, store).decode_body(view, _PREFIX.size)
+    return schema_id, header, records
+
+
+def _describe(record: Dict[str, Any], info) -> Dict[str, Any]:
+    # v1 nosi handle in enoto kot niz, v2 le kompaktne kode (app/services/descriptor_index.py)
+    if info is not None:
+        record["unit"] = info.unit
+        record["code"] = info.code_id
+        record["unit_code"] = info.unit_id
+    return record
+
+
+def records_from_envelope(envelope: Dict[str, Any],
+                          lookup: Optional[Callable[[Optional[str], str], Any]] = None) -> List[Dict[str, Any]]:
+    ts_ns = int(envelope.get("ts", 0)) * 1_000_000
+    device_epr = envelope.get("device_epr")
+    dts = envelope.get("dts") or {}
+    records = []
+    for handle, value in envelope.get("metrics", {}).items():
+        record = _describe({
+            "ts_ns": dts.get(handle, ts_ns),
+            "handle_id": handle_id(handle),
+            "handle": handle,
+        }, lookup(device_epr, handle) if lookup else None)
+        if value is None:
+            record["kind"] = KIND_NONE
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            record["kind"] = KIND_NUMERIC
+            record["value"] = float(value)
+        else:
+            record["kind"] = KIND_STRING
+            record["text"] = str(value)
+        records.append(record)
+    return records
+
+
+def waveform_record(chunk: bytes, t0: float, handle: str, info=None) -> Dict[str, Any]:
+    return _describe({
+        "ts_ns": int(t0 * 1_000_000_000),
+        "kind": KIND_WAVEFORM,
+        "handle_id": handle_id(handle),
+        "handle": handle,
+        "samples": chunk,
+    }, info)
+
+
+def handle_name(handle_id: int, handle_lookup: Optional[Callable[[int], Optional[str]]] = None,
+                store: Optional[FileSchemaStore] = None) -> str:
+    # zivi indeks deskriptorjev, sicer slovar v shrambi shem (deluje tudi po ponovnem zagonu)
+    handle = handle_lookup(handle_id) if handle_lookup else None
+    if handle is None:
+        handle = (store or get_schema_store()).name_for(SUBJECT, handle_id)
+    return handle or str(handle_id)
+
+
+def envelope_from_records(header: Dict[str, Any], records: List[Dict[str, Any]],
+                          handle_lookup: Optional[Callable[[int], Optional[str]]] = None,
+                          store: Optional[FileSchemaStore] = None) -> Dict[str, Any]:
+    # obratno od records_from_envelope (valovne oblike izpustimo); ovojnica ima enako obliko kot JSON
+    metrics: Dict[str, Any] = {}
+    dts: Dict[str, int] = {}
+    for record in records:
+        kind = record.get("kind")
+        if kind == KIND_WAVEFORM:
+            continue
+        handle = record.get("handle") or handle_name(record["handle_id"], handle_lookup, store)
+        metrics[handle] = record.get("value") if kind == KIND_NUMERIC else record.get("text") if kind == KIND_STRING else None
+        dts[handle] = record["ts_ns"]
+    return {
+        "device_epr": header.get("device_epr"),
+        "room_id": header.get("room_id"),
+        "ts": min(dts.values(), default=0) // 1_000_000,
+        "metrics": metrics,
+        "dts": dts,
+    }
+
+
+def record_header(room_id: Optional[str], device_epr: Optional[str], device_type: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "room_id": room_id,
+        "device_epr": device_epr,
+        "device_cid": stable_id(device_epr) if device_epr else 0,
+        "device_type": device_type,
+    }
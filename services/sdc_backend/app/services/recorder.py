@@ -0,0 +1,507 @@
+import os
+import re
+import json
+import mmap
+import time
+import zlib
+import shutil
+import struct
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from app.services.descriptor_index import descriptor_index
+
+logger = logging.getLogger(__name__)
+
+# Snemanje operacij na disk: ena mapa na sejo sobe, en segment na casovni kos.
+#   SDC_RECORDER            vklop ("false")
+#   SDC_RECORDER_DIR        korenska mapa posnetkov
+#   SDC_RECORDER_CHUNK_S    dolzina kosa (segmenta) v sekundah
+#   SDC_RECORDER_IDLE_S     brez podatkov toliko casa = konec seje
+#   SDC_RECORDER_BUDGET_MB  zgornja meja diska; ob prekoracitvi brisemo najstarejse segmente
+#   SDC_RECORDER_LEVEL      stopnja zlib stiskanja
+RECORDER = os.getenv("SDC_RECORDER", "false").lower() == "true"
+RECORDER_DIR = os.getenv("SDC_RECORDER_DIR", "recordings")
+RECORDER_CHUNK_S = float(os.getenv("SDC_RECORDER_CHUNK_S", "60"))
+RECORDER_IDLE_S = float(os.getenv("SDC_RECORDER_IDLE_S", "300"))
+RECORDER_BUDGET_MB = float(os.getenv("SDC_RECORDER_BUDGET_MB", "2048"))
+RECORDER_LEVEL = int(os.getenv("SDC_RECORDER_LEVEL", "6"))
+
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+EXPORT_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+
+# Segment: MAGIC, stisnjeni stolpci (cas, vrednost) po (naprava, handle), JSON kazalo, zakljucek.
+# Kazalo ima za vsak stolpec odmik, dolzino ter t_min/t_max, zato bralec prebere samo
+# stolpce in kose, ki jih potrebuje (mmap, brez branja celotne datoteke).
+SEGMENT_MAGIC = b"SDCSEG01"
+SEGMENT_SUFFIX = ".seg"
+MANIFEST = "session.json"
+_TRAILER = struct.Struct("<QI8s")
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def _dir_name(room_id: Optional[str]) -> str:
+    return _UNSAFE.sub("_", room_id) if room_id else "_unassigned"
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# casi kot razlike (majhna stevila), vrednosti po bajtih (enaki eksponenti skupaj); oboje dobro stisne zlib
+def _encode_ts(ts: np.ndarray, level: int) -> bytes:
+    return zlib.compress(np.diff(ts, prepend=0).tobytes(), level)
+
+
+def _decode_ts(block: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(block), dtype=np.int64))
+
+
+def _encode_values(values: np.ndarray, level: int) -> bytes:
+    return zlib.compress(values.view(np.uint8).reshape(-1, 8).T.tobytes(), level)
+
+
+def _decode_values(block: bytes) -> np.ndarray:
+    raw = np.frombuffer(zlib.decompress(block), dtype=np.uint8)
+    return raw.reshape(8, -1).T.copy().view(np.float64).reshape(-1)
+
+
+class _Column:
+    __slots__ = ("ts", "values", "unit", "device_type")
+
+    def __init__(self, unit: Optional[str], device_type: Optional[str]):
+        self.ts: List[int] = []
+        self.values: List[float] = []
+        self.unit = unit
+        self.device_type = device_type
+
+
+def write_segment(path: str, room_id: Optional[str], columns: Dict[Tuple[str, str], _Column],
+                  level: int = RECORDER_LEVEL) -> Dict[str, Any]:
+    body = bytearray(SEGMENT_MAGIC)
+    index = []
+    for (device_epr, handle), column in columns.items():
+        ts = np.asarray(column.ts, dtype=np.int64)
+        values = np.asarray(column.values, dtype=np.float64)
+        order = np.argsort(ts, kind="stable")
+        ts, values = ts[order], values[order]
+        t_block = _encode_ts(ts, level)
+        v_block = _encode_values(values, level)
+        index.append({
+            "device_epr": device_epr,
+            "handle": handle,
+            "unit": column.unit,
+            "device_type": column.device_type,
+            "count": len(ts),
+            "t_min": int(ts[0]),
+            "t_max": int(ts[-1]),
+            "ts": [len(body), len(t_block)],
+            "values": [len(body) + len(t_block), len(v_block)],
+        })
+        body += t_block
+        body += v_block
+    t_min = min(c["t_min"] for c in index)
+    t_max = max(c["t_max"] for c in index)
+    footer = json.dumps({"version": 1, "room_id": room_id, "t_min": t_min, "t_max": t_max,
+                         "columns": index}, separators=(",", ":")).encode("utf-8")
+    body += footer
+    body += _TRAILER.pack(len(body) - len(footer), len(footer), SEGMENT_MAGIC)
+    _write_atomic(path, bytes(body))
+    return {
+        "file": os.path.basename(path),
+        "t_min": t_min,
+        "t_max": t_max,
+        "rows": sum(c["count"] for c in index),
+        "columns": len(index),
+        "bytes": len(body),
+    }
+
+
+#Branje enega segmenta prek mmap; razpakiramo samo zahtevane stolpce
+class SegmentReader:
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        offset, length, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != SEGMENT_MAGIC or self._map[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError(f"Not a recording segment: {path}")
+        footer = json.loads(self._map[offset:offset + length])
+        self.t_min = footer["t_min"]
+        self.t_max = footer["t_max"]
+        self.columns: List[Dict[str, Any]] = footer["columns"]
+
+    def read(self, column: Dict[str, Any], start_ms: int, end_ms: int) -> Tuple[np.ndarray, np.ndarray]:
+        t_off, t_len = column["ts"]
+        ts = _decode_ts(self._map[t_off:t_off + t_len])
+        lo, hi = np.searchsorted(ts, start_ms, "left"), np.searchsorted(ts, end_ms, "right")
+        if lo == hi:
+            return ts[:0], np.empty(0, dtype=np.float64)
+        v_off, v_len = column["values"]
+        return ts[lo:hi], _decode_values(self._map[v_off:v_off + v_len])[lo:hi]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Ena seja sobe: zakljuceni segmenti (manifest) in odprt kos v pomnilniku
+class RecordingSession:
+    def __init__(self, room_id: Optional[str], session_id: str, path: str, started: int):
+        self.room_id = room_id
+        self.session_id = session_id
+        self.path = path
+        self.started = started
+        self.ended: Optional[int] = None
+        self.last_ts = started
+        self.segments: List[Dict[str, Any]] = []
+        self.chunk: Dict[Tuple[str, str], _Column] = {}
+        self.chunk_opened = time.monotonic()
+        self.sequence = 0
+
+    @property
+    def bytes(self) -> int:
+        return sum(segment["bytes"] for segment in self.segments)
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            "room_id": self.room_id,
+            "session_id": self.session_id,
+            "started": self.started,
+            "ended": self.ended,
+            "segments": list(self.segments),
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "room_id": self.room_id,
+            "session_id": self.session_id,
+            "started": self.started,
+            "ended": self.ended,
+            "t_min": self.segments[0]["t_min"] if self.segments else None,
+            "t_max": max((s["t_max"] for s in self.segments), default=None),
+            "segments": len(self.segments),
+            "rows": sum(s["rows"] for s in self.segments),
+            "bytes": self.bytes,
+        }
+
+
+class SessionRecorder:
+    def __init__(self, root: str = RECORDER_DIR, chunk_s: float = RECORDER_CHUNK_S,
+                 idle_s: float = RECORDER_IDLE_S, budget_mb: float = RECORDER_BUDGET_MB,
+                 level: int = RECORDER_LEVEL):
+        self.root = root
+        self.chunk_s = chunk_s
+        self.idle_ms = int(idle_s * 1000)
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.level = level
+        self._sessions: Dict[Tuple[Optional[str], str], RecordingSession] = {}
+        self._open: Dict[Optional[str], RecordingSession] = {}
+        self._closing: List[RecordingSession] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.points = 0
+        self.segments_written = 0
+        self.segments_evicted = 0
+        self.write_errors = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="SessionRecorder")
+        self._thread.start()
+        logger.info(f"🎙️ Recording sessions to {os.path.abspath(self.root)} "
+                    f"(chunk {self.chunk_s:.0f}s, budget {self.budget_bytes // (1024 * 1024)} MB)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10.0)
+        # zakljucimo odprte seje, da je manifest popoln
+        with self._lock:
+            for session in list(self._open.values()):
+                self._close(session)
+        self._flush(force=True)
+
+    def add(self, batch: List[Dict[str, Any]]):
+        with self._lock:
+            for envelope in batch:
+                room_id = envelope.get("room_id")
+                device_epr = envelope.get("device_epr") or ""
+                ts = envelope.get("ts") or int(time.time() * 1000)
+                dts = envelope.get("dts") or {}
+                session = self._session_for(room_id, ts)
+                for handle, value in envelope.get("metrics", {}).items():
+                    if not isinstance(value, (int, float)) or isinstance(value, bool):
+                        continue
+                    column = session.chunk.get((device_epr, handle))
+                    if column is None:
+                        column = session.chunk[(device_epr, handle)] = _Column(
+                            descriptor_index.unit(device_epr, handle), descriptor_index.device_type(device_epr, (handle,)))
+                    column.ts.append(dts[handle] // 1_000_000 if handle in dts else ts)
+                    column.values.append(float(value))
+                    self.points += 1
+                session.last_ts = max(session.last_ts, ts)
+
+    def _session_for(self, room_id: Optional[str], ts: int) -> RecordingSession:
+        session = self._open.get(room_id)
+        if session is not None and ts - session.last_ts <= self.idle_ms:
+            return session
+        if session is not None:
+            self._close(session)
+        session_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(ts / 1000))
+        path = os.path.join(self.root, _dir_name(room_id), session_id)
+        suffix = 1
+        while (room_id, session_id) in self._sessions or os.path.exists(path):
+            suffix += 1
+            session_id = f"{session_id.split('-')[0]}-{suffix}"
+            path = os.path.join(self.root, _dir_name(room_id), session_id)
+        session = RecordingSession(room_id, session_id, path, ts)
+        self._open[room_id] = session
+        self._sessions[(room_id, session_id)] = session
+        return session
+
+    def _close(self, session: RecordingSession):
+        session.ended = session.last_ts
+        self._open.pop(session.room_id, None)
+        self._closing.append(session)
+
+    def close_room(self, room_id: str):
+        with self._lock:
+            session = self._open.get(room_id)
+            if session is not None:
+                self._close(session)
+
+    def _run(self):
+        interval = min(1.0, self.chunk_s)
+        while not self._stop.wait(interval):
+            try:
+                self._flush()
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"❌ Recorder flush failed: {e}")
+
+    def _flush(self, force: bool = False):
+        # kose zamenjamo pod zaklepom, stiskanje in pisanje tece brez njega (samo ta nit pise)
+        now = time.monotonic()
+        due: List[Tuple[RecordingSession, Dict[Tuple[str, str], _Column]]] = []
+        with self._lock:
+            # soba, ki utihne, ne poslje vec ovojnice, ki bi sejo zaprla v _session_for
+            wall_ms = time.time() * 1000
+            for session in [s for s in self._open.values() if wall_ms - s.last_ts > self.idle_ms]:
+                self._close(session)
+            closing, self._closing = self._closing, []
+            for session in list(self._open.values()):
+                if session.chunk and (force or now - session.chunk_opened >= self.chunk_s):
+                    due.append((session, session.chunk))
+                    session.chunk, session.chunk_opened = {}, now
+            for session in closing:
+                due.append((session, session.chunk))
+                session.chunk = {}
+        if not due:
+            return
+        start = time.perf_counter()
+        for session, chunk in due:
+            try:
+                self._write_chunk(session, chunk)
+            except OSError as e:
+                self.write_errors += 1
+                logger.error(f"❌ Recorder could not write {session.path}: {e}")
+        self._enforce_budget()
+        self.last_flush_ms = (time.perf_counter() - start) * 1000.0
+
+    def _write_chunk(self, session: RecordingSession, chunk: Dict[Tuple[str, str], _Column]):
+        if chunk:
+            os.makedirs(session.path, exist_ok=True)
+            name = f"{session.sequence:05d}-{min(min(c.ts) for c in chunk.values())}{SEGMENT_SUFFIX}"
+            session.sequence += 1
+            segment = write_segment(os.path.join(session.path, name), session.room_id, chunk, self.level)
+            with self._lock:
+                session.segments.append(segment)
+            self.segments_written += 1
+        if session.segments:
+            self._write_manifest(session)
+        elif session.ended is not None:
+            # seja brez podatkov
+            with self._lock:
+                self._sessions.pop((session.room_id, session.session_id), None)
+
+    def _write_manifest(self, session: RecordingSession):
+        with self._lock:
+            manifest = session.manifest()
+        _write_atomic(os.path.join(session.path, MANIFEST), json.dumps(manifest).encode("utf-8"))
+
+    def _enforce_budget(self):
+        # najstarejse segmente brisemo ne glede na sejo; zadnjega segmenta odprte seje ne
+        while True:
+            with self._lock:
+                total = sum(session.bytes for session in self._sessions.values())
+                if total <= self.budget_bytes:
+                    return
+                candidates = [(s.segments[0]["t_min"], s) for s in self._sessions.values()
+                              if s.segments and (s.ended is not None or len(s.segments) > 1)]
+                if not candidates:
+                    return
+                _, session = min(candidates, key=lambda c: c[0])
+                segment = session.segments.pop(0)
+                empty = not session.segments
+                if empty:
+                    self._sessions.pop((session.room_id, session.session_id), None)
+            self.segments_evicted += 1
+            if empty:
+                shutil.rmtree(session.path, ignore_errors=True)
+                continue
+            try:
+                os.remove(os.path.join(session.path, segment["file"]))
+            except FileNotFoundError:
+                pass
+            self._write_manifest(session)
+
+    def _load(self):
+        # seje iz prejsnjih zagonov; ob nenadni zaustavitvi manifest morda ni zakljucen
+        loaded = 0
+        for room_dir in sorted(os.listdir(self.root)):
+            room_path = os.path.join(self.root, room_dir)
+            if not os.path.isdir(room_path):
+                continue
+            for session_id in sorted(os.listdir(room_path)):
+                path = os.path.join(room_path, session_id)
+                try:
+                    with open(os.path.join(path, MANIFEST), "rb") as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                session = RecordingSession(manifest.get("room_id"), session_id, path, manifest["started"])
+                session.segments = [s for s in manifest.get("segments", [])
+                                    if os.path.exists(os.path.join(path, s["file"]))]
+                if not session.segments:
+                    continue
+                session.ended = manifest.get("ended") or max(s["t_max"] for s in session.segments)
+                self._sessions[(session.room_id, session_id)] = session
+                loaded += 1
+        if loaded:
+            logger.info(f"📼 Loaded {loaded} recorded sessions from {self.root}")
+
+    def sessions(self, room_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [s.summary() for s in self._sessions.values() if room_id is None or s.room_id == room_id]
+
+    def _iter_columns(self, room_id: str, session_id: str, devices: Set[str], handles: Set[str],
+                      start_ms: int, end_ms: int) -> Iterator[Tuple[Dict[str, Any], np.ndarray, np.ndarray]]:
+        with self._lock:
+            session = self._sessions.get((room_id, session_id))
+            if session is None:
+                raise KeyError(session_id)
+            segments = [s for s in session.segments if s["t_max"] >= start_ms and s["t_min"] <= end_ms]
+            path = session.path
+        for segment in segments:
+            try:
+                reader = SegmentReader(os.path.join(path, segment["file"]))
+            except FileNotFoundError:
+                # segment je medtem odstranila omejitev diska
+                continue
+            with reader:
+                for column in reader.columns:
+                    if devices and column["device_epr"] not in devices:
+                        continue
+                    if handles and column["handle"] not in handles:
+                        continue
+                    if column["t_max"] < start_ms or column["t_min"] > end_ms:
+                        continue
+                    ts, values = reader.read(column, start_ms, end_ms)
+                    if len(ts):
+                        yield column, ts, values
+
+    def read(self, room_id: str, session_id: str, devices: Set[str], handles: Set[str],
+             start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Dict[str, Any]:
+        start_ms = start_ms if start_ms is not None else 0
+        end_ms = end_ms if end_ms is not None else 2 ** 62
+        series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        parts: Dict[Tuple[str, str], List[Tuple[np.ndarray, np.ndarray]]] = {}
+        for column, ts, values in self._iter_columns(room_id, session_id, devices, handles, start_ms, end_ms):
+            key = (column["device_epr"], column["handle"])
+            if key not in series:
+                series[key] = {"device_epr": key[0], "handle": key[1], "unit": column["unit"],
+                               "device_type": column["device_type"]}
+            parts.setdefault(key, []).append((ts, values))
+        for key, chunks in parts.items():
+            series[key]["ts"] = np.concatenate([c[0] for c in chunks]).tolist()
+            series[key]["values"] = np.concatenate([c[1] for c in chunks]).tolist()
+        return {"room_id": room_id, "session_id": session_id, "series": list(series.values())}
+
+    def export(self, room_id: str, session_id: str, fmt: str, devices: Set[str], handles: Set[str],
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> bytes:
+        # dolga tabela (cas, naprava, handle, enota, vrednost), urejena po segmentih
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed (pip install -r requirements-export.txt)")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Invalid format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+        start_ms = start_ms if start_ms is not None else 0
+        end_ms = end_ms if end_ms is not None else 2 ** 62
+        columns = {"ts": [], "device_epr": [], "handle": [], "unit": [], "value": []}
+        for column, ts, values in self._iter_columns(room_id, session_id, devices, handles, start_ms, end_ms):
+            columns["ts"].append(ts)
+            columns["value"].append(values)
+            for name in ("device_epr", "handle", "unit"):
+                columns[name].append(np.full(len(ts), column[name] or "", dtype=object))
+        empty = not columns["ts"]
+        table = pa.table({
+            "ts": pa.array(np.concatenate(columns["ts"]) if not empty else [], type=pa.timestamp("ms", tz="UTC")),
+            **{name: pa.array(np.concatenate(columns[name]) if not empty else [], type=pa.string()).dictionary_encode()
+               for name in ("device_epr", "handle", "unit")},
+            "value": pa.array(np.concatenate(columns["value"]) if not empty else [], type=pa.float64()),
+        }).replace_schema_metadata({"room_id": room_id or "", "session_id": session_id})
+        sink = pa.BufferOutputStream()
+        if fmt == FORMAT_PARQUET:
+            pq.write_table(table, sink, compression="zstd")
+        else:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(session.bytes for session in self._sessions.values())
+            return {
+                "enabled": True,
+                "root": os.path.abspath(self.root),
+                "sessions": len(self._sessions),
+                "open": len(self._open),
+                "bytes": total,
+                "budget_bytes": self.budget_bytes,
+                "points": self.points,
+                "segments_written": self.segments_written,
+                "segments_evicted": self.segments_evicted,
+                "write_errors": self.write_errors,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "export": pa is not None,
+            }
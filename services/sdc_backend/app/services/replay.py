@@ -0,0 +1,430 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from confluent_kafka import Consumer, TopicPartition, KafkaError, KafkaException, OFFSET_END, TIMESTAMP_NOT_AVAILABLE
+
+from app.services import record_codec
+from app.services.kafka_producer import BOOTSTRAP_SERVERS, VITALS_TOPIC
+from app.services.descriptor_index import descriptor_index
+
+logger = logging.getLogger(__name__)
+
+# Ponovno predvajanje preteklih operacij iz Kafke (medical-device-data):
+#   SDC_REPLAY                 vklop /ws/replay ("true"); brez indeksa isce offsete broker (offsets_for_times)
+#   SDC_REPLAY_INDEX           vklop indeksa po sobah ("false"); ob zagonu prebere celotno temo od zacetka
+#   SDC_REPLAY_GROUP           predpona consumer skupin (offsetov ne potrjujemo)
+#   SDC_REPLAY_INDEX_INTERVAL_S razmik med vnosi redkega indeksa cas -> offset
+#   SDC_REPLAY_PRUNE_S         kako pogosto indeks porezemo na spodnji watermark (retencija teme)
+#   SDC_REPLAY_MAX_SPEED       najvecja hitrost predvajanja
+#   SDC_REPLAY_BATCH           st. sporocil na branje
+REPLAY = os.getenv("SDC_REPLAY", "true").lower() == "true"
+REPLAY_INDEX = os.getenv("SDC_REPLAY_INDEX", "false").lower() == "true"
+REPLAY_GROUP = os.getenv("SDC_REPLAY_GROUP", "sdc-replay")
+REPLAY_INDEX_INTERVAL_S = float(os.getenv("SDC_REPLAY_INDEX_INTERVAL_S", "5"))
+REPLAY_PRUNE_S = float(os.getenv("SDC_REPLAY_PRUNE_S", "60"))
+REPLAY_MAX_SPEED = float(os.getenv("SDC_REPLAY_MAX_SPEED", "20"))
+REPLAY_BATCH = int(os.getenv("SDC_REPLAY_BATCH", "500"))
+
+_POLL_TIMEOUT = 0.5
+
+
+def consumer_config(name: str, **extra) -> Dict[str, Any]:
+    return {
+        'bootstrap.servers': BOOTSTRAP_SERVERS,
+        'group.id': f"{REPLAY_GROUP}-{name}-{uuid.uuid4().hex[:8]}",
+        'client.id': f"sdc-backend-replay-{name}",
+        'enable.auto.commit': False,
+        'auto.offset.reset': 'earliest',
+        **extra,
+    }
+
+
+def room_of(key: Optional[bytes]) -> Optional[str]:
+    # kljuc sporocila je "room|epr" (KafkaProducerPipeline.make_key)
+    if not key:
+        return None
+    room = key.split(b"|", 1)[0]
+    return room.decode("utf-8") if room else None
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    # ms od epohe ali ISO 8601 (brez casovnega pasu = UTC)
+    if value is None or value == "":
+        return None
+    value = value.strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r}, expected epoch ms or ISO 8601")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def envelopes_from_value(value: bytes) -> List[Dict[str, Any]]:
+    # JSON (ena ovojnica ali seznam) ali binarni zapisi po shemi
+    if not value:
+        return []
+    if value[0] == record_codec.MAGIC:
+        _, header, records = record_codec.decode_records(value)
+        envelope = record_codec.envelope_from_records(header, records, descriptor_index.handle_for)
+        return [envelope] if envelope["metrics"] else []
+    payload = json.loads(value)
+    return payload if isinstance(payload, list) else [payload]
+
+
+#Redek indeks ene sobe: po particiji seznam (cas, offset), vnos na vsak interval
+class RoomTimeIndex:
+    def __init__(self, interval_ms: int):
+        self.interval_ms = interval_ms
+        self._ts: Dict[int, List[int]] = {}
+        self._offsets: Dict[int, List[int]] = {}
+        self.first_ts: Optional[int] = None
+        self.last_ts: Optional[int] = None
+        # zadnji offset sobe po particiji (za prepoznavo povsem izbrisanih particij)
+        self._high: Dict[int, int] = {}
+
+    @property
+    def entries(self) -> int:
+        return sum(len(ts) for ts in self._ts.values())
+
+    def add(self, partition: int, ts_ms: int, offset: int):
+        self.first_ts = ts_ms if self.first_ts is None else min(self.first_ts, ts_ms)
+        self.last_ts = ts_ms if self.last_ts is None else max(self.last_ts, ts_ms)
+        self._high[partition] = offset
+        times = self._ts.setdefault(partition, [])
+        if times and ts_ms < times[-1] + self.interval_ms:
+            return
+        times.append(ts_ms)
+        self._offsets.setdefault(partition, []).append(offset)
+
+    def prune(self, partition: int, low_offset: int):
+        # sporocila pod low_offset je broker ze izbrisal; zadnji starejsi vnos premaknemo na low_offset,
+        # da iskanje pred prvim ohranjenim vnosom ne preskoci ohranjenih sporocil
+        offsets = self._offsets.get(partition)
+        if not offsets or offsets[0] >= low_offset:
+            return
+        i = bisect.bisect_left(offsets, low_offset)
+        times = self._ts[partition]
+        if i < len(offsets) and offsets[i] == low_offset:
+            del offsets[:i], times[:i]
+        else:
+            del offsets[:i - 1], times[:i - 1]
+            offsets[0] = low_offset
+        if low_offset > self._high.get(partition, -1):
+            # v particiji ni vec nobenega sporocila te sobe
+            del self._offsets[partition], self._ts[partition]
+        self.first_ts = min((t[0] for t in self._ts.values()), default=None)
+        if self.first_ts is None:
+            self.last_ts = None
+
+    def lookup(self, ts_ms: int) -> Dict[int, int]:
+        # zadnji vnos pred zelenim casom; od tam naprej beremo in preskocimo starejse
+        out = {}
+        for partition, times in self._ts.items():
+            i = bisect.bisect_right(times, ts_ms) - 1
+            out[partition] = self._offsets[partition][max(i, 0)]
+        return out
+
+
+#Nit, ki gradi indeks po sobah iz kljucev in casov sporocil (vrednosti broker poslje, a jih ne razpakiramo)
+class ReplayIndexer:
+    def __init__(self, topic: str = VITALS_TOPIC, interval_s: float = REPLAY_INDEX_INTERVAL_S):
+        self.topic = topic
+        self.interval_ms = int(interval_s * 1000)
+        self._rooms: Dict[Optional[str], RoomTimeIndex] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.messages = 0
+        self.errors = 0
+        self.pruned_at: Optional[float] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ReplayIndexer")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        try:
+            consumer = Consumer(consumer_config("index"))
+            consumer.subscribe([self.topic])
+        except KafkaException as e:
+            logger.error(f"❌ Replay indexer could not start: {e}")
+            return
+        next_prune = time.monotonic() + REPLAY_PRUNE_S
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + REPLAY_PRUNE_S
+                    self._prune(consumer)
+                try:
+                    messages = consumer.consume(REPLAY_BATCH, _POLL_TIMEOUT)
+                except KafkaException as e:
+                    self.errors += 1
+                    logger.debug(f"Replay indexer poll failed: {e}")
+                    continue
+                with self._lock:
+                    for msg in messages:
+                        if msg.error():
+                            continue
+                        ts_type, ts = msg.timestamp()
+                        if ts_type == TIMESTAMP_NOT_AVAILABLE:
+                            continue
+                        room = room_of(msg.key())
+                        index = self._rooms.get(room)
+                        if index is None:
+                            index = self._rooms[room] = RoomTimeIndex(self.interval_ms)
+                        index.add(msg.partition(), ts, msg.offset())
+                    self.messages += len(messages)
+        finally:
+            consumer.close()
+
+    def _prune(self, consumer: Consumer):
+        # indeks sledi retenciji teme: vnose pod spodnjim watermarkom particije odstranimo
+        try:
+            lows = {tp.partition: consumer.get_watermark_offsets(tp, timeout=1.0, cached=False)[0]
+                    for tp in consumer.assignment()}
+        except KafkaException as e:
+            self.errors += 1
+            logger.debug(f"Replay indexer watermark lookup failed: {e}")
+            return
+        with self._lock:
+            for room in list(self._rooms):
+                index = self._rooms[room]
+                for partition, low in lows.items():
+                    index.prune(partition, low)
+                if index.first_ts is None:
+                    del self._rooms[room]
+            self.pruned_at = time.time()
+
+    def offsets(self, room_id: str, ts_ms: int) -> Optional[Dict[int, int]]:
+        with self._lock:
+            index = self._rooms.get(room_id)
+            if index is None or index.first_ts is None or ts_ms > index.last_ts:
+                return None
+            return index.lookup(ts_ms)
+
+    def room_range(self, room_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            index = self._rooms.get(room_id)
+            if index is None:
+                return None
+            return {"from": index.first_ts, "to": index.last_ts, "entries": index.entries}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": True,
+                "indexed": True,
+                "topic": self.topic,
+                "running": bool(self._thread and self._thread.is_alive()),
+                "messages": self.messages,
+                "errors": self.errors,
+                "rooms": len(self._rooms),
+                "entries": sum(index.entries for index in self._rooms.values()),
+                "pruned_at": self.pruned_at,
+            }
+
+
+#Predvajanje enega obdobja na en WebSocket; premikanje, hitrost in premor med predvajanjem
+class ReplaySession:
+    def __init__(self, websocket, room_id: str, start_ms: int, end_ms: Optional[int] = None,
+                 speed: float = 1.0, indexer: Optional[ReplayIndexer] = None, topic: str = VITALS_TOPIC):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.topic = topic
+        self.indexer = indexer
+        self.end_ms = end_ms
+        self.speed = clamp_speed(speed)
+        if start_ms is None:
+            raise ValueError("start is required")
+        self.position = start_ms
+        self._floor = start_ms
+        self._seek_to: Optional[int] = start_ms
+        self._assigned: set = set()
+        self._finished: set = set()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        # zbudi cakanje v _pace ob vsakem kontrolnem sporocilu
+        self._control = asyncio.Event()
+        self._anchor: Optional[Tuple[float, int]] = None
+        self._consumer: Optional[Consumer] = None
+        # consume in close ne smeta teci hkrati (Consumer ni varen za socasno zapiranje)
+        self._consumer_lock = threading.Lock()
+        self._stopping = False
+        self.frames_sent = 0
+
+    def control(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        if kind == "seek":
+            self._seek_to = parse_time(str(message.get("ts")))
+        elif kind == "speed":
+            self.speed = clamp_speed(float(message.get("speed", 1.0)))
+            self._anchor = None
+        elif kind == "pause":
+            self._resumed.clear()
+        elif kind == "resume":
+            self._anchor = None
+            self._resumed.set()
+        self._control.set()
+
+    def stop(self):
+        # zanka se ustavi po koncanem branju; consumer zapre sama
+        self._stopping = True
+        self._resumed.set()
+        self._control.set()
+
+    def _consume(self) -> list:
+        with self._consumer_lock:
+            return self._consumer.consume(REPLAY_BATCH, _POLL_TIMEOUT)
+
+    def _close(self, consumer: Consumer):
+        with self._consumer_lock:
+            consumer.close()
+
+    async def _wait_control(self):
+        self._control.clear()
+        await self._control.wait()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # EOF particije javi, da do konca obdobja ni vec sporocil (prazne in mirujoce particije)
+        config = consumer_config("session", **{'enable.partition.eof': True})
+        self._consumer = await loop.run_in_executor(None, Consumer, config)
+        try:
+            while not self._stopping:
+                if self._seek_to is not None:
+                    await self._seek(loop, self._seek_to)
+                    if self._done():
+                        await self._status("end")
+                        return
+                if not self._resumed.is_set():
+                    # med premorom cakamo na kontrolno sporocilo; premik se izvede takoj
+                    await self._wait_control()
+                    continue
+                messages = await loop.run_in_executor(None, self._consume)
+                for msg in messages:
+                    if self._seek_to is not None or self._stopping:
+                        break
+                    if msg.error():
+                        if msg.error().code() == KafkaError._PARTITION_EOF and self._past_end():
+                            self._finished.add(msg.partition())
+                            if self._done():
+                                await self._status("end")
+                                return
+                        continue
+                    ts = msg.timestamp()[1]
+                    if self.end_ms is not None and ts > self.end_ms:
+                        # particije so prepletene; konec sele, ko vse preidejo end
+                        self._finished.add(msg.partition())
+                        if self._done():
+                            await self._status("end")
+                            return
+                        continue
+                    if ts < self._floor or room_of(msg.key()) != self.room_id:
+                        continue
+                    envelopes = envelopes_from_value(msg.value())
+                    if not envelopes:
+                        continue
+                    if not await self._pace(ts):
+                        break
+                    self.position = ts
+                    await self.websocket.send_text(json.dumps(envelopes, separators=(",", ":")))
+                    self.frames_sent += 1
+        finally:
+            # tudi ob preklicu: _close pocaka, da se morebitno branje v niti konca
+            consumer, self._consumer = self._consumer, None
+            await loop.run_in_executor(None, self._close, consumer)
+
+    async def _seek(self, loop, ts_ms: int):
+        self._seek_to = None
+        self.position = self._floor = ts_ms
+        self._anchor = None
+        self._finished.clear()
+        offsets = self.indexer.offsets(self.room_id, ts_ms) if self.indexer else None
+        if offsets is not None:
+            partitions = [TopicPartition(self.topic, p, o) for p, o in offsets.items()]
+            source = "index"
+        else:
+            # soba se ni indeksirana: offsets_for_times na vseh particijah teme
+            partitions = await loop.run_in_executor(None, self._offsets_for_times, ts_ms)
+            source = "broker"
+        self._consumer.assign(partitions)
+        self._assigned = {tp.partition for tp in partitions}
+        # particije brez sporocil po ts_ms (offsets_for_times ni nasel offseta) so ze koncane
+        self._finished = {tp.partition for tp in partitions if tp.offset == OFFSET_END}
+        await self._status("seek", source=source)
+
+    def _past_end(self) -> bool:
+        # EOF pomeni konec le, ce je konec obdobja ze mimo; sicer lahko pridejo se nova sporocila
+        return self.end_ms is not None and self.end_ms <= time.time() * 1000
+
+    def _done(self) -> bool:
+        return self.end_ms is not None and self._finished >= self._assigned
+
+    def _offsets_for_times(self, ts_ms: int) -> List[TopicPartition]:
+        metadata = self._consumer.list_topics(self.topic, timeout=5.0)
+        topic = metadata.topics.get(self.topic)
+        if topic is None or topic.error is not None:
+            raise KafkaException(f"Topic {self.topic} not available")
+        query = [TopicPartition(self.topic, p, ts_ms) for p in topic.partitions]
+        # offset -1 (ni novejsih sporocil) pomeni konec particije
+        return [tp if tp.offset >= 0 else TopicPartition(self.topic, tp.partition, OFFSET_END)
+                for tp in self._consumer.offsets_for_times(query, timeout=5.0)]
+
+    async def _pace(self, ts: int) -> bool:
+        # sidro (stenski cas, cas posnetka); prvo sporocilo po premiku gre takoj.
+        # Cakanje prekine kontrolno sporocilo; False pomeni, da je na vrsti premik ali konec.
+        while True:
+            if self._seek_to is not None or self._stopping:
+                return False
+            if not self._resumed.is_set():
+                await self._wait_control()
+                continue
+            if self._anchor is None:
+                self._anchor = (time.monotonic(), ts)
+                return True
+            wall0, media0 = self._anchor
+            delay = wall0 + (ts - media0) / 1000.0 / self.speed - time.monotonic()
+            if delay <= 0:
+                return True
+            self._control.clear()
+            try:
+                await asyncio.wait_for(self._control.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                return True
+
+    async def _status(self, state: str, **extra):
+        await self.websocket.send_text(json.dumps({
+            "type": "replay_status",
+            "state": state,
+            "room_id": self.room_id,
+            "position": self.position,
+            "speed": self.speed,
+            **extra,
+        }))
+
+
+def clamp_speed(speed: float) -> float:
+    return min(max(speed, 1.0), REPLAY_MAX_SPEED)
+
+
+replay_indexer = ReplayIndexer() if REPLAY and REPLAY_INDEX else None
@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# Seznam sob: SDC_ROOMS_FILE (JSON datoteka) ali SDC_ROOMS (JSON niz), oblika:
+#   [{"room_id": "...", "device_uuids": ["..."], "targets": ["host:port", ...]}]
+# Ce ni nastavljeno, se uporabi stara konfiguracija ROOM_UUID + DEVICE_UUIDS + SDC_TARGETS.
+ROOMS_FILE = os.getenv("SDC_ROOMS_FILE")
+ROOMS_JSON = os.getenv("SDC_ROOMS")
+
+
+def normalize_epr(uuid: str) -> str:
+    return uuid if uuid.startswith("urn:uuid:") else f"urn:uuid:{uuid}"
+
+
+@dataclass
+class RoomConfig:
+    room_id: str
+    target_eprs: List[str] = field(default_factory=list)
+    targets: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, raw: Dict) -> "RoomConfig":
+        room_id = raw.get("room_id")
+        devices = raw.get("device_uuids", [])
+        if not room_id:
+            raise ValueError("room_id is required")
+        if not isinstance(devices, list):
+            raise ValueError(f"device_uuids for room {room_id} must be a JSON list")
+        return cls(
+            room_id=room_id,
+            target_eprs=[normalize_epr(u) for u in devices],
+            targets=list(raw.get("targets", [])),
+        )
+
+
+def _load_legacy_room() -> List[RoomConfig]:
+    room_id = os.getenv("ROOM_UUID")
+    device_list = os.getenv("DEVICE_UUIDS", "[]")
+    try:
+        raw = json.loads(device_list)
+        if not isinstance(raw, list):
+            raise ValueError("must be a JSON list")
+    except ValueError as e:
+        raise RuntimeError(f"Invalid DEVICE_UUIDS: {device_list!r} — {e}")
+
+    if not room_id and not raw:
+        return []
+    if not room_id:
+        logger.warning("⚠️ Okoljska spremenljivka ROOM_UUID ni nastavljena, uporabljam 'default'")
+    targets = [t for t in os.getenv("SDC_TARGETS", "").split(",") if t]
+    return [RoomConfig(room_id=room_id or "default", target_eprs=[normalize_epr(u) for u in raw], targets=targets)]
+
+
+def load_room_configs() -> List[RoomConfig]:
+    try:
+        if ROOMS_FILE:
+            with open(ROOMS_FILE, encoding="utf-8") as f:
+                raw = json.load(f)
+        elif ROOMS_JSON:
+            raw = json.loads(ROOMS_JSON)
+        else:
+            return _load_legacy_room()
+        if not isinstance(raw, list):
+            raise ValueError("must be a JSON list of rooms")
+        return [RoomConfig.from_dict(r) for r in raw]
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Invalid room configuration: {e}")
+
+
+#Register sob, ki jih streze ta proces
+class RoomRegistry:
+    def __init__(self):
+        self._rooms: Dict[str, RoomConfig] = {}
+        self._epr_to_room: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, Optional[RoomConfig]], None]] = []
+
+    def load(self, configs: List[RoomConfig]):
+        for config in configs:
+            self.add_room(config)
+
+    def add_listener(self, listener: Callable[[str, Optional[RoomConfig]], None]):
+        self._listeners.append(listener)
+
+    def add_room(self, config: RoomConfig):
+        with self._lock:
+            for epr in config.target_eprs:
+                owner = self._epr_to_room.get(epr)
+                if owner and owner != config.room_id:
+                    raise ValueError(f"Device {epr} is already assigned to room {owner}")
+            old = self._rooms.get(config.room_id)
+            if old:
+                for epr in old.target_eprs:
+                    self._epr_to_room.pop(epr, None)
+            self._rooms[config.room_id] = config
+            for epr in config.target_eprs:
+                self._epr_to_room[epr] = config.room_id
+        self._notify(config.room_id, config)
+
+    def remove_room(self, room_id: str):
+        with self._lock:
+            config = self._rooms.pop(room_id, None)
+            if not config:
+                return
+            for epr in config.target_eprs:
+                self._epr_to_room.pop(epr, None)
+        self._notify(room_id, None)
+
+    def get(self, room_id: str) -> Optional[RoomConfig]:
+        return self._rooms.get(room_id)
+
+    def room_for_epr(self, epr: str) -> Optional[str]:
+        return self._epr_to_room.get(epr)
+
+    def rooms(self) -> List[RoomConfig]:
+        with self._lock:
+            return list(self._rooms.values())
+
+    def _notify(self, room_id: str, config: Optional[RoomConfig]):
+        for listener in self._listeners:
+            try:
+                listener(room_id, config)
+            except Exception as e:
+                logger.error(f"❌ Room registry listener failed for {room_id}: {e}")
+
+
+room_registry = RoomRegistry()
@@ -0,0 +1,139 @@
+import os
+import json
+import pathlib
+import threading
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DIR = pathlib.Path(os.getenv("SDC_SCHEMA_DIR", pathlib.Path(__file__).parent.parent / "schemas"))
+
+FIELD_TYPES = {"uint8", "uint16", "uint32", "int64", "float64", "string", "bytes"}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def validate_schema(schema: Dict[str, Any]):
+    for key in ("subject", "version", "id", "fields"):
+        if key not in schema:
+            raise SchemaError(f"Schema is missing '{key}'")
+    for section in ("header", "fields"):
+        names = set()
+        for field in schema.get(section, []):
+            if field.get("type") not in FIELD_TYPES:
+                raise SchemaError(f"Unknown type {field.get('type')!r} for field {field.get('name')!r}")
+            if field["name"] in names:
+                raise SchemaError(f"Duplicate field {field['name']!r} in {section}")
+            names.add(field["name"])
+
+
+NAMES_FILE = "names.json"
+
+
+#Lokalna shramba shem (<dir>/<subject>/v<N>.json), nadomestek za schema registry.
+#Ob shemah hrani se slovar id -> ime (<dir>/<subject>/names.json) za zapise, ki nizov ne nosijo.
+class FileSchemaStore:
+    def __init__(self, directory: pathlib.Path = SCHEMA_DIR):
+        self.directory = pathlib.Path(directory)
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_subject: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._names: Dict[str, Dict[int, str]] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_subject.clear()
+            self._names.clear()
+            for path in sorted(self.directory.glob("*/v*.json")):
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        schema = json.load(f)
+                    validate_schema(schema)
+                    self._add(schema)
+                except (OSError, ValueError) as e:
+                    logger.error(f"❌ Invalid schema file {path}: {e}")
+            for path in sorted(self.directory.glob(f"*/{NAMES_FILE}")):
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        self._names[path.parent.name] = {int(k): v for k, v in json.load(f).items()}
+                except (OSError, ValueError) as e:
+                    logger.error(f"❌ Invalid names file {path}: {e}")
+
+    def _add(self, schema: Dict[str, Any]):
+        existing = self._by_id.get(schema["id"])
+        if existing and existing["subject"] != schema["subject"]:
+            raise SchemaError(f"Schema id {schema['id']} is already used by {existing['subject']}")
+        self._by_id[schema["id"]] = schema
+        self._by_subject.setdefault(schema["subject"], {})[schema["version"]] = schema
+
+    def get_by_id(self, schema_id: int) -> Dict[str, Any]:
+        schema = self._by_id.get(schema_id)
+        if schema is None:
+            raise SchemaError(f"Unknown schema id {schema_id}")
+        return schema
+
+    def latest(self, subject: str) -> Dict[str, Any]:
+        versions = self._by_subject.get(subject)
+        if not versions:
+            raise SchemaError(f"No schema registered for subject {subject!r}")
+        return versions[max(versions)]
+
+    def versions(self, subject: str) -> List[int]:
+        return sorted(self._by_subject.get(subject, {}))
+
+    def register(self, subject: str, header: List[Dict[str, str]], fields: List[Dict[str, str]]) -> Dict[str, Any]:
+        with self._lock:
+            versions = self._by_subject.get(subject, {})
+            if versions:
+                current = versions[max(versions)]
+                if current.get("header", []) == header and current["fields"] == fields:
+                    return current
+            schema = {
+                "subject": subject,
+                "version": max(versions, default=0) + 1,
+                "id": max(self._by_id, default=0) + 1,
+                "header": header,
+                "fields": fields,
+            }
+            validate_schema(schema)
+            path = self.directory / subject / f"v{schema['version']}.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(schema, f, indent=2)
+            self._add(schema)
+            return schema
+
+
+    def name_for(self, subject: str, name_id: int) -> Optional[str]:
+        return self._names.get(subject, {}).get(name_id)
+
+    def register_names(self, subject: str, names: Dict[int, str]) -> int:
+        # samo dopisujemo: id-ji so stabilni (crc32), zato obstojecih vnosov ne spreminjamo
+        with self._lock:
+            known = self._names.setdefault(subject, {})
+            new = {k: v for k, v in names.items() if k not in known}
+            if not new:
+                return 0
+            known.update(new)
+            path = self.directory / subject / NAMES_FILE
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({str(k): v for k, v in sorted(known.items())}, f, indent=0)
+            os.replace(tmp, path)
+            return len(new)
+
+
+_schema_store: Optional[FileSchemaStore] = None
+
+
+def get_schema_store() -> FileSchemaStore:
+    global _schema_store
+    if _schema_store is None:
+        _schema_store = FileSchemaStore()
+    return _schema_store
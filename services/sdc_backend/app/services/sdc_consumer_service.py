@@ -1,45 +1,110 @@
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, List, Optional
 import asyncio
 import os
 import logging
-from datetime import datetime, timezone
+from datetime import datetime
 from decimal import Decimal
 import json
-from confluent_kafka import Producer
 from concurrent.futures import ThreadPoolExecutor
 import time
 
 from app.services import consumers
+from app.services.batching import ReportBatcher
+from app.services.kafka_producer import KafkaProducerPipeline
+from app.services.waveform_codec import WaveformChunk, ENCODINGS, encode_chunk
+from app.services import record_codec
+from app.services.influx_sink import InfluxLineSink, INFLUX_URL
+from app.services.latency import latency_tracker, STAGE_DEQUEUE, STAGE_KAFKA_ENQUEUE
+from app.services.log_setup import log_counters
+from app.services.latest_values import latest_values
+from app.services.trends import trend_store
+from app.services.ecg_analysis import EcgAnalysisStage, ECG_ANALYSIS
+from app.services.deadband import DeadbandFilter, DEADBAND
+from app.services.descriptor_index import descriptor_index
+from app.services.recorder import SessionRecorder, RECORDER
 
 logger = logging.getLogger(__name__)
 
+# "report" = ena ovojnica na MDIB porocilo, "handle" = stara oblika (ena na handle)
+INGEST_MODE = os.getenv("SDC_INGEST_MODE", "report").lower()
+BATCH_WINDOW_MS = float(os.getenv("SDC_BATCH_WINDOW_MS", "0"))
+
+WAVEFORM_ENCODING = ENCODINGS[os.getenv("SDC_WAVEFORM_ENCODING", "int16").lower()]
+WAVEFORM_DEFAULT_SCALE = float(os.getenv("SDC_WAVEFORM_SCALE", "0.001"))
+
+# "json" = dosedanji zapisi (Telegraf), "binary" = kompaktni zapisi po shemi (app/schemas)
+KAFKA_FORMAT = os.getenv("SDC_KAFKA_FORMAT", "json").lower()
+if KAFKA_FORMAT not in ("json", "binary"):
+    raise RuntimeError(f"Invalid SDC_KAFKA_FORMAT: {KAFKA_FORMAT!r}")
+
 class MinimalOptimizedSDCConsumerService:
     def __init__(self):
         self._consumer_task: asyncio.Task | None = None
         self._is_running = False
         self._data_callbacks: list[Callable[[Dict[str, Any]], None]] = []
+        self._waveform_callbacks: list[Callable[[bytes, Optional[str], Optional[str], str], None]] = []
+        self._device_removed_callbacks: list[Callable[[Optional[str], str], None]] = []
         
         self._thread_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="SDC-Async")
+        self._batcher = ReportBatcher(BATCH_WINDOW_MS / 1000.0, self._submit_batch)
         
-        self.producer = Producer({
-            'bootstrap.servers': '127.0.0.1:9092',
-            'batch.size': 8192,
-            'linger.ms': 5,  
-            'acks': 1,       
-            'retries': 2,
-        })
-
-    def add_data_callback(self, callback: Callable[[Dict[str, Any]], None]):
+        self.kafka = KafkaProducerPipeline()
+        self._record_encoder = record_codec.get_encoder() if KAFKA_FORMAT == "binary" else None
+        self.influx = InfluxLineSink(INFLUX_URL, unit_lookup=descriptor_index.unit,
+                                     type_lookup=descriptor_index.device_type) if INFLUX_URL else None
+        # izpeljane meritve gredo po isti poti kot meritve naprav
+        self.ecg = EcgAnalysisStage(self._batcher.add) if ECG_ANALYSIS else None
+        self.deadband = DeadbandFilter() if DEADBAND else None
+        self.recorder = SessionRecorder() if RECORDER else None
+
+    def add_data_callback(self, callback: Callable[[List[Dict[str, Any]]], None]):
         self._data_callbacks.append(callback)
 
-    def remove_data_callback(self, callback: Callable[[Dict[str, Any]], None]):
+    def remove_data_callback(self, callback: Callable[[List[Dict[str, Any]]], None]):
         if callback in self._data_callbacks:
             self._data_callbacks.remove(callback)
 
+    def add_waveform_callback(self, callback: Callable[[bytes, Optional[str], Optional[str], str], None]):
+        self._waveform_callbacks.append(callback)
+
+    def remove_waveform_callback(self, callback: Callable[[bytes, Optional[str], Optional[str], str], None]):
+        if callback in self._waveform_callbacks:
+            self._waveform_callbacks.remove(callback)
+
+    def add_device_removed_callback(self, callback: Callable[[Optional[str], str], None]):
+        self._device_removed_callbacks.append(callback)
+
+    def _on_device_removed(self, room_id: Optional[str], epr: str):
+        # stanje po napravi sprostimo takoj; zgodovina v Kafki in posnetkih ostane
+        latest_values.remove_device(room_id, epr)
+        trend_store.remove_device(room_id, epr)
+        latency_tracker.remove_device(room_id, epr)
+        if self.ecg:
+            self.ecg.remove_device(room_id, epr)
+        if self.deadband:
+            self.deadband.remove_device(epr)
+        for callback in self._device_removed_callbacks:
+            try:
+                callback(room_id, epr)
+            except Exception as e:
+                logger.error(f"❌ Error in device removed callback: {e}", extra={"room_id": room_id, "epr": epr})
+
+    def _on_descriptors_changed(self, room_id: Optional[str], epr: str, handles: List[str]):
+        if self.deadband:
+            self.deadband.remove_device(epr, handles)
+
     async def start(self):
         if self._is_running:
             return
         self._is_running = True
+        self.kafka.start()
+        if self.influx:
+            self.influx.start()
+        if self.recorder:
+            self.recorder.start()
+        if self.ecg:
+            self.ecg.start()
+        self._batcher.start()
         self._consumer_task = asyncio.create_task(self._run())
 
     async def stop(self):
@@ -53,36 +118,112 @@ class MinimalOptimizedSDCConsumerService:
             except asyncio.CancelledError:
                 pass
         
+        if self.ecg:
+            self.ecg.stop()
+        self._batcher.stop()
         self._thread_pool.shutdown(wait=True)
         
-        self.producer.flush(timeout=5.0)
+        self.kafka.stop(timeout=5.0)
+        if self.influx:
+            self.influx.stop(timeout=5.0)
+        if self.recorder:
+            self.recorder.stop()
 
     async def _run(self):
-        def fast_metric_callback(metrics_by_handle: dict):
+        def fast_metric_callback(metrics_by_handle: dict, epr: Optional[str] = None, room_id: Optional[str] = None):
             try:
+                ts = int(time.time() * 1000)
+                values = {}
+                # cas dolocitve na napravi (ns), ce ga naprava poslje
+                dts = {}
+                descriptors = {}
+
                 for handle, metric in metrics_by_handle.items():
                     try:
                         value = metric.MetricValue.Value if metric.MetricValue else None
                         if isinstance(value, Decimal):
                             value = float(value)
+                        values[handle] = value
+                        descriptors[handle] = getattr(metric, 'descriptor_container', None)
+                        determination_time = metric.MetricValue.DeterminationTime if metric.MetricValue else None
+                        if determination_time:
+                            dts[handle] = int(float(determination_time) * 1_000_000_000)
                         
-                        logger.info(f"📊 Processing metric - Handle: {handle}, Value: {value}")
-                        
-                        data = {
+                    except Exception as e:
+                        log_counters.count("metric_errors")
+                        logger.error(f"❌ Error processing metric: {e}",
+                                     extra={"room_id": room_id, "epr": epr, "handle": handle})
+
+                if not values:
+                    return
+
+                log_counters.count("metric_reports")
+                log_counters.count("metric_values", len(values))
+
+                if self.deadband:
+                    # filter tece pred omreznimi ponori (_submit_batch), pravila pa iz deskriptorjev tu
+                    self.deadband.learn(epr, descriptors)
+
+                # kompaktni id in tip naprave nosijo samo binarni zapisi (glava v2), JSON ostane kratek
+                if INGEST_MODE == "handle":
+                    for handle, value in values.items():
+                        env = {
                             "device_id": handle,
-                            "timestamp": datetime.now().isoformat(),
+                            "device_epr": epr,
+                            "ts": ts,
                             "metrics": {handle: value}
                         }
-                        
-                        self._thread_pool.submit(self._handle_device_data_async, data)
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Error processing metric {handle}: {e}")
+                        if handle in dts:
+                            env["dts"] = {handle: dts[handle]}
+                        self._batcher.add(room_id, env)
+                else:
+                    env = {
+                        "device_epr": epr,
+                        "ts": ts,
+                        "metrics": values
+                    }
+                    if dts:
+                        env["dts"] = dts
+                    self._batcher.add(room_id, env)
                         
             except Exception as e:
-                logger.error(f"❌ Error in fast metric callback: {e}")
+                logger.error(f"❌ Error in fast metric callback: {e}", extra={"room_id": room_id, "epr": epr})
+
+        def fast_waveform_callback(waveform_by_handle: dict, epr: Optional[str] = None, room_id: Optional[str] = None):
+            for handle, state in waveform_by_handle.items():
+                try:
+                    value = state.MetricValue
+                    if value is None or not value.Samples:
+                        continue
+
+                    resolution = getattr(state.descriptor_container, 'Resolution', None)
+                    period = getattr(state.descriptor_container, 'SamplePeriod', None)
+                    chunk = WaveformChunk(
+                        handle=handle,
+                        t0=float(value.DeterminationTime or time.time()),
+                        sample_period=float(period) if period else 0.0,
+                        samples=value.Samples,
+                        device=epr or "",
+                    )
+                    scale = float(resolution) if resolution else WAVEFORM_DEFAULT_SCALE
+                    encoded = encode_chunk(chunk, scale, WAVEFORM_ENCODING)
+
+                    # WebSocket in okno EKG takoj (vrstni red kosov naprave ostane), Kafka v bazenu
+                    self._dispatch_waveform(encoded, room_id, epr, handle)
+                    self._thread_pool.submit(self._handle_waveform_async, encoded, room_id, epr, handle, chunk.t0)
+                    log_counters.count("waveform_chunks")
+                    if self.ecg:
+                        self._feed_ecg(encoded, room_id, epr, handle)
+
+                except Exception as e:
+                    log_counters.count("waveform_errors")
+                    logger.error(f"❌ Error processing waveform: {e}",
+                                 extra={"room_id": room_id, "epr": epr, "handle": handle})
 
         consumers.on_metric_update = fast_metric_callback
+        consumers.on_waveform_update = fast_waveform_callback
+        consumers.on_device_removed = self._on_device_removed
+        consumers.on_descriptors_changed = self._on_descriptors_changed
         await asyncio.sleep(0.1)
         
         if hasattr(consumers, 'rebind_callbacks'):
@@ -95,33 +236,106 @@ class MinimalOptimizedSDCConsumerService:
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, consumers.run_multi_provider_consumer)
 
-    def _handle_device_data_async(self, data: Dict[str, Any]):
-        try:
-            start_time = time.time()
-            
-            if 'timestamp' not in data:
-                data['timestamp'] = datetime.now(timezone.utc).isoformat()
-
-            room_id = os.getenv('ROOM_UUID')
+    def _submit_batch(self, room_id: Optional[str], batch: List[Dict[str, Any]]):
+        # tece v niti obvestil (ali batcherja): paket dokoncamo tu in ga takoj predamo
+        # povratnim klicem (WebSocket); pocasnejsi ponori (Kafka, Influx, trendi) v bazenu
+        now_ms = int(time.time() * 1000)
+        for data in batch:
+            if 'ts' not in data:
+                data['ts'] = now_ms
             if room_id:
                 data['room_id'] = room_id
-            else:
-                logger.warning("⚠️ Okoljska spremenljivka ROOM_ID ni nastavljena")
-
-            self.kafka_send(data)
+        # po prvem posredovanju ovojnic ne spreminjamo vec (berejo jih razlicne niti)
+        try:
+            latest_values.update(batch)
+        except Exception as e:
+            logger.error(f"❌ Error updating latest values: {e}", extra={"room_id": room_id})
 
+        network_batch = self._network_batch(room_id, batch)
+        if network_batch:
             for callback in self._data_callbacks:
                 try:
-                    callback(data)
+                    callback(network_batch)
                 except Exception as e:
                     logger.error(f"❌ Error in data callback: {e}")
-            
+
+        self._thread_pool.submit(self._handle_device_data_async, room_id, batch, network_batch)
+
+    def _network_batch(self, room_id: Optional[str], batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # deadband samo za WebSocket in Kafko; trendi, posnetki in Influx dobijo vse vrednosti
+        if not self.deadband:
+            return batch
+        out = []
+        suppressed = 0
+        for data in batch:
+            metrics = data.get("metrics") or {}
+            if data.get("derived") or not metrics:
+                out.append(data)
+                continue
+            passed = self.deadband.filter(room_id, data.get("device_epr"), metrics)
+            if len(passed) == len(metrics):
+                out.append(data)
+                continue
+            suppressed += len(metrics) - len(passed)
+            if not passed:
+                continue
+            # kopija: izvirna ovojnica je ze pri ostalih ponorih
+            env = {**data, "metrics": passed}
+            if "dts" in data:
+                env["dts"] = {h: v for h, v in data["dts"].items() if h in passed}
+            out.append(env)
+        if suppressed:
+            log_counters.count("metric_suppressed", suppressed)
+        return out
+
+    def _handle_device_data_async(self, room_id: Optional[str], batch: List[Dict[str, Any]],
+                                  network_batch: List[Dict[str, Any]]):
+        try:
+            start_time = time.time()
+
+            trend_store.add(batch)
+            if self.recorder:
+                self.recorder.add(batch)
+            latency_tracker.observe_provider(batch)
+            latency_tracker.observe_envelopes(batch, STAGE_DEQUEUE, start_time)
+
+            if network_batch:
+                self.kafka_send(network_batch)
+            if self.influx:
+                self.influx.write(batch)
+
             processing_time = time.time() - start_time
-            logger.debug(f"📤 Data processed in {processing_time:.3f}s: {data}")
+            logger.debug(f"📤 Batch of {len(batch)} processed in {processing_time:.3f}s")
             
         except Exception as e:
             logger.error(f"❌ Error in async data handling: {e}")
     
+    def _handle_waveform_async(self, encoded: bytes, room_id: Optional[str], epr: Optional[str], handle: str, t0: float):
+        try:
+            if self._record_encoder:
+                info = descriptor_index.get(epr, handle)
+                record = record_codec.waveform_record(encoded, t0, handle, info)
+                header = record_codec.record_header(room_id, epr, info.device_type if info else None)
+                value = self._record_encoder.encode(header, [record])
+            else:
+                value = encoded
+            self.kafka.send_waveform(value, room_id, epr)
+        except Exception as e:
+            logger.error(f"❌ Error sending waveform to Kafka: {e}")
+
+    def _feed_ecg(self, encoded: bytes, room_id: Optional[str], epr: Optional[str], handle: str):
+        try:
+            self.ecg.feed(encoded, room_id, epr, handle)
+        except Exception as e:
+            logger.error(f"❌ Error feeding ECG analysis: {e}", extra={"room_id": room_id, "epr": epr, "handle": handle})
+
+    def _dispatch_waveform(self, encoded: bytes, room_id: Optional[str], epr: Optional[str], handle: str):
+        for callback in self._waveform_callbacks:
+            try:
+                callback(encoded, room_id, epr, handle)
+            except Exception as e:
+                logger.error(f"❌ Error in waveform callback: {e}")
+
     def _json_serializer(self, obj):
         if isinstance(obj, Decimal):
             return float(obj)
@@ -129,17 +343,29 @@ class MinimalOptimizedSDCConsumerService:
             return obj.isoformat()
         raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
     
-    def kafka_send(self, data: Dict[str, Any]):
-        try:
-            topic = "medical-device-data"
-            json_data = json.dumps(data, default=self._json_serializer)
-            
-            self.producer.produce(topic, json_data.encode('utf-8'))
-            
-            self.producer.poll(0)
-            
-            logger.debug(f"✅ Successfully sent data to Kafka topic {topic}")
-        except Exception as e:
-            logger.error(f"❌ Error sending data to Kafka: {e}")
+    def kafka_send(self, batch: List[Dict[str, Any]]):
+        # en zapis na napravo, kljuc room|epr ohrani vrstni red na particiji
+        by_device: Dict[tuple, List[Dict[str, Any]]] = {}
+        for data in batch:
+            by_device.setdefault((data.get('room_id'), data.get('device_epr')), []).append(data)
+
+        for (room_id, device_epr), envelopes in by_device.items():
+            try:
+                if self._record_encoder:
+                    records = []
+                    for envelope in envelopes:
+                        records.extend(record_codec.records_from_envelope(envelope, descriptor_index.get))
+                    device_type = descriptor_index.device_type(device_epr, envelopes[0].get('metrics', {}))
+                    header = record_codec.record_header(room_id, device_epr, device_type)
+                    value = self._record_encoder.encode(header, records)
+                else:
+                    payload = envelopes[0] if len(envelopes) == 1 else envelopes
+                    value = json.dumps(payload, default=self._json_serializer).encode('utf-8')
+                now = time.time()
+                latency_tracker.observe_envelopes(envelopes, STAGE_KAFKA_ENQUEUE, now)
+                arrival = min((e['ts'] for e in envelopes if 'ts' in e), default=now * 1000) / 1000.0
+                self.kafka.send_vitals(value, room_id, device_epr, arrival)
+            except Exception as e:
+                logger.error(f"❌ Error sending data to Kafka: {e}")
 
 sdc_consumer_service = MinimalOptimizedSDCConsumerService()
\ No newline at end of file
@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+import numpy as np
+
+# Zgodovina trendov v pomnilniku (brez poizvedbe v Influx):
+#   SDC_TREND_WINDOW_S    koliko casa hranimo na handle (s)
+#   SDC_TREND_BLOCK       st. tock v odprtem bloku, preden ga stisnemo
+#   SDC_TREND_ROOM_BYTES  zgornja meja pomnilnika na sobo; ob prekoracitvi odvrzemo najstarejse bloke
+TREND_WINDOW_S = float(os.getenv("SDC_TREND_WINDOW_S", "1800"))
+TREND_BLOCK = int(os.getenv("SDC_TREND_BLOCK", "120"))
+TREND_ROOM_BYTES = int(os.getenv("SDC_TREND_ROOM_BYTES", str(8 * 1024 * 1024)))
+TREND_DEFAULT_POINTS = 600
+TREND_MAX_POINTS = 10000
+
+METHOD_LTTB = "lttb"
+METHOD_MINMAX = "minmax"
+METHOD_RAW = "raw"
+METHODS = (METHOD_LTTB, METHOD_MINMAX, METHOD_RAW)
+
+_COLS = np.arange(8)
+
+
+# Besede (uint64) zapisemo kot glavo (vodilni << 4 | koncni nicelni bajti) in
+# samo srednje bajte; to je bajtna razlicica Gorilla XOR kodiranja.
+def _pack_words(words: np.ndarray, trailing: bool) -> Tuple[bytes, bytes]:
+    b = words.astype(">u8").view(np.uint8).reshape(-1, 8)
+    nonzero = b != 0
+    any_set = nonzero.any(axis=1)
+    lead = np.where(any_set, nonzero.argmax(axis=1), 8)
+    trail = np.where(any_set, nonzero[:, ::-1].argmax(axis=1), 0) if trailing else np.zeros_like(lead)
+    mask = (_COLS >= lead[:, None]) & (_COLS < (8 - trail)[:, None])
+    header = ((lead << 4) | trail).astype(np.uint8)
+    return header.tobytes(), b[mask].tobytes()
+
+
+def _unpack_words(header: bytes, payload: bytes) -> np.ndarray:
+    h = np.frombuffer(header, dtype=np.uint8)
+    lead = (h >> 4).astype(np.int64)
+    trail = (h & 0x0F).astype(np.int64)
+    mask = (_COLS >= lead[:, None]) & (_COLS < (8 - trail)[:, None])
+    b = np.zeros((len(h), 8), dtype=np.uint8)
+    b[mask] = np.frombuffer(payload, dtype=np.uint8)
+    return b.view(">u8").reshape(-1).astype(np.uint64)
+
+
+#Stisnjen, nespremenljiv blok: casi kot delta-of-delta (zigzag), vrednosti kot XOR s prejsnjo
+class CompressedBlock:
+    __slots__ = ("t_first", "t_last", "count", "t_header", "t_payload", "v_header", "v_payload")
+
+    def __init__(self, ts: np.ndarray, values: np.ndarray):
+        self.t_first = int(ts[0])
+        self.t_last = int(ts[-1])
+        self.count = len(ts)
+
+        deltas = np.diff(ts, prepend=ts[0])
+        dod = np.diff(deltas, prepend=0)
+        zigzag = ((dod << 1) ^ (dod >> 63)).view(np.uint64)
+        self.t_header, self.t_payload = _pack_words(zigzag, trailing=False)
+
+        bits = values.view(np.uint64)
+        xors = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+        self.v_header, self.v_payload = _pack_words(xors, trailing=True)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.t_header) + len(self.t_payload) + len(self.v_header) + len(self.v_payload) + 64
+
+    def decode(self) -> Tuple[np.ndarray, np.ndarray]:
+        zigzag = _unpack_words(self.t_header, self.t_payload)
+        dod = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+        ts = self.t_first + np.cumsum(np.cumsum(dod))
+        values = np.bitwise_xor.accumulate(_unpack_words(self.v_header, self.v_payload)).view(np.float64)
+        return ts, values
+
+
+#Ena casovna vrsta: odprt blok (NumPy polji) + krozna vrsta stisnjenih blokov
+class TrendSeries:
+    __slots__ = ("ts", "values", "count", "blocks", "last_ts")
+
+    def __init__(self):
+        self.ts = np.empty(TREND_BLOCK, dtype=np.int64)
+        self.values = np.empty(TREND_BLOCK, dtype=np.float64)
+        self.count = 0
+        self.blocks: deque = deque()
+        self.last_ts = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.ts.nbytes + self.values.nbytes + sum(block.nbytes for block in self.blocks)
+
+    def append(self, ts_ms: int, value: float) -> Optional[CompressedBlock]:
+        if self.last_ts is not None and ts_ms < self.last_ts:
+            return None
+        self.last_ts = ts_ms
+        self.ts[self.count] = ts_ms
+        self.values[self.count] = value
+        self.count += 1
+        if self.count < TREND_BLOCK:
+            return None
+        block = CompressedBlock(self.ts, self.values)
+        self.blocks.append(block)
+        self.count = 0
+        return block
+
+    def prune(self, cutoff_ms: int) -> int:
+        freed = 0
+        while self.blocks and self.blocks[0].t_last < cutoff_ms:
+            freed += self.blocks.popleft().nbytes
+        return freed
+
+    def read(self, start_ms: int, end_ms: int) -> Tuple[List[CompressedBlock], Tuple[np.ndarray, np.ndarray]]:
+        # bloke zberemo pod zaklepom, dekodiramo pa brez njega (bloki so nespremenljivi)
+        parts = [block for block in self.blocks if block.t_last >= start_ms and block.t_first <= end_ms]
+        hot = (self.ts[:self.count].copy(), self.values[:self.count].copy())
+        return parts, hot
+
+
+def _decode_parts(parts: List[CompressedBlock], hot: Tuple[np.ndarray, np.ndarray],
+                  start_ms: int, end_ms: int) -> Tuple[np.ndarray, np.ndarray]:
+    decoded = [block.decode() for block in parts] + [hot]
+    ts = np.concatenate([d[0] for d in decoded])
+    values = np.concatenate([d[1] for d in decoded])
+    lo, hi = np.searchsorted(ts, start_ms, "left"), np.searchsorted(ts, end_ms, "right")
+    return ts[lo:hi], values[lo:hi]
+
+
+def lttb(ts: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(ts)
+    if points >= n or points < 3:
+        return ts, values
+    # povprecja razredov izracunamo vnaprej; zanka je v cistem Pythonu, ker so razredi majhni
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    x = (ts - ts[0]).astype(np.float64)
+    counts = np.diff(np.append(edges, n))
+    avg_x = (np.add.reduceat(x, edges) / counts).tolist()
+    avg_y = (np.add.reduceat(values, edges) / counts).tolist()
+    xs, ys, bounds = x.tolist(), values.tolist(), edges.tolist()
+
+    selected = [0]
+    a = 0
+    for i in range(points - 2):
+        ax, ay = xs[a], ys[a]
+        bx, by = avg_x[i + 1], avg_y[i + 1]
+        best, best_area = bounds[i], -1.0
+        for j in range(bounds[i], bounds[i + 1]):
+            area = abs((ax - bx) * (ys[j] - ay) - (ax - xs[j]) * (by - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return ts[selected], values[selected]
+
+
+def minmax_buckets(ts: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # casovni razredi (en na piksel): zacetek razreda, min in max
+    if not len(ts):
+        return ts, values, values
+    edges = np.linspace(ts[0], ts[-1] + 1, points + 1)
+    starts = np.unique(np.searchsorted(ts, edges[:-1], "left"))
+    starts = starts[starts < len(ts)]
+    return ts[starts], np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+
+class TrendStore:
+    def __init__(self, window_s: float = TREND_WINDOW_S, room_bytes: int = TREND_ROOM_BYTES):
+        self.window_ms = int(window_s * 1000)
+        self.room_bytes = room_bytes
+        self._series: Dict[str, Dict[Tuple[str, str], TrendSeries]] = {}
+        self._bytes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.points_added = 0
+        self.blocks_evicted = 0
+
+    def add(self, batch: List[Dict[str, Any]]):
+        with self._lock:
+            for envelope in batch:
+                room_id = envelope.get("room_id") or ""
+                device_epr = envelope.get("device_epr") or ""
+                ts = envelope.get("ts") or int(time.time() * 1000)
+                dts = envelope.get("dts") or {}
+                room = self._series.setdefault(room_id, {})
+                for handle, value in envelope.get("metrics", {}).items():
+                    if not isinstance(value, (int, float)) or isinstance(value, bool):
+                        continue
+                    series = room.get((device_epr, handle))
+                    if series is None:
+                        series = room[(device_epr, handle)] = TrendSeries()
+                        self._bytes[room_id] = self._bytes.get(room_id, 0) + series.nbytes
+                    t = dts[handle] // 1_000_000 if handle in dts else ts
+                    block = series.append(int(t), float(value))
+                    self.points_added += 1
+                    if block is not None:
+                        self._bytes[room_id] += block.nbytes
+                        self._enforce(room_id, int(t) - self.window_ms)
+
+    def _enforce(self, room_id: str, cutoff_ms: int):
+        room = self._series[room_id]
+        for series in room.values():
+            self._bytes[room_id] -= series.prune(cutoff_ms)
+        while self._bytes[room_id] > self.room_bytes:
+            oldest = min((s for s in room.values() if s.blocks), key=lambda s: s.blocks[0].t_first, default=None)
+            if oldest is None:
+                break
+            self._bytes[room_id] -= oldest.blocks.popleft().nbytes
+            self.blocks_evicted += 1
+
+    def remove_room(self, room_id: str):
+        with self._lock:
+            self._series.pop(room_id, None)
+            self._bytes.pop(room_id, None)
+
+    def remove_device(self, room_id: Optional[str], device_epr: str):
+        room_id = room_id or ""
+        with self._lock:
+            room = self._series.get(room_id)
+            if not room:
+                return
+            for key in [k for k in room if k[0] == device_epr]:
+                series = room.pop(key)
+                self._bytes[room_id] -= series.nbytes
+
+    def has_room(self, room_id: str) -> bool:
+        with self._lock:
+            return room_id in self._series
+
+    def query(self, room_id: str, devices: Iterable[str] = (), handles: Iterable[str] = (),
+              minutes: float = 30.0, points: int = TREND_DEFAULT_POINTS,
+              method: str = METHOD_LTTB) -> Dict[str, Any]:
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r}, expected one of {', '.join(METHODS)}")
+        points = max(3, min(int(points), TREND_MAX_POINTS))
+        devices, handles = set(devices), set(handles)
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - min(int(minutes * 60_000), self.window_ms)
+
+        with self._lock:
+            selected = [
+                (device_epr, handle, *series.read(start_ms, end_ms))
+                for (device_epr, handle), series in self._series.get(room_id, {}).items()
+                if (not devices or device_epr in devices) and (not handles or handle in handles)
+            ]
+
+        result = []
+        for device_epr, handle, parts, hot in selected:
+            ts, values = _decode_parts(parts, hot, start_ms, end_ms)
+            entry = {"device_epr": device_epr, "handle": handle, "method": method, "samples": len(ts)}
+            if method == METHOD_MINMAX and len(ts) > points:
+                t, lo, hi = minmax_buckets(ts, values, points)
+                entry.update(t=t.tolist(), min=lo.tolist(), max=hi.tolist())
+            else:
+                if method == METHOD_LTTB:
+                    ts, values = lttb(ts, values, points)
+                entry.update(t=ts.tolist(), v=values.tolist())
+            result.append(entry)
+        return {"room_id": room_id, "from": start_ms, "to": end_ms, "series": result}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rooms = {}
+            for room_id, room in self._series.items():
+                stored = sum(s.count + sum(b.count for b in s.blocks) for s in room.values())
+                rooms[room_id] = {
+                    "series": len(room),
+                    "points": stored,
+                    "bytes": self._bytes.get(room_id, 0),
+                }
+            return {
+                "window_s": self.window_ms / 1000.0,
+                "room_bytes_limit": self.room_bytes,
+                "points_added": self.points_added,
+                "blocks_evicted": self.blocks_evicted,
+                "rooms": rooms,
+            }
+
+
+trend_store = TrendStore()
@@ -0,0 +1,144 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+# Binarni format za kose valovnih oblik (WebSocket binary frame + Kafka record)
+#
+#   header   <BBHdff   version, encoding, n_samples, t0 [s epoch], sample_period [s], scale
+#   device   u8 dolzina + utf-8 (EPR naprave, prazno ce ni znan)
+#   handle   u8 dolzina + utf-8
+#   payload  ENC_INT16: n * int16 LE (vrednost = int * scale)
+#            ENC_DELTA: zigzag varint razlik skaliranih vzorcev
+WAVEFORM_CHUNK_VERSION = 2
+
+ENC_INT16 = 0
+ENC_DELTA = 1
+
+ENCODINGS = {"int16": ENC_INT16, "delta": ENC_DELTA}
+
+_HEADER = struct.Struct("<BBHdff")
+_FLOAT32 = struct.Struct("<f")
+_INT16_MIN, _INT16_MAX = -32768, 32767
+
+
+@dataclass
+class WaveformChunk:
+    handle: str
+    t0: float
+    sample_period: float
+    samples: List[float]
+    device: str = ""
+
+
+def _short_string(value: str, what: str) -> bytes:
+    data = value.encode("utf-8")
+    if len(data) > 0xFF:
+        raise ValueError(f"Waveform {what} is longer than 255 bytes: {value!r}")
+    return bytes((len(data),)) + data
+
+
+def _read_short_string(view: memoryview, pos: int) -> Tuple[str, int]:
+    length = view[pos]
+    return bytes(view[pos + 1:pos + 1 + length]).decode("utf-8"), pos + 1 + length
+
+
+def _quantize(samples: Sequence[float], scale: float) -> List[int]:
+    inv = 1.0 / scale
+    return [max(_INT16_MIN, min(_INT16_MAX, int(round(float(x) * inv)))) for x in samples]
+
+
+def _zigzag_varints(values: List[int]) -> bytearray:
+    out = bytearray()
+    prev = 0
+    for v in values:
+        delta = v - prev
+        prev = v
+        z = (delta << 1) ^ (delta >> 63)
+        while z >= 0x80:
+            out.append((z & 0x7F) | 0x80)
+            z >>= 7
+        out.append(z)
+    return out
+
+
+def _from_zigzag_varints(data: memoryview, count: int) -> List[int]:
+    values = []
+    prev = 0
+    pos = 0
+    for _ in range(count):
+        shift = 0
+        z = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            z |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        prev += (z >> 1) ^ -(z & 1)
+        values.append(prev)
+    return values
+
+
+def encode_chunk(chunk: WaveformChunk, scale: float, encoding: int = ENC_INT16) -> bytes:
+    if not 0 < len(chunk.samples) <= 0xFFFF:
+        raise ValueError(f"Waveform chunk must have 1..65535 samples, got {len(chunk.samples)}")
+
+    # skala gre v glavo kot float32, kvantiziramo z isto vrednostjo kot dekoder
+    scale = _FLOAT32.unpack(_FLOAT32.pack(scale))[0]
+    return encode_quantized(chunk.device, chunk.handle, chunk.t0, chunk.sample_period, scale,
+                            _quantize(chunk.samples, scale), encoding)
+
+
+def encode_quantized(device: str, handle: str, t0: float, sample_period: float, scale: float,
+                     ints: Sequence[int], encoding: int = ENC_INT16) -> bytes:
+    if encoding == ENC_INT16:
+        payload = array("h", ints)
+        if sys.byteorder != "little":
+            payload.byteswap()
+        payload = payload.tobytes()
+    elif encoding == ENC_DELTA:
+        payload = bytes(_zigzag_varints(list(ints)))
+    else:
+        raise ValueError(f"Unknown waveform encoding: {encoding}")
+
+    header = _HEADER.pack(
+        WAVEFORM_CHUNK_VERSION, encoding, len(ints), t0, sample_period, scale
+    )
+    return b"".join((header, _short_string(device or "", "device"), _short_string(handle, "handle"), payload))
+
+
+def decode_quantized(data: bytes) -> Tuple[str, str, float, float, float, Sequence[int]]:
+    # (device, handle, t0, sample_period, scale, kvantizirani vzorci) brez pretvorbe v float
+    view = memoryview(data)
+    version, encoding, count, t0, sample_period, scale = _HEADER.unpack_from(view, 0)
+    if version != WAVEFORM_CHUNK_VERSION:
+        raise ValueError(f"Unsupported waveform chunk version: {version}")
+
+    device, pos = _read_short_string(view, _HEADER.size)
+    handle, pos = _read_short_string(view, pos)
+
+    if encoding == ENC_INT16:
+        ints = array("h")
+        ints.frombytes(view[pos:pos + 2 * count])
+        if sys.byteorder != "little":
+            ints.byteswap()
+    elif encoding == ENC_DELTA:
+        ints = _from_zigzag_varints(view[pos:], count)
+    else:
+        raise ValueError(f"Unknown waveform encoding: {encoding}")
+
+    return device, handle, t0, sample_period, scale, ints
+
+
+def decode_chunk(data: bytes) -> WaveformChunk:
+    device, handle, t0, sample_period, scale, ints = decode_quantized(data)
+    return WaveformChunk(
+        handle=handle,
+        t0=t0,
+        sample_period=sample_period,
+        samples=[i * scale for i in ints],
+        device=device,
+    )
@@ -0,0 +1,91 @@
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.services.waveform_codec import ENC_INT16, decode_quantized, encode_quantized
+
+# Stopnje piramide kot faktorji decimacije (1 = polna frekvenca). Vsak razred
+# `factor` vzorcev se skrci v par (min, max) v casovnem vrstnem redu, zato je
+# izhodna frekvenca stopnje 2 * fs / factor in vrhovi (npr. QRS) ostanejo vidni.
+WAVEFORM_LEVELS = sorted({1, *(int(x) for x in os.getenv("SDC_WAVEFORM_LEVELS", "4,16,64").split(",") if x.strip())})
+
+
+def choose_factor(source_rate: float, requested_rate: float, levels: Iterable[int] = WAVEFORM_LEVELS) -> int:
+    # najbolj groba stopnja, ki se vedno da vsaj zahtevano frekvenco
+    if requested_rate <= 0 or source_rate <= 0:
+        return 1
+    best = 1
+    for factor in levels:
+        # toleranca zaradi periode v glavi, shranjene kot float32
+        if factor > 1 and 2.0 * source_rate / factor >= requested_rate * (1 - 1e-6):
+            best = max(best, factor)
+    return best
+
+
+def minmax_decimate(ints: np.ndarray, factor: int) -> np.ndarray:
+    buckets = ints.reshape(-1, factor)
+    lo_idx = buckets.argmin(axis=1)
+    hi_idx = buckets.argmax(axis=1)
+    rows = np.arange(len(buckets))
+    lo = buckets[rows, lo_idx]
+    hi = buckets[rows, hi_idx]
+    min_first = lo_idx <= hi_idx
+    out = np.empty((len(buckets), 2), dtype=ints.dtype)
+    out[:, 0] = np.where(min_first, lo, hi)
+    out[:, 1] = np.where(min_first, hi, lo)
+    return out.reshape(-1)
+
+
+#Piramida enega toka (soba, naprava, handle): vsaka stopnja se gradi iz nizje, ostanek se prenese v naslednji kos
+class WaveformPyramid:
+    def __init__(self, levels: Iterable[int] = WAVEFORM_LEVELS):
+        self.levels = sorted(set(levels) | {1})
+        # stopnja -> nizja stopnja, iz katere jo gradimo (najvisja, ki jo deli)
+        self._base = {factor: max(f for f in self.levels if f < factor and factor % f == 0)
+                      for factor in self.levels if factor > 1}
+        self.source_rate = 0.0
+        self._carry: Dict[int, np.ndarray] = {}
+        self._carry_t0: Dict[int, float] = {}
+
+    def frames(self, data: bytes, rates: Iterable[float]) -> Dict[float, Optional[bytes]]:
+        # ob vsakem kosu napredujejo vse stopnje, zato je stopnja, ki jo odjemalec zahteva
+        # sele kasneje, zvezna; vsako stopnjo izracunamo enkrat, ne glede na stevilo odjemalcev
+        rates = set(rates)
+        device, handle, t0, period, scale, ints = decode_quantized(data)
+        if period <= 0:
+            return {rate: data for rate in rates}
+        self.source_rate = 1.0 / period
+
+        encoded: Dict[int, Optional[bytes]] = {1: data}
+        produced: Dict[int, Optional[Tuple[float, float, np.ndarray]]] = {
+            1: (t0, period, np.asarray(ints, dtype=np.int16))
+        }
+        for factor, base in self._base.items():
+            level = self._level(factor, base, produced[base])
+            produced[factor] = level
+            encoded[factor] = None if level is None else encode_quantized(
+                device, handle, level[0], level[1], scale, level[2].tolist(), ENC_INT16)
+        return {rate: encoded[choose_factor(self.source_rate, rate, self.levels)] for rate in rates}
+
+    def _level(self, factor: int, base: int,
+               source: Optional[Tuple[float, float, np.ndarray]]) -> Optional[Tuple[float, float, np.ndarray]]:
+        # vhod je novi del nizje stopnje; ta ima 1 vzorec na izvorni vzorec (base 1) ali par na `base` vzorcev
+        if source is None:
+            return None
+        start, period, samples = source
+        carry = self._carry.get(factor)
+        if carry is not None and len(carry):
+            carry_t0 = self._carry_t0[factor]
+            # ostanek uporabimo le, ce se kos neposredno nadaljuje
+            if abs(carry_t0 + len(carry) * period - start) <= 1.5 * period:
+                samples = np.concatenate((carry, samples))
+                start = carry_t0
+
+        bucket = factor if base == 1 else 2 * factor // base
+        usable = len(samples) // bucket * bucket
+        self._carry[factor] = samples[usable:]
+        self._carry_t0[factor] = start + usable * period
+        if not usable:
+            return None
+        return start, period * bucket / 2.0, minmax_decimate(samples[:usable], bucket)
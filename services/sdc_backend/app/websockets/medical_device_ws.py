@@ -1,84 +1,438 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Set, Tuple, Iterable
+from collections import deque
+from dataclasses import dataclass, field
+import itertools
 import logging
 import json
+import os
 import time
 import asyncio
-from datetime import datetime
- 
+
+from app.services.latency import latency_tracker, STAGE_WS_ENQUEUE, STAGE_WS_WRITE
+from app.services.latest_values import latest_values
+from app.services.waveform_pyramid import WaveformPyramid
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 logger = logging.getLogger(__name__)
- 
+
+WS_WAVEFORM_BUFFER = int(os.getenv("WS_WAVEFORM_BUFFER", "32"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5.0"))
+
+ALL_ROOMS = "*"
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+
+_frame_seq = itertools.count()
+
+
+def negotiate_format(requested: Optional[str]) -> str:
+    if requested and requested.lower() == FORMAT_MSGPACK:
+        if msgpack is not None:
+            return FORMAT_MSGPACK
+        logger.warning("⚠️ msgpack not installed, falling back to JSON")
+    return FORMAT_JSON
+
+
+def encode_body(body: Any, fmt: str) -> str | bytes:
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.packb(body, use_bin_type=True)
+    return json.dumps(body, separators=(",", ":"))
+
+
+@dataclass
+class OutboundFrame:
+    body: Any
+    keys: tuple = ()
+    envelopes: Optional[List[Dict[str, Any]]] = None
+    # posnetek zadnjih vrednosti ne sodi v meritve zakasnitev
+    traced: bool = True
+    seq: int = field(default_factory=lambda: next(_frame_seq))
+    _encoded: Dict[str, str | bytes] = field(default_factory=dict)
+
+    # vsak format zakodiramo najvec enkrat, ne glede na stevilo prejemnikov
+    def encoded(self, fmt: str) -> str | bytes:
+        if isinstance(self.body, bytes):
+            return self.body
+        payload = self._encoded.get(fmt)
+        if payload is None:
+            payload = self._encoded[fmt] = encode_body(self.body, fmt)
+        return payload
+
+
+@dataclass
+class Subscription:
+    rooms: Set[str]
+    devices: Set[str] = field(default_factory=set)
+    handles: Set[str] = field(default_factory=set)
+    # zelena izhodna frekvenca valovnih oblik (vzorcev/s), 0 = polna
+    waveform_rate: float = 0.0
+
+    @property
+    def room_wide(self) -> bool:
+        return not self.devices and not self.handles
+
+
+#Povezava z lastnim pisalcem in omejenim medpomnilnikom
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, subscription: Subscription, fmt: str = FORMAT_JSON):
+        self.websocket = websocket
+        self.subscription = subscription
+        self.fmt = fmt
+        # konflacija po (soba, naprava, handle): enak handle dveh naprav v isti sobi sta loceni vrednosti
+        self._scalars: Dict[Tuple[str, str, str], OutboundFrame] = {}
+        self._waveforms: deque = deque(maxlen=WS_WAVEFORM_BUFFER)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.scalars_conflated = 0
+        self.waveforms_dropped = 0
+        self.max_pending = 0
+        self.last_send_ms = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._scalars) + len(self._waveforms)
+
+    def start(self, on_failure):
+        self._task = asyncio.create_task(self._writer(on_failure))
+
+    def stop(self):
+        # pisalec se ob napaki odjavi sam; lastne naloge ne prekinemo, sicer se socket ne zapre
+        if self._task and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def enqueue_scalar(self, frame: OutboundFrame):
+        for key in frame.keys:
+            if key in self._scalars:
+                self.scalars_conflated += 1
+            self._scalars[key] = frame
+        self._mark_pending()
+
+    def enqueue_waveform(self, frame: OutboundFrame):
+        if len(self._waveforms) == self._waveforms.maxlen:
+            self.waveforms_dropped += 1
+        self._waveforms.append(frame)
+        self._mark_pending()
+
+    def _mark_pending(self):
+        self.max_pending = max(self.max_pending, self.pending)
+        self._wakeup.set()
+
+    def _drain_scalars(self) -> List[Tuple[str | bytes, List[Dict[str, Any]]]]:
+        if not self._scalars:
+            return []
+
+        live: Dict[int, List[Tuple[str, str, str]]] = {}
+        frames: Dict[int, OutboundFrame] = {}
+        for key, frame in self._scalars.items():
+            live.setdefault(frame.seq, []).append(key)
+            frames[frame.seq] = frame
+        self._scalars = {}
+
+        payloads = []
+        for seq in sorted(frames):
+            frame = frames[seq]
+            keys = live[seq]
+            if len(keys) == len(frame.keys):
+                payloads.append((frame.encoded(self.fmt), frame.envelopes if frame.traced and frame.envelopes else []))
+                continue
+
+            # del vrednosti je ze zamenjala novejsa: posljemo samo se veljavne
+            trimmed = _select(frame.envelopes, set(keys))
+            if trimmed:
+                body = trimmed if len(trimmed) > 1 or not frame.traced else trimmed[0]
+                payloads.append((encode_body(body, self.fmt), trimmed if frame.traced else []))
+        return payloads
+
+    async def _writer(self, on_failure):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                while self._scalars or self._waveforms:
+                    for payload, envelopes in self._drain_scalars():
+                        await self._send(payload)
+                        if latency_tracker.enabled:
+                            now = time.time()
+                            latency_tracker.observe_envelopes(envelopes, STAGE_WS_WRITE, now)
+                            latency_tracker.observe_end_to_end(envelopes, now)
+                    while self._waveforms:
+                        await self._send(self._waveforms.popleft().encoded(self.fmt))
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.TimeoutError, WebSocketDisconnect, Exception) as e:
+            logger.debug(f"📡 Failed to send to connection: {e}")
+            try:
+                await asyncio.wait_for(self.websocket.close(), timeout=WS_SEND_TIMEOUT)
+            except Exception:
+                pass
+            on_failure(self.websocket)
+
+    async def _send(self, payload: str | bytes):
+        start = time.perf_counter()
+        if isinstance(payload, bytes):
+            await asyncio.wait_for(self.websocket.send_bytes(payload), timeout=WS_SEND_TIMEOUT)
+        else:
+            await asyncio.wait_for(self.websocket.send_text(payload), timeout=WS_SEND_TIMEOUT)
+        self.last_send_ms = (time.perf_counter() - start) * 1000.0
+        self.frames_sent += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "format": self.fmt,
+            "rooms": sorted(self.subscription.rooms),
+            "devices": sorted(self.subscription.devices),
+            "handles": sorted(self.subscription.handles),
+            "waveform_rate": self.subscription.waveform_rate,
+            "connected_at": self.connected_at,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "frames_sent": self.frames_sent,
+            "scalars_conflated": self.scalars_conflated,
+            "waveforms_dropped": self.waveforms_dropped,
+            "last_send_ms": round(self.last_send_ms, 3),
+        }
+
+
+def _select(envelopes: List[Dict[str, Any]], keys: Set[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    selected = []
+    for envelope in envelopes:
+        room, device = envelope.get("room_id"), envelope.get("device_epr")
+        metrics = {h: v for h, v in envelope.get("metrics", {}).items() if (room, device, h) in keys}
+        if metrics:
+            selected.append({**envelope, "metrics": metrics})
+    return selected
+
+
+def _waveform_rate(rate: Optional[float] = None, px: Optional[float] = None) -> float:
+    # gostota v pikslih/s: min in max na piksel
+    try:
+        if rate:
+            return max(0.0, float(rate))
+        if px:
+            return max(0.0, 2.0 * float(px))
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+
+def _split_csv(value: Optional[str | Iterable[str]]) -> Set[str]:
+    if not value:
+        return set()
+    if isinstance(value, str):
+        value = value.split(",")
+    return {v.strip() for v in value if v and v.strip()}
+
+
 class MedicalDeviceWebSocket:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self._send_queue = asyncio.Queue()
-        self._sender_task = None
-        
-    async def connect(self, websocket: WebSocket):
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        # indeks za razposiljanje: kdo zeli celo sobo, napravo, handle ali handle dolocene naprave
+        # (devices= in handles= skupaj pomenita presek, ne unije)
+        self._room_index: Dict[str, Set[ClientConnection]] = {}
+        self._device_index: Dict[Tuple[str, str], Set[ClientConnection]] = {}
+        self._handle_index: Dict[Tuple[str, str], Set[ClientConnection]] = {}
+        self._pair_index: Dict[Tuple[str, str, str], Set[ClientConnection]] = {}
+        self._pyramids: Dict[Tuple[Optional[str], Optional[str], Optional[str]], WaveformPyramid] = {}
+
+    async def connect(self, websocket: WebSocket, room_id: Optional[str] = None, fmt: Optional[str] = None,
+                      devices: Optional[str] = None, handles: Optional[str] = None,
+                      waveform_rate: float = 0.0, waveform_px: float = 0.0):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        subscription = Subscription(
+            rooms={room_id or ALL_ROOMS},
+            devices=_split_csv(devices),
+            handles=_split_csv(handles),
+            waveform_rate=_waveform_rate(waveform_rate, waveform_px),
+        )
+        client = ClientConnection(websocket, subscription, negotiate_format(fmt))
+        self.active_connections[websocket] = client
+        self._index(client)
+        self._send_snapshot(client)
+        client.start(self.disconnect)
         logger.info(f"📱 WebSocket connected. Total connections: {len(self.active_connections)}")
-        
-        if self._sender_task is None or self._sender_task.done():
-            self._sender_task = asyncio.create_task(self._sender_worker())
-        
+
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client:
+            self._unindex(client)
+            client.stop()
             logger.info(f"📱 WebSocket disconnected. Total connections: {len(self.active_connections)}")
-            
-    async def broadcast_data(self, data: Dict[str, Any]):
-        if not self.active_connections:
+
+    def subscribe(self, websocket: WebSocket, rooms=None, devices=None, handles=None,
+                  waveform_rate=None, waveform_px=None):
+        client = self.active_connections.get(websocket)
+        if not client:
             return
-            
-        ws_timestamp = time.time()
-        data["ws_timestamp"] = ws_timestamp
-        data["ws_time_iso"] = datetime.now().isoformat()
-        
+        self._unindex(client)
+        if rooms:
+            client.subscription.rooms = _split_csv(rooms)
+        client.subscription.devices = _split_csv(devices)
+        client.subscription.handles = _split_csv(handles)
+        if waveform_rate is not None or waveform_px is not None:
+            client.subscription.waveform_rate = _waveform_rate(waveform_rate, waveform_px)
+        self._index(client)
+        self._send_snapshot(client)
+
+    def _send_snapshot(self, client: ClientConnection):
+        sub = client.subscription
+        envelopes = latest_values.snapshot(sub.rooms, sub.devices, sub.handles, ALL_ROOMS)
+        if not envelopes:
+            return
+        keys = tuple(dict.fromkeys((e["room_id"], e.get("device_epr"), h) for e in envelopes for h in e["metrics"]))
+        client.enqueue_scalar(OutboundFrame(body=envelopes, keys=keys, envelopes=envelopes, traced=False))
+
+    def handle_control(self, websocket: WebSocket, text: str):
         try:
-            self._send_queue.put_nowait(data)
-        except asyncio.QueueFull:
-            logger.warning("📡 WebSocket send queue full, dropping message")
-    
-    async def _sender_worker(self):
-        while True:
+            message = json.loads(text)
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get("type") == "subscribe":
+            self.subscribe(websocket, message.get("rooms"), message.get("devices"), message.get("handles"),
+                           message.get("waveform_rate"), message.get("waveform_px"))
+
+    def _index(self, client: ClientConnection):
+        sub = client.subscription
+        for room in sub.rooms:
+            if sub.room_wide:
+                self._room_index.setdefault(room, set()).add(client)
+            elif not sub.handles:
+                for device in sub.devices:
+                    self._device_index.setdefault((room, device), set()).add(client)
+            elif not sub.devices:
+                for handle in sub.handles:
+                    self._handle_index.setdefault((room, handle), set()).add(client)
+            else:
+                for device in sub.devices:
+                    for handle in sub.handles:
+                        self._pair_index.setdefault((room, device, handle), set()).add(client)
+
+    def _unindex(self, client: ClientConnection):
+        for index in (self._room_index, self._device_index, self._handle_index, self._pair_index):
+            for key in [k for k, clients in index.items() if client in clients]:
+                index[key].discard(client)
+                if not index[key]:
+                    del index[key]
+
+    def _recipients(self, room: Optional[str], device: Optional[str]) -> Set[ClientConnection]:
+        recipients = set(self._room_index.get(ALL_ROOMS, ()))
+        recipients.update(self._room_index.get(room, ()))
+        if device:
+            recipients.update(self._device_index.get((room, device), ()))
+            recipients.update(self._device_index.get((ALL_ROOMS, device), ()))
+        return recipients
+
+    def _handle_recipients(self, base: Set[ClientConnection], room: Optional[str], device: Optional[str],
+                           handle: str) -> Set[ClientConnection]:
+        return base.union(
+            self._handle_index.get((room, handle), ()),
+            self._handle_index.get((ALL_ROOMS, handle), ()),
+            self._pair_index.get((room, device, handle), ()),
+            self._pair_index.get((ALL_ROOMS, device, handle), ()),
+        )
+
+    # tece v zanki (prek LoopHandoff), brez korutine na vsak paket
+    def broadcast_data(self, data: Dict[str, Any] | List[Dict[str, Any]]):
+        if not self.active_connections:
+            return
+
+        envelopes = data if isinstance(data, list) else [data]
+        all_keys = []
+        selections: Dict[ClientConnection, List[Tuple[str, str, str]]] = {}
+        for envelope in envelopes:
+            room, device = envelope.get("room_id"), envelope.get("device_epr")
+            base = self._recipients(room, device)
+            for handle in envelope.get("metrics", {}):
+                key = (room, device, handle)
+                all_keys.append(key)
+                for client in self._handle_recipients(base, room, device, handle):
+                    selections.setdefault(client, []).append(key)
+
+        if not selections:
+            return
+
+        # odjemalci z enako izbiro si delijo isti okvir (in isto kodiranje)
+        groups: Dict[tuple, List[ClientConnection]] = {}
+        for client, keys in selections.items():
+            groups.setdefault(tuple(keys), []).append(client)
+
+        full = tuple(all_keys)
+        for keys, clients in groups.items():
+            if keys == full:
+                frame = OutboundFrame(body=data, keys=tuple(dict.fromkeys(keys)), envelopes=envelopes)
+            else:
+                selected = _select(envelopes, set(keys))
+                frame = OutboundFrame(
+                    body=selected if len(selected) > 1 else selected[0],
+                    keys=tuple(dict.fromkeys(keys)),
+                    envelopes=selected,
+                )
+            for client in clients:
+                client.enqueue_scalar(frame)
+
+        latency_tracker.observe_envelopes(envelopes, STAGE_WS_ENQUEUE, time.time())
+
+    def broadcast_bytes(self, data: bytes, room_id: Optional[str] = None,
+                              device_epr: Optional[str] = None, handle: Optional[str] = None):
+        if not self.active_connections:
+            return
+
+        recipients = self._recipients(room_id, device_epr)
+        if handle:
+            recipients = self._handle_recipients(recipients, room_id, device_epr, handle)
+
+        if not recipients:
+            return
+
+        by_rate: Dict[float, List[ClientConnection]] = {}
+        for client in recipients:
+            by_rate.setdefault(client.subscription.waveform_rate, []).append(client)
+
+        key = (room_id, device_epr, handle)
+        pyramid = self._pyramids.get(key)
+        if list(by_rate) == [0.0] and pyramid is None:
+            frames = {0.0: data}
+        else:
+            # obstojeca piramida napreduje ob vsakem kosu, tudi ko so vsi odjemalci na polni frekvenci
+            if pyramid is None:
+                pyramid = self._pyramids[key] = WaveformPyramid()
             try:
-                data = await self._send_queue.get()
-                
-                if "timestamp" not in data:
-                    data["timestamp"] = datetime.now().isoformat()
-                
-                json_data = json.dumps(data)
-                disconnected = []
-                
-                send_tasks = []
-                for connection in self.active_connections:
-                    task = asyncio.create_task(self._send_to_connection(connection, json_data))
-                    send_tasks.append((connection, task))
-                
-                for connection, task in send_tasks:
-                    try:
-                        await asyncio.wait_for(task, timeout=0.1)  
-                    except (asyncio.TimeoutError, WebSocketDisconnect, Exception) as e:
-                        logger.debug(f"📡 Failed to send to connection: {e}")
-                        disconnected.append(connection)
-                
-                for connection in disconnected:
-                    self.disconnect(connection)
-                
-                self._send_queue.task_done()
-                
+                frames = pyramid.frames(data, by_rate)
             except Exception as e:
-                logger.error(f"❌ Error in WebSocket sender worker: {e}")
-                await asyncio.sleep(0.1)
-    
-    async def _send_to_connection(self, connection: WebSocket, data: str):
-        try:
-            await connection.send_text(data)
-        except WebSocketDisconnect:
-            raise
-        except Exception as e:
-            logger.debug(f"📡 Error sending to WebSocket connection: {e}")
-            raise
- 
-medical_device_ws = MedicalDeviceWebSocket()
\ No newline at end of file
+                logger.debug(f"📡 Waveform decimation failed: {e}")
+                frames = {rate: data for rate in by_rate}
+
+        # odjemalci na isti stopnji piramide dobijo isti okvir
+        shared: Dict[int, OutboundFrame] = {}
+        for rate, clients in by_rate.items():
+            payload = frames.get(rate)
+            if payload is None:
+                continue
+            frame = shared.get(id(payload))
+            if frame is None:
+                frame = shared[id(payload)] = OutboundFrame(body=payload)
+            for client in clients:
+                client.enqueue_waveform(frame)
+
+    # piramide valovnih oblik so po (soba, naprava, handle); ob odhodu naprave ali sobe jih odstranimo
+    def remove_device(self, room_id: Optional[str], device_epr: str):
+        for key in [k for k in self._pyramids if k[0] == room_id and k[1] == device_epr]:
+            del self._pyramids[key]
+
+    def remove_room(self, room_id: str):
+        for key in [k for k in self._pyramids if k[0] == room_id]:
+            del self._pyramids[key]
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [client.get_stats() for client in self.active_connections.values()]
+
+medical_device_ws = MedicalDeviceWebSocket()
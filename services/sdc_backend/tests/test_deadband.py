@@ -0,0 +1,23 @@
+from app.services.deadband import DeadbandFilter, KIND_NUMERIC
+
+
+class NumericMetricDescriptor:
+    Resolution = 0.1
+
+
+def test_learned_rule_applies_without_descriptors():
+    deadband = DeadbandFilter(rules="hr=0.2", heartbeat_s=0)
+    deadband.learn("e", {"hr": NumericMetricDescriptor()})
+    assert deadband.rule("e", "hr").kind == KIND_NUMERIC
+    assert deadband.filter("r", "e", {"hr": 60.0}) == {"hr": 60.0}
+    assert deadband.filter("r", "e", {"hr": 60.1}) == {}
+    assert deadband.filter("r", "e", {"hr": 60.5}) == {"hr": 60.5}
+
+
+def test_heartbeat_and_device_reset():
+    deadband = DeadbandFilter(heartbeat_s=0)
+    assert deadband.filter("r", "e", {"mode": "adult"}) == {"mode": "adult"}
+    assert deadband.filter("r", "e", {"mode": "adult"}) == {}
+    deadband.remove_device("e")
+    assert deadband.filter("r", "e", {"mode": "adult"}) == {"mode": "adult"}
+    assert deadband.get_stats()["suppressed"] == 1
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.services import ecg_analysis
+from app.services.ecg_analysis import EcgAnalysisStage, analyze_window
+from app.services.waveform_codec import WaveformChunk, encode_chunk
+
+FS = 250.0
+HANDLE = "ecgWaveform.ch0.ecg_module"
+T0 = 1_700_000_000.0
+
+
+def synthetic_ecg(seconds: float, hr: float = 72.0) -> np.ndarray:
+    t = np.arange(int(seconds * FS)) / FS
+    phase = (t * hr / 60.0) % 1.0
+    return 0.05 * np.sin(2 * np.pi * 0.3 * t) + np.exp(-((phase - 0.5) / 0.01) ** 2)
+
+
+def chunks(signal: np.ndarray, size: int = 250):
+    for i in range(0, len(signal), size):
+        chunk = WaveformChunk(HANDLE, T0 + i / FS, 1.0 / FS, signal[i:i + size].tolist(), "urn:uuid:a")
+        yield encode_chunk(chunk, 0.001)
+
+
+def test_analyze_window_finds_heart_rate():
+    result = analyze_window(synthetic_ecg(10), FS, min_sqi=0.0)
+    assert result["hr"] == pytest.approx(72.0, abs=1.0)
+
+
+@pytest.fixture
+def stage(monkeypatch):
+    monkeypatch.setattr(ecg_analysis, "ECG_MIN_SQI", 0.0)
+    published = []
+    stage = EcgAnalysisStage(lambda room, envelope: published.append(envelope), handles=[HANDLE])
+    # nitni bazen namesto procesov: isti vmesnik submit/Future
+    stage._pool = ThreadPoolExecutor(max_workers=1)
+    yield stage, published
+    stage._pool.shutdown(wait=True)
+
+
+def test_results_carry_device_time_of_window_end(stage):
+    stage, published = stage
+    encoded = list(chunks(synthetic_ecg(6)))
+    for data in encoded:
+        stage.feed(data, "or1", "urn:uuid:a", HANDLE)
+        stage._pool.submit(lambda: None).result()
+    stage._pool.shutdown(wait=True)
+    assert published
+    last = published[-1]
+    end_ns = int((T0 + (6 * FS - 1) / FS) * 1e9)
+    assert last["ts"] == end_ns // 1_000_000
+    # t0 je float v sekundah: na ns natancno ga ne moremo primerjati
+    assert list(last["dts"].values()) == pytest.approx([end_ns] * len(last["dts"]), abs=1000)
+    assert set(last["dts"]) == set(last["metrics"])
+
+
+def test_late_chunk_does_not_reset_the_window(stage):
+    stage, _ = stage
+    encoded = list(chunks(synthetic_ecg(3)))
+    for data in encoded:
+        stage.feed(data, "or1", "urn:uuid:a", HANDLE)
+    window_before = stage._windows[("or1", "urn:uuid:a", HANDLE)]
+    stage.feed(encoded[1], "or1", "urn:uuid:a", HANDLE)
+    assert stage.late == 1
+    assert stage._windows[("or1", "urn:uuid:a", HANDLE)] is window_before
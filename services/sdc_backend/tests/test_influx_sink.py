@@ -0,0 +1,79 @@
+import gzip
+import http.server
+import threading
+import time
+
+import pytest
+
+from app.services.influx_sink import InfluxLineSink, envelope_to_lines, INFLUX_FIELD_PREFIX
+
+DTS = 1_700_000_000_123_456_789
+ENVELOPE = {"room_id": "or 1", "device_epr": "urn:uuid:a", "ts": 1_700_000_000_123,
+            "metrics": {"spo2": 97, "hr": 61.5, "mode": "adult"}, "dts": {"spo2": DTS, "hr": DTS}}
+
+
+def unit_lookup(epr, handle):
+    return "262688" if handle == "spo2" else None
+
+
+@pytest.fixture
+def influx():
+    # lokalni nadomestek InfluxDB: prvi zahtevek dobi 503 (ponovni poskus), nato 204
+    statuses = [503]
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            status = statuses.pop(0) if statuses else 204
+            if status == 204:
+                received.append((self.path, self.headers.get("Content-Encoding"), gzip.decompress(body).decode()))
+            self.send_response(status)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", received
+    server.shutdown()
+
+
+def test_sink_retries_and_writes_gzip_ns_lines(influx):
+    url, received = influx
+    sink = InfluxLineSink(url, unit_lookup=unit_lookup)
+    sink.start()
+    try:
+        sink.write([ENVELOPE])
+        deadline = time.time() + 10
+        while not sink.stats["batches_written"] and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        sink.stop()
+
+    assert sink.stats["retries"] == 1
+    assert len(received) == 1
+    path, encoding, body = received[0]
+    assert encoding == "gzip"
+    assert "precision=ns" in path
+    lines = body.splitlines()
+    assert any(f"{INFLUX_FIELD_PREFIX}spo2=97.0 {DTS}" in line for line in lines)
+    assert any(",unit=262688 " in line for line in lines)
+    assert all("room_id=or\\ 1" in line for line in lines)
+    assert any(f'{INFLUX_FIELD_PREFIX}mode="adult"' in line for line in lines)
+
+
+def test_lines_group_fields_by_unit_and_time():
+    lines = envelope_to_lines(ENVELOPE, unit_lookup, measurement="m",
+                              type_lookup=lambda epr, handles: "pulse oximeter")
+    # spo2 ima enoto, hr in mode ne; hr ima cas naprave, mode cas prihoda
+    assert len(lines) == 3
+    assert all(line.startswith("m,device_epr=urn:uuid:a,room_id=or\\ 1,device_type=pulse\\ oximeter") for line in lines)
+    assert any(line.endswith(f" {ENVELOPE['ts'] * 1_000_000}") and "mode=" in line for line in lines)
+
+
+def test_non_finite_values_are_skipped():
+    lines = envelope_to_lines({"device_epr": "e", "ts": 1, "metrics": {"a": float("nan"), "b": 1}})
+    assert len(lines) == 1
+    assert f"{INFLUX_FIELD_PREFIX}a=" not in lines[0]
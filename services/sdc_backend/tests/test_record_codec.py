@@ -0,0 +1,91 @@
+import json
+import shutil
+import pathlib
+
+import pytest
+
+from app.services import record_codec
+from app.services.schema_store import FileSchemaStore, SchemaError
+from app.services.descriptor_index import MetricInfo
+
+SCHEMAS = pathlib.Path(record_codec.__file__).parent.parent / "schemas"
+
+ENVELOPE = {
+    "device_epr": "urn:uuid:a",
+    "ts": 1_700_000_000_123,
+    "metrics": {"spo2": 97, "hr": 61.5, "mode": "adult", "alarm": None},
+    "dts": {"spo2": 1_700_000_000_100_000_000},
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    # kopija shem, da zapis slovarja imen ne spremeni repozitorija
+    shutil.copytree(SCHEMAS, tmp_path / "schemas")
+    return FileSchemaStore(tmp_path / "schemas")
+
+
+def lookup(device_epr, handle):
+    return MetricInfo(handle, device_epr, "pulse oximeter", "numeric", "150456", "262688")
+
+
+def encode(store, schema_id, envelope=ENVELOPE):
+    codec = record_codec._codec_for_id(schema_id, store)
+    header = record_codec.record_header("or1", envelope["device_epr"], "pulse oximeter")
+    return codec.encode(header, record_codec.records_from_envelope(envelope, lookup))
+
+
+@pytest.mark.parametrize("schema_id", [1, 2])
+def test_envelope_round_trip(store, schema_id):
+    decoded_id, header, records = record_codec.decode_records(encode(store, schema_id), store)
+    assert decoded_id == schema_id
+    assert header["room_id"] == "or1"
+    envelope = record_codec.envelope_from_records(header, records, store=store)
+    assert envelope["device_epr"] == ENVELOPE["device_epr"]
+    assert envelope["metrics"] == {"spo2": 97.0, "hr": 61.5, "mode": "adult", "alarm": None}
+    assert envelope["dts"]["spo2"] == ENVELOPE["dts"]["spo2"]
+    assert envelope["dts"]["hr"] == ENVELOPE["ts"] * 1_000_000
+
+
+def test_v2_handles_survive_a_restart(store, tmp_path):
+    # v2 ne nosi nizov handle; po ponovnem zagonu jih bralec dobi iz slovarja v shrambi shem
+    data = encode(store, 2)
+    reloaded = FileSchemaStore(tmp_path / "schemas")
+    _, header, records = record_codec.decode_records(data, reloaded)
+    assert all(r.get("handle") is None for r in records)
+    envelope = record_codec.envelope_from_records(header, records, lambda handle_id: None, reloaded)
+    assert set(envelope["metrics"]) == set(ENVELOPE["metrics"])
+
+
+def test_v2_carries_compact_codes(store):
+    _, header, records = record_codec.decode_records(encode(store, 2), store)
+    assert header["device_cid"] == record_codec.stable_id(ENVELOPE["device_epr"])
+    assert header["device_type"] == "pulse oximeter"
+    assert {r["code"] for r in records} == {150456}
+    assert {r["unit_code"] for r in records} == {262688}
+
+
+def test_waveform_record_round_trip(store):
+    codec = record_codec._codec_for_id(2, store)
+    record = record_codec.waveform_record(b"\x01\x02\x03", 1.5, "ecg", None)
+    _, _, records = record_codec.decode_records(codec.encode(record_codec.record_header("or1", "e"), [record]), store)
+    assert records[0]["kind"] == record_codec.KIND_WAVEFORM
+    assert records[0]["samples"] == b"\x01\x02\x03"
+    assert records[0]["ts_ns"] == 1_500_000_000
+
+
+def test_unknown_schema_id_is_rejected(store):
+    data = bytearray(encode(store, 2))
+    data[1:5] = (999).to_bytes(4, "big")
+    with pytest.raises(SchemaError):
+        record_codec.decode_records(bytes(data), store)
+
+
+def test_register_reuses_identical_schema(store, tmp_path):
+    latest = store.latest(record_codec.SUBJECT)
+    again = store.register(record_codec.SUBJECT, latest.get("header", []), latest["fields"])
+    assert again["id"] == latest["id"]
+    changed = store.register(record_codec.SUBJECT, latest.get("header", []),
+                             latest["fields"] + [{"name": "extra", "type": "uint8"}])
+    assert changed["version"] == latest["version"] + 1
+    assert json.loads((tmp_path / "schemas" / record_codec.SUBJECT / f"v{changed['version']}.json").read_text())
@@ -0,0 +1,76 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from app.services.recorder import (SessionRecorder, SegmentReader, write_segment, _Column, MANIFEST,
+                                   SEGMENT_SUFFIX)
+
+
+def column(ts, values, unit="262688"):
+    c = _Column(unit, "pulse oximeter")
+    c.ts, c.values = list(ts), list(values)
+    return c
+
+
+def test_segment_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    ts = (1_700_000_000_000 + np.cumsum(rng.integers(1, 1000, 300))).tolist()
+    values = rng.normal(97, 1, 300).tolist()
+    path = str(tmp_path / f"0{SEGMENT_SUFFIX}")
+    # neurejeni casi: segment jih uredi
+    info = write_segment(path, "or1", {("e", "spo2"): column(ts[::-1], values[::-1]),
+                                        ("e", "hr"): column(ts[:5], [60.0] * 5, None)})
+    assert info["rows"] == 305 and info["columns"] == 2
+    with SegmentReader(path) as reader:
+        assert (reader.t_min, reader.t_max) == (ts[0], ts[-1])
+        by_handle = {c["handle"]: c for c in reader.columns}
+        read_ts, read_values = reader.read(by_handle["spo2"], 0, 2 ** 62)
+        np.testing.assert_array_equal(read_ts, ts)
+        np.testing.assert_array_equal(read_values, values)
+        # casovno okno
+        part_ts, _ = reader.read(by_handle["spo2"], ts[10], ts[20])
+        assert part_ts.tolist() == ts[10:21]
+        assert by_handle["hr"]["unit"] is None
+
+
+def test_not_a_segment_is_rejected(tmp_path):
+    path = tmp_path / f"bad{SEGMENT_SUFFIX}"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        SegmentReader(str(path))
+
+
+def test_recorder_write_reload_read(tmp_path):
+    root = str(tmp_path)
+    now = int(time.time() * 1000)
+    recorder = SessionRecorder(root=root, chunk_s=3600)
+    recorder.start()
+    recorder.add([{"room_id": "or1", "device_epr": "e", "ts": now + i, "metrics": {"hr": float(i), "mode": "x"}}
+                  for i in range(100)])
+    recorder.stop()
+
+    sessions = recorder.sessions("or1")
+    assert len(sessions) == 1 and sessions[0]["rows"] == 100 and sessions[0]["ended"] is not None
+    assert os.path.exists(os.path.join(root, "or1", sessions[0]["session_id"], MANIFEST))
+
+    reloaded = SessionRecorder(root=root)
+    reloaded._load()
+    data = reloaded.read("or1", sessions[0]["session_id"], set(), set())
+    assert [s["handle"] for s in data["series"]] == ["hr"]
+    assert data["series"][0]["values"] == [float(i) for i in range(100)]
+    assert data["series"][0]["ts"] == [now + i for i in range(100)]
+
+
+def test_budget_evicts_oldest_segments(tmp_path):
+    now = int(time.time() * 1000)
+    recorder = SessionRecorder(root=str(tmp_path), chunk_s=3600, budget_mb=0)
+    for k in range(3):
+        recorder.add([{"room_id": "or1", "device_epr": "e", "ts": now + k * 10 + i, "metrics": {"hr": float(i)}}
+                      for i in range(10)])
+        recorder._flush(force=True)
+    # zadnji segment odprte seje ostane
+    session = recorder.sessions("or1")[0]
+    assert session["segments"] == 1
+    assert recorder.segments_evicted == 2
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.services import trends
+from app.services.trends import CompressedBlock, TrendSeries, TrendStore, lttb
+
+
+def test_block_round_trip_is_lossless():
+    rng = np.random.default_rng(1)
+    ts = 1_700_000_000_000 + np.cumsum(rng.integers(900, 1100, 500)).astype(np.int64)
+    values = np.round(60 + rng.normal(0, 2, 500), 1)
+    values[::50] = 60.0
+    block = CompressedBlock(ts, values)
+    decoded_ts, decoded_values = block.decode()
+    np.testing.assert_array_equal(decoded_ts, ts)
+    np.testing.assert_array_equal(decoded_values.view(np.uint64), values.view(np.uint64))
+    assert (block.t_first, block.t_last, block.count) == (ts[0], ts[-1], 500)
+
+
+def test_regular_constant_series_compresses_well():
+    ts = np.arange(1000, dtype=np.int64) * 1000
+    values = np.full(1000, 98.0)
+    block = CompressedBlock(ts, values)
+    assert block.nbytes < (ts.nbytes + values.nbytes) / 4
+
+
+def test_series_reads_blocks_and_open_chunk():
+    series = TrendSeries()
+    n = trends.TREND_BLOCK * 2 + 7
+    for i in range(n):
+        series.append(i * 1000, float(i))
+    assert len(series.blocks) == 2
+    parts, hot = series.read(0, n * 1000)
+    ts, values = trends._decode_parts(parts, hot, 0, n * 1000)
+    np.testing.assert_array_equal(ts, np.arange(n) * 1000)
+    np.testing.assert_array_equal(values, np.arange(n, dtype=np.float64))
+
+
+def test_store_query_returns_raw_points():
+    store = TrendStore()
+    now = int(__import__("time").time() * 1000)
+    store.add([{"room_id": "r", "device_epr": "d", "ts": now - 1000 + i, "metrics": {"hr": float(i), "mode": "x"}}
+               for i in range(10)])
+    result = store.query("r", minutes=1, method=trends.METHOD_RAW)
+    assert [s["handle"] for s in result["series"]] == ["hr"]
+    assert result["series"][0]["v"] == [float(i) for i in range(10)]
+
+
+def test_lttb_keeps_endpoints_and_size():
+    ts = np.arange(1000, dtype=np.int64)
+    values = np.sin(ts / 30.0)
+    out_ts, out_values = lttb(ts, values, 50)
+    assert len(out_ts) == 50
+    assert out_ts[0] == 0 and out_ts[-1] == 999
+    assert out_values[0] == pytest.approx(values[0])
@@ -0,0 +1,63 @@
+import math
+
+import pytest
+
+from app.services.waveform_codec import (WaveformChunk, ENC_INT16, ENC_DELTA, encode_chunk, decode_chunk,
+                                         decode_quantized, encode_quantized)
+
+SCALE = 0.001
+
+
+def ecg_like(n: int):
+    return [round(math.sin(i / 7.0) * 1.2 + (0.8 if i % 50 == 0 else 0.0), 3) for i in range(n)]
+
+
+@pytest.mark.parametrize("encoding", [ENC_INT16, ENC_DELTA])
+def test_chunk_round_trip(encoding):
+    chunk = WaveformChunk("ecgWaveform.ch0.ecg_module", 1_700_000_000.25, 0.002, ecg_like(500), "urn:uuid:a")
+    decoded = decode_chunk(encode_chunk(chunk, SCALE, encoding))
+    assert decoded.device == chunk.device
+    assert decoded.handle == chunk.handle
+    assert decoded.t0 == chunk.t0
+    assert decoded.sample_period == pytest.approx(chunk.sample_period)
+    assert decoded.samples == pytest.approx(chunk.samples, abs=SCALE / 2 + 1e-9)
+
+
+def test_delta_is_smaller_for_smooth_signals():
+    chunk = WaveformChunk("h", 0.0, 0.002, ecg_like(500))
+    assert len(encode_chunk(chunk, SCALE, ENC_DELTA)) < len(encode_chunk(chunk, SCALE, ENC_INT16))
+
+
+def test_values_outside_int16_are_clamped():
+    chunk = WaveformChunk("h", 0.0, 0.01, [1000.0, -1000.0])
+    _, _, _, _, _, ints = decode_quantized(encode_chunk(chunk, SCALE))
+    assert list(ints) == [32767, -32768]
+
+
+@pytest.mark.parametrize("samples", [[], [0.0] * 0x10000])
+def test_chunk_size_limits(samples):
+    with pytest.raises(ValueError):
+        encode_chunk(WaveformChunk("h", 0.0, 0.01, samples), SCALE)
+
+
+def test_same_handle_on_two_devices_stays_apart():
+    a = decode_chunk(encode_chunk(WaveformChunk("ecg", 0.0, 0.01, [1.0], "urn:uuid:a"), SCALE))
+    b = decode_chunk(encode_chunk(WaveformChunk("ecg", 0.0, 0.01, [1.0], "urn:uuid:b"), SCALE))
+    assert (a.device, b.device) == ("urn:uuid:a", "urn:uuid:b")
+
+
+def test_chunk_without_device_has_empty_device():
+    assert decode_chunk(encode_chunk(WaveformChunk("ecg", 0.0, 0.01, [1.0]), SCALE)).device == ""
+
+
+def test_too_long_device_is_rejected():
+    with pytest.raises(ValueError):
+        encode_quantized("x" * 256, "h", 0.0, 0.01, SCALE, [1])
+
+
+@pytest.mark.parametrize("version", [1, 99])
+def test_unknown_version_is_rejected(version):
+    data = bytearray(encode_quantized("urn:uuid:a", "h", 0.0, 0.01, SCALE, [1, 2, 3]))
+    data[0] = version
+    with pytest.raises(ValueError):
+        decode_quantized(bytes(data))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.services.waveform_codec import WaveformChunk, decode_quantized, encode_chunk
+from app.services.waveform_pyramid import WaveformPyramid, minmax_decimate
+
+
+def test_decimated_frames_keep_the_device():
+    pyramid = WaveformPyramid([1, 4])
+    data = encode_chunk(WaveformChunk("ecg", 0.0, 0.004, [float(i % 7) for i in range(100)], "urn:uuid:a"), 0.01)
+    frame = pyramid.frames(data, [125.0])[125.0]
+    device, handle, _, period, _, ints = decode_quantized(frame)
+    assert (device, handle) == ("urn:uuid:a", "ecg")
+    assert period == pytest.approx(0.008)
+    assert len(ints) == 50
+
+
+def stream(n_chunks: int, size: int = 90, period: float = 0.004):
+    # velikost kosa ni veckratnik faktorjev, da se ostanki prenasajo
+    rng = np.random.default_rng(3)
+    signal = rng.normal(0, 1, n_chunks * size)
+    for i in range(n_chunks):
+        part = signal[i * size:(i + 1) * size]
+        yield encode_chunk(WaveformChunk("ecg", i * size * period, period, part.tolist(), "e"), 0.01)
+
+
+def level_rate(factor: int, period: float = 0.004) -> float:
+    return 2.0 / (period * factor)
+
+
+@pytest.mark.parametrize("factor", [4, 16, 64])
+def test_cascaded_level_matches_direct_decimation(factor):
+    pyramid = WaveformPyramid([1, 4, 16, 64])
+    out, raw = [], []
+    for data in stream(40):
+        raw.extend(decode_quantized(data)[5])
+        frame = pyramid.frames(data, [level_rate(factor)])[level_rate(factor)]
+        if frame is not None:
+            out.extend(decode_quantized(frame)[5])
+    raw = np.asarray(raw, dtype=np.int16)
+    expected = minmax_decimate(raw[:len(raw) // factor * factor], factor)
+    # zadnji vzorci cakajo v ostankih nizjih stopenj
+    assert out and out == expected[:len(out)].tolist()
+
+
+def test_levels_advance_while_nobody_reads_them():
+    coarse = level_rate(16)
+    always, late = WaveformPyramid([1, 4, 16]), WaveformPyramid([1, 4, 16])
+    chunks = list(stream(12))
+    for data in chunks[:-1]:
+        always.frames(data, [coarse])
+        late.frames(data, [0.0])
+    expected = always.frames(chunks[-1], [coarse])[coarse]
+    assert expected is not None
+    assert late.frames(chunks[-1], [coarse])[coarse] == expected
@@ -0,0 +1,386 @@
+import json
+import logging
+import os
+import pathlib
+import signal
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from simulation import (SIMULATORS, EcgSimulator, CapnographSimulator, VentilatorSimulator,
+                        init_metric_states, init_waveform_states, set_sample_rates,
+                        apply_metric_values, apply_waveform_chunks)
+from waveforms import EcgWaveform, CapnogramWaveform, VentilatorWaveforms, to_decimals
+from scheduler import Job, Scheduler, wall_time
+from log_setup import setup_logging, log_counters
+
+logger = logging.getLogger('sdc.devices')
+
+PROVIDERS_DIR = pathlib.Path(__file__).parent
+DEFAULT_MDIB = 'reference_mdib.xml'
+
+# Nastavitve samostojnih providerjev (provider_<tip>.py), ki zazenejo eno napravo:
+#   PROVIDER_UUID      EPR naprave
+#   METRIC_RATE        privzeta frekvenca posodabljanja metrik [Hz]
+#   METRIC_RATES       frekvence posameznih metrik, "handle=Hz,handle=Hz"
+#   WAVEFORM_CHUNK_MS  dolzina kosa valovne oblike
+METRIC_RATE = float(os.getenv('METRIC_RATE', '1'))
+METRIC_RATES = os.getenv('METRIC_RATES', '')
+WAVEFORM_CHUNK_MS = float(os.getenv('WAVEFORM_CHUNK_MS', '1000'))
+
+# Ime modela (DPWS) po tipu naprave, enako kot pri samostojnih providerjih
+DEVICE_MODELS = {
+    'spo2': 'TestDevice2',
+    'temperature': 'Temperature gauge',
+    'infusion': 'Infusion pump',
+    'ecg': 'ECG module',
+    'nibp': 'NIBP Module',
+    'capnograph': 'Capnograph',
+    'ventilator': 'Ventilator',
+}
+
+
+class EcgStream:
+    HANDLES = (EcgSimulator.WAVEFORM_HANDLE,)
+    DEFAULT_RATE = 500.0
+    RATE_ENV = 'ECG_SAMPLE_RATE'
+
+    def __init__(self, rate: float):
+        self.waveform = EcgWaveform(rate)
+
+    def chunk(self, count: int, simulator: EcgSimulator) -> Dict[str, list]:
+        return {self.HANDLES[0]: to_decimals(self.waveform.samples(count, simulator.current_hr))}
+
+
+class CapnogramStream:
+    HANDLES = (CapnographSimulator.WAVEFORM_HANDLE,)
+    DEFAULT_RATE = 25.0
+    RATE_ENV = 'CO2_SAMPLE_RATE'
+
+    def __init__(self, rate: float):
+        self.waveform = CapnogramWaveform(rate)
+
+    def chunk(self, count: int, simulator: CapnographSimulator) -> Dict[str, list]:
+        return {self.HANDLES[0]: to_decimals(self.waveform.samples(count, simulator.rr, simulator.etco2), places=1)}
+
+
+class VentilatorStream:
+    HANDLES = (VentilatorSimulator.PRESSURE_WAVEFORM_HANDLE, VentilatorSimulator.FLOW_WAVEFORM_HANDLE)
+    DEFAULT_RATE = 50.0
+    RATE_ENV = 'VENT_SAMPLE_RATE'
+
+    def __init__(self, rate: float):
+        self.waveforms = VentilatorWaveforms(rate)
+
+    def chunk(self, count: int, simulator: VentilatorSimulator) -> Dict[str, list]:
+        pressure, flow = self.waveforms.samples(count, simulator.rr, simulator.peep, simulator.pip, simulator.vt)
+        return {self.HANDLES[0]: to_decimals(pressure, places=1), self.HANDLES[1]: to_decimals(flow, places=1)}
+
+
+WAVEFORM_STREAMS = {
+    'ecg': EcgStream,
+    'capnograph': CapnogramStream,
+    'ventilator': VentilatorStream,
+}
+
+
+@dataclass
+class DeviceConfig:
+    type: str
+    uuid: str
+    mdib: str = DEFAULT_MDIB
+    location: Dict[str, str] = field(default_factory=dict)
+    metric_rate: float = 1.0
+    handle_rates: Dict[str, float] = field(default_factory=dict)
+    waveform_rate: Optional[float] = None
+    chunk_ms: float = 1000.0
+
+    @classmethod
+    def from_dict(cls, raw: Dict, defaults: Optional[Dict] = None) -> "DeviceConfig":
+        merged = {**(defaults or {}), **raw}
+        device_type = merged.get('type')
+        if device_type not in SIMULATORS:
+            raise ValueError(f"Unknown device type {device_type!r}, expected one of {', '.join(SIMULATORS)}")
+        raw_uuid = merged.get('uuid')
+        try:
+            device_uuid = str(uuid.UUID(str(raw_uuid)))
+        except ValueError:
+            raise ValueError(f"Invalid uuid for {device_type} device: {raw_uuid!r}")
+        rates = merged.get('rates', {})
+        location = {**(defaults or {}).get('location', {}), **raw.get('location', {})}
+        config = cls(
+            type=device_type,
+            uuid=device_uuid,
+            mdib=merged.get('mdib', DEFAULT_MDIB),
+            location=location,
+            metric_rate=float(rates.get('metrics', 1.0)),
+            handle_rates={h: float(r) for h, r in rates.get('handles', {}).items()},
+            waveform_rate=float(rates['waveform']) if 'waveform' in rates else None,
+            chunk_ms=float(merged.get('chunk_ms', 1000.0)),
+        )
+        config.validate()
+        return config
+
+    @classmethod
+    def from_env(cls, device_type: str) -> "DeviceConfig":
+        raw_uuid = os.getenv('PROVIDER_UUID')
+        if not raw_uuid:
+            raise RuntimeError("Environment variable PROVIDER_UUID is not set")
+        rates = {'metrics': METRIC_RATE, 'handles': parse_rates(METRIC_RATES)}
+        stream_cls = WAVEFORM_STREAMS.get(device_type)
+        if stream_cls and os.getenv(stream_cls.RATE_ENV):
+            rates['waveform'] = float(os.getenv(stream_cls.RATE_ENV))
+        return cls.from_dict({'type': device_type, 'uuid': raw_uuid, 'rates': rates, 'chunk_ms': WAVEFORM_CHUNK_MS})
+
+    def validate(self):
+        handles = SIMULATORS[self.type].HANDLES
+        for handle, rate in self.handle_rates.items():
+            if handle not in handles:
+                raise ValueError(f"{handle!r} is not a metric of {self.type} devices")
+            if rate <= 0:
+                raise ValueError(f"Rate for {handle} must be positive, got {rate}")
+        if self.metric_rate <= 0:
+            raise ValueError(f"Metric rate must be positive, got {self.metric_rate}")
+        if self.waveform_rate is not None and self.waveform_rate <= 0:
+            raise ValueError(f"Waveform rate must be positive, got {self.waveform_rate}")
+
+    def metric_rates(self) -> Dict[str, float]:
+        return {h: self.handle_rates.get(h, self.metric_rate) for h in SIMULATORS[self.type].HANDLES}
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    # "oxygen_saturation.ch0.spo2=10,bps.ch0.nibp_module=0.2"
+    rates = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        handle, sep, rate = item.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid rate {item!r}, expected handle=Hz")
+        rates[handle.strip()] = float(rate)
+    return rates
+
+
+def parse_uuid_list(spec: str) -> List[str]:
+    # enaka oblika kot DEVICE_UUIDS v backendu (JSON seznam) ali "uuid,uuid"
+    spec = spec.strip()
+    if spec.startswith('['):
+        items = json.loads(spec)
+        if not isinstance(items, list):
+            raise ValueError("PROVIDER_UUIDS must be a JSON list")
+        return [str(u) for u in items]
+    return [u.strip() for u in spec.split(',') if u.strip()]
+
+
+def apply_uuid_overrides(devices: List[Dict], env=os.environ) -> List[Dict]:
+    # uuid iz okolja ima prednost pred JSON:
+    #   PROVIDER_UUID_<TIP>  posamezna naprava (npr. PROVIDER_UUID_ECG); ob vec napravah istega tipa velja za prvo
+    #   PROVIDER_UUIDS       seznam po vrstnem redu naprav (lahko kar vrednost DEVICE_UUIDS sobe)
+    #   PROVIDER_UUID        ena naprava v konfiguraciji (kot pri samostojnih providerjih)
+    devices = [dict(d) for d in devices]
+    ordered = parse_uuid_list(env.get('PROVIDER_UUIDS', ''))
+    if len(ordered) > len(devices):
+        logger.warning(f'PROVIDER_UUIDS has {len(ordered)} entries for {len(devices)} devices, extra ignored')
+    for device, device_uuid in zip(devices, ordered):
+        device['uuid'] = device_uuid
+    if not ordered and len(devices) == 1 and env.get('PROVIDER_UUID'):
+        devices[0]['uuid'] = env['PROVIDER_UUID']
+    typed = set()
+    for device in devices:
+        device_type = str(device.get('type', ''))
+        override = env.get(f'PROVIDER_UUID_{device_type.upper()}')
+        if override and device_type not in typed:
+            device['uuid'] = override
+            typed.add(device_type)
+    return devices
+
+
+def load_device_configs(path: str, env=os.environ) -> List[DeviceConfig]:
+    # {"defaults": {...}, "devices": [{"type": "ecg", "uuid": "...", ...}]} ali samo seznam naprav
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+    defaults = {}
+    if isinstance(raw, dict):
+        defaults = raw.get('defaults', {})
+        raw = raw.get('devices', [])
+    if not isinstance(raw, list):
+        raise ValueError("devices must be a JSON list")
+    raw = apply_uuid_overrides(raw, env)
+    configs = [DeviceConfig.from_dict(d, defaults) for d in raw]
+    seen = set()
+    for config in configs:
+        if config.uuid in seen:
+            raise ValueError(f"Duplicate device uuid {config.uuid}")
+        seen.add(config.uuid)
+    return configs
+
+
+#MDIB datoteko preberemo enkrat; vsaka naprava dobi svojo instanco (stanja so locena)
+class MdibSource:
+    def __init__(self):
+        self._files: Dict[str, bytes] = {}
+
+    def load(self, name: str):
+        from sdc11073.mdib import ProviderMdib
+        path = pathlib.Path(name)
+        if not path.is_absolute():
+            path = PROVIDERS_DIR / path
+        key = str(path)
+        if key not in self._files:
+            self._files[key] = path.read_bytes()
+        return ProviderMdib.from_string(self._files[key])
+
+
+def get_network_adapter():
+    from sdc11073 import network
+    if (ip := os.getenv('ref_ip')) is not None:
+        return network.get_adapter_containing_ip(ip)
+    return next(adapter for adapter in network.get_adapters() if adapter.is_loopback)
+
+
+#Ena simulirana naprava: provider, simulator in (po potrebi) valovne oblike
+class SimulatedDevice:
+    def __init__(self, config: DeviceConfig, ws_discovery, mdib_source: MdibSource):
+        from sdc11073 import location, provider
+        from sdc11073.xml_types import dpws_types, pm_types
+
+        self.config = config
+        self.simulator = SIMULATORS[config.type]()
+        stream_cls = WAVEFORM_STREAMS.get(config.type)
+        self.waveform_rate = (config.waveform_rate or stream_cls.DEFAULT_RATE) if stream_cls else None
+        self.stream = stream_cls(self.waveform_rate) if stream_cls else None
+
+        model = DEVICE_MODELS[config.type]
+        self.provider = provider.SdcProvider(
+            ws_discovery=ws_discovery,
+            this_model=dpws_types.ThisModelType(
+                manufacturer='sdc11073', manufacturer_url='www.sdc11073.com', model_name=model,
+                model_number='1.0', model_url='www.draeger.com/model',
+                presentation_url='www.draeger.com/model/presentation'),
+            this_device=dpws_types.ThisDeviceType(friendly_name=model, firmware_version='Version1',
+                                                  serial_number=config.uuid[:8]),
+            device_mdib_container=mdib_source.load(config.mdib),
+            epr=uuid.UUID(config.uuid),
+            ssl_context_container=None,
+        )
+        for desc in self.provider.mdib.descriptions.objects:
+            desc.SafetyClassification = pm_types.SafetyClassification.MED_A
+        if self.stream:
+            set_sample_rates(self.provider.mdib, {h: self.waveform_rate for h in self.stream.HANDLES})
+        self.provider.start_all(start_rtsample_loop=False)
+
+        loc = location.SdcLocation(
+            fac=config.location.get('fac', os.getenv('ref_fac', 'fac')),
+            poc=config.location.get('poc', os.getenv('ref_poc', 'poc')),
+            bed=config.location.get('bed', os.getenv('ref_bed', 'bed')),
+        )
+        self.provider.set_location(loc, [pm_types.InstanceIdentifier('Validator', extension_string='System')])
+
+        mdib = self.provider.mdib
+        init_metric_states(mdib, self.simulator.HANDLES)
+        if hasattr(self.simulator, 'initial'):
+            apply_metric_values(mdib, self.simulator.initial())
+        if self.stream:
+            init_waveform_states(mdib, self.stream.HANDLES)
+
+        # osnovni takt je najhitrejsa metrika; pocasnejse se zapisejo na vsak n-ti takt
+        rates = config.metric_rates()
+        self.base_rate = max(rates.values())
+        self.divisors = {h: max(1, round(self.base_rate / r)) for h, r in rates.items()}
+        self._last_deadline: Optional[float] = None
+        self._metric_job: Optional[Job] = None
+
+        self.chunk_count = 0
+        self.jobs = []
+        self.metrics_sent = 0
+        self.samples_sent = 0
+
+    def schedule(self, scheduler: Scheduler):
+        self._metric_job = scheduler.every(1.0 / self.base_rate, self._metric_tick)
+        self.jobs.append(self._metric_job)
+        if self.stream:
+            self.chunk_count = max(1, int(round(self.waveform_rate * self.config.chunk_ms / 1000.0)))
+            duration = self.chunk_count / self.waveform_rate
+            # prvi kos se izteče po eni dolzini kosa
+            self.jobs.append(scheduler.every(duration, self._waveform_tick, delay=duration))
+
+    def _metric_tick(self, deadline: float):
+        # dt iz rokov: ob izpuscenih taktih simulacija vseeno napreduje za pravi cas
+        period = 1.0 / self.base_rate
+        dt = period if self._last_deadline is None else deadline - self._last_deadline
+        self._last_deadline = deadline
+        values = self.simulator.step(dt)
+
+        tick = self._metric_job.index
+        due = {h: v for h, v in values.items() if tick % self.divisors[h] == 0}
+        if not due:
+            return
+        # vse metrike naprave v eni transakciji na takt
+        apply_metric_values(self.provider.mdib, due, wall_time(deadline))
+        log_counters.count('metric_updates', len(due))
+        self.metrics_sent += len(due)
+        logger.debug(f'{self.config.type} {self.config.uuid[:8]}: {due}')
+
+    def _waveform_tick(self, deadline: float):
+        # kos pokriva interval [rok - trajanje, rok); zaporedni kosi so brez vrzeli
+        t0 = wall_time(deadline) - self.chunk_count / self.waveform_rate
+        chunks = self.stream.chunk(self.chunk_count, self.simulator)
+        apply_waveform_chunks(self.provider.mdib, chunks, t0)
+        log_counters.count('waveform_samples', self.chunk_count * len(chunks))
+        self.samples_sent += self.chunk_count * len(chunks)
+
+    def stop(self):
+        for job in self.jobs:
+            job.cancel()
+        try:
+            self.provider.stop_all()
+        except Exception as e:
+            logger.debug(f'Provider {self.config.uuid} stop failed: {e}')
+
+
+def run_devices(configs: List[DeviceConfig], stop_event, name: str = 'SimScheduler',
+                on_ready: Optional[Callable[[Scheduler, List["SimulatedDevice"]], None]] = None):
+    # en WSDiscovery, en vir MDIB in en razporejevalnik za vse naprave;
+    # on_ready lahko doda svoja opravila na isti razporejevalnik (npr. loadgen statistika)
+    from sdc11073 import wsdiscovery
+
+    ws_discovery = wsdiscovery.WSDiscovery(get_network_adapter().ip)
+    ws_discovery.start()
+    mdib_source = MdibSource()
+    scheduler = Scheduler(name)
+    devices: List[SimulatedDevice] = []
+    try:
+        for config in configs:
+            try:
+                device = SimulatedDevice(config, ws_discovery, mdib_source)
+            except Exception as e:
+                logger.error(f'Device {config.type} {config.uuid} failed to start: {e}', exc_info=True)
+                continue
+            device.schedule(scheduler)
+            devices.append(device)
+            logger.info(f'Started {config.type} device {config.uuid}')
+
+        logger.info(f'{name} running {len(devices)}/{len(configs)} devices')
+        if on_ready:
+            on_ready(scheduler, devices)
+        scheduler.run(stop_event)
+    finally:
+        for device in devices:
+            device.stop()
+        ws_discovery.stop()
+        if scheduler.max_late_ms:
+            logger.info(f'{name} stopped (max scheduling delay {scheduler.max_late_ms:.1f} ms)')
+
+
+def run_standalone(device_type: str):
+    # vstopna tocka provider_<tip>.py: ena naprava, nastavitve iz okolja
+    setup_logging(f'provider_{device_type}')
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    try:
+        run_devices([DeviceConfig.from_env(device_type)], stop_event, f'provider_{device_type}')
+    except KeyboardInterrupt:
+        print("\nStopping provider...")
+    except Exception as e:
+        logging.getLogger('sdc').error(f'Error: {e}')
@@ -0,0 +1,238 @@
+"""Generator obremenitve: N navideznih SDC providerjev na localhostu.
+
+Primer:
+    python loadgen.py --devices 70 --types ecg,spo2,nibp --rate 5 --processes 4 \
+        --backend http://127.0.0.1:8000 --room loadtest --duration 120
+
+Naprave so enake kot v provider_host.py (devices.SimulatedDevice na skupnem
+razporejevalniku iz scheduler.py), zato simulacija tece v pravem casu pri vsaki
+--rate. Soba se registrira prek PUT /rooms/{room}, latenca se meri na WebSocketu
+backenda (cas dolocitve na napravi -> prejem okvirja; posnetki ob povezavi se ne stejejo).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import time
+import urllib.request
+import uuid
+from typing import Dict, List, Tuple
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger('loadgen')
+
+UUID_NAMESPACE = uuid.UUID('6f1c0e4e-4b7a-4f5e-9d38-0c2f3a1b5e77')
+
+# glej sdc_backend/app/services/waveform_codec.py
+_WAVEFORM_HEADER = struct.Struct("<BBHdff")
+_WAVEFORM_VERSION = 2
+
+
+def parse_args():
+    from simulation import SIMULATORS
+    parser = argparse.ArgumentParser(description="Synthetic SDC provider fleet")
+    parser.add_argument('--devices', type=int, default=7, help="number of virtual providers")
+    parser.add_argument('--types', default=','.join(SIMULATORS), help="device types, assigned round-robin")
+    parser.add_argument('--rate', type=float, default=1.0, help="metric updates per second per device")
+    parser.add_argument('--waveform-rate', type=float, default=None,
+                        help="waveform samples per second (waveform devices; default per device type)")
+    parser.add_argument('--chunk-ms', type=int, default=100, help="waveform chunk length in ms")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes hosting the providers")
+    parser.add_argument('--duration', type=float, default=60.0, help="test duration in seconds")
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    parser.add_argument('--backend', default='http://127.0.0.1:8000', help="sdc_backend base URL")
+    parser.add_argument('--room', default='loadtest')
+    parser.add_argument('--no-register', action='store_true', help="do not PUT the room to the backend")
+    parser.add_argument('--keep-room', action='store_true', help="do not DELETE the room afterwards")
+    return parser.parse_args()
+
+
+def device_plan(args) -> List[Tuple[str, str]]:
+    types = [t.strip() for t in args.types.split(',') if t.strip()]
+    # stabilni UUID-ji, da ponovni zagon uporabi iste naprave
+    return [(str(uuid.uuid5(UUID_NAMESPACE, f"{args.room}/{i}")), types[i % len(types)])
+            for i in range(args.devices)]
+
+
+def device_config(provider_uuid: str, device_type: str, args):
+    from devices import DeviceConfig, WAVEFORM_STREAMS
+    rates = {'metrics': args.rate}
+    if args.waveform_rate and device_type in WAVEFORM_STREAMS:
+        rates['waveform'] = args.waveform_rate
+    return DeviceConfig.from_dict({'type': device_type, 'uuid': provider_uuid, 'rates': rates,
+                                   'chunk_ms': args.chunk_ms})
+
+
+def run_worker(worker_id: int, devices: List[Tuple[str, str]], args, stats_queue, stop_event):
+    from devices import run_devices
+
+    configs = [device_config(provider_uuid, device_type, args) for provider_uuid, device_type in devices]
+
+    def on_ready(scheduler, fleet):
+        cpu_start = time.process_time()
+
+        def report(_deadline: float):
+            stats_queue.put((worker_id, len(fleet), sum(d.metrics_sent for d in fleet),
+                             sum(d.samples_sent for d in fleet), scheduler.failures,
+                             time.process_time() - cpu_start))
+
+        scheduler.every(1.0, report, delay=1.0)
+
+    run_devices(configs, stop_event, f'LoadGen-{worker_id}', on_ready)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class WsProbe:
+    def __init__(self, url: str):
+        self.url = url
+        self.frames = 0
+        self.metrics = 0
+        self.samples = 0
+        self.metric_latency: List[float] = []
+        self.waveform_latency: List[float] = []
+
+    def reset_window(self):
+        self.metric_latency, self.waveform_latency = [], []
+
+    def on_message(self, message):
+        now = time.time()
+        self.frames += 1
+        if isinstance(message, bytes):
+            version, _, count, t0, period, _ = _WAVEFORM_HEADER.unpack_from(message, 0)
+            if version != _WAVEFORM_VERSION:
+                logger.warning(f"Unsupported waveform chunk version {version}")
+                return
+            self.samples += count
+            self.waveform_latency.append(now - (t0 + max(0, count - 1) * period))
+            return
+        data = json.loads(message)
+        for envelope in data if isinstance(data, list) else [data]:
+            if envelope.get('snapshot'):
+                # zadnje vrednosti ob (ponovni) povezavi: njihova starost ni zakasnitev cevovoda
+                continue
+            metrics = envelope.get('metrics', {})
+            self.metrics += len(metrics)
+            dts = envelope.get('dts')
+            if dts:
+                self.metric_latency.append(now - max(dts.values()) / 1e9)
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                async with websockets.connect(self.url, max_size=None) as ws:
+                    while not stop.is_set():
+                        try:
+                            self.on_message(await asyncio.wait_for(ws.recv(), timeout=1.0))
+                        except asyncio.TimeoutError:
+                            continue
+            except Exception as e:
+                logger.warning(f"WebSocket probe error: {e}, reconnecting")
+                await asyncio.sleep(1.0)
+
+
+def _http(method: str, url: str, body: Dict | None = None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+async def main_async(args):
+    plan = device_plan(args)
+    if not args.no_register:
+        _http('PUT', f"{args.backend}/rooms/{args.room}", {"device_uuids": [u for u, _ in plan]})
+        logger.info(f"Registered room {args.room} with {len(plan)} devices")
+
+    stop_event = multiprocessing.Event()
+    stats_queue = multiprocessing.Queue()
+    shards = [plan[i::args.processes] for i in range(args.processes)]
+    workers = [multiprocessing.Process(target=run_worker, args=(i, shard, args, stats_queue, stop_event), daemon=True)
+               for i, shard in enumerate(shards) if shard]
+    for worker in workers:
+        worker.start()
+
+    ws_url = args.backend.replace('http', 'ws', 1) + f"/ws/medical-device/{args.room}"
+    probe = WsProbe(ws_url)
+    probe_stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe.run(probe_stop))
+
+    worker_stats: Dict[int, tuple] = {}
+    previous: Dict[int, tuple] = {}
+    window_start = started = time.monotonic()
+    window_frames = window_metrics = window_samples = 0
+    all_metric_latency: List[float] = []
+    all_waveform_latency: List[float] = []
+
+    try:
+        while time.monotonic() - started < args.duration:
+            await asyncio.sleep(args.report_interval)
+            while not stats_queue.empty():
+                stat = stats_queue.get_nowait()
+                worker_stats[stat[0]] = stat
+
+            elapsed = time.monotonic() - window_start
+            sent_metrics = sum(s[2] - previous.get(w, (0, 0, 0, 0, 0, 0))[2] for w, s in worker_stats.items())
+            sent_samples = sum(s[3] - previous.get(w, (0, 0, 0, 0, 0, 0))[3] for w, s in worker_stats.items())
+            cpu = sum(s[5] - previous.get(w, (0, 0, 0, 0, 0, 0))[5] for w, s in worker_stats.items())
+            errors = sum(s[4] for s in worker_stats.values())
+            previous = dict(worker_stats)
+
+            ml, wl = probe.metric_latency, probe.waveform_latency
+            all_metric_latency.extend(ml)
+            all_waveform_latency.extend(wl)
+            print(
+                f"[{time.monotonic() - started:6.1f}s] "
+                f"sent {sent_metrics / elapsed:8.1f} metrics/s {sent_samples / elapsed:9.1f} samples/s | "
+                f"ws {(probe.frames - window_frames) / elapsed:7.1f} frames/s "
+                f"{(probe.metrics - window_metrics) / elapsed:8.1f} metrics/s "
+                f"{(probe.samples - window_samples) / elapsed:9.1f} samples/s | "
+                f"metric p50/p99 {percentile(ml, 0.5) * 1000:6.1f}/{percentile(ml, 0.99) * 1000:6.1f} ms "
+                f"waveform p50/p99 {percentile(wl, 0.5) * 1000:6.1f}/{percentile(wl, 0.99) * 1000:6.1f} ms | "
+                f"cpu/device {cpu / elapsed / max(1, len(plan)) * 100:5.2f}% | errors {errors}",
+                flush=True,
+            )
+            window_start = time.monotonic()
+            window_frames, window_metrics, window_samples = probe.frames, probe.metrics, probe.samples
+            probe.reset_window()
+    finally:
+        stop_event.set()
+        probe_stop.set()
+        await probe_task
+        for worker in workers:
+            worker.join(timeout=10)
+        if not args.no_register and not args.keep_room:
+            try:
+                _http('DELETE', f"{args.backend}/rooms/{args.room}")
+            except Exception as e:
+                logger.warning(f"Failed to delete room {args.room}: {e}")
+
+    total = time.monotonic() - started
+    print(
+        f"\nSummary: {len(plan)} devices, {total:.0f}s, ws {probe.metrics / total:.1f} metrics/s, "
+        f"{probe.samples / total:.1f} samples/s, "
+        f"metric latency p50 {percentile(all_metric_latency, 0.5) * 1000:.1f} ms "
+        f"p99 {percentile(all_metric_latency, 0.99) * 1000:.1f} ms, "
+        f"waveform latency p50 {percentile(all_waveform_latency, 0.5) * 1000:.1f} ms "
+        f"p99 {percentile(all_waveform_latency, 0.99) * 1000:.1f} ms"
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=os.getenv('LOADGEN_LOG_LEVEL', 'INFO'))
+    arguments = parse_args()
+    if websockets is None:
+        raise SystemExit("loadgen needs the 'websockets' package for the latency probe")
+    asyncio.run(main_async(arguments))
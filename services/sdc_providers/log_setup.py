@@ -0,0 +1,214 @@
+# Kopija services/sdc_backend/app/services/log_setup.py (sliki se gradita loceno); spremembe vnesi v obe.
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Nastavitve dnevnika:
+#   SDC_LOG_LEVEL             osnovni nivo (INFO)
+#   SDC_LOG_FORMAT            "text" ali "json" (ena vrstica JSON na zapis)
+#   SDC_LOG_QUEUE_SIZE        velikost vrste do pisalne niti; ob polni vrsti zapis zavrzemo
+#   SDC_LOG_RATE / _BURST     omejitev na kljuc (mesto klica + room/epr/handle), zapisov/s in zalogaj
+#   SDC_LOG_SAMPLE_EVERY      za DEBUG/INFO prepusti vsak N-ti zapis kljuca
+#   SDC_LOG_SUMMARY_INTERVAL  perioda povzetka stevcev v sekundah (0 = izklop)
+LOG_LEVEL = os.getenv("SDC_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("SDC_LOG_FORMAT", "text").lower()
+LOG_QUEUE_SIZE = int(os.getenv("SDC_LOG_QUEUE_SIZE", "10000"))
+LOG_RATE = float(os.getenv("SDC_LOG_RATE", "1.0"))
+LOG_BURST = float(os.getenv("SDC_LOG_BURST", "10"))
+LOG_SAMPLE_EVERY = int(os.getenv("SDC_LOG_SAMPLE_EVERY", "1"))
+LOG_SUMMARY_INTERVAL = float(os.getenv("SDC_LOG_SUMMARY_INTERVAL", "60"))
+
+FIELDS = ("room_id", "epr", "handle")
+_MAX_KEYS = 10000
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, service: str, fmt: str = LOG_FORMAT):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        self.service = service
+        self.json = fmt == "json"
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {name: getattr(record, name) for name in FIELDS if getattr(record, name, None) is not None}
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            fields["suppressed"] = suppressed
+        counters = getattr(record, "counters", None)
+
+        if self.json:
+            entry = {
+                "ts": record.created,
+                "level": record.levelname,
+                "service": self.service,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if counters:
+                entry["counters"] = counters
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = super().format(record)
+        if counters:
+            fields.update(counters)
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+#Omejevanje po kljucu (mesto klica + strukturirana polja) z vedrom zetonov
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate: float = LOG_RATE, burst: float = LOG_BURST, sample_every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = max(1, sample_every)
+        self._buckets: "OrderedDict[Tuple, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def _key(self, record: logging.LogRecord) -> Tuple:
+        return (record.name, record.levelno, record.pathname, record.lineno,
+                *(getattr(record, name, None) for name in FIELDS))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        key = self._key(record)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # [zetoni, zadnji cas, izpusceni, stevec za vzorcenje]
+                bucket = self._buckets[key] = [self.burst, now, 0, 0]
+                if len(self._buckets) > _MAX_KEYS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+            if record.levelno < logging.WARNING and self.sample_every > 1:
+                bucket[3] += 1
+                if bucket[3] % self.sample_every != 1:
+                    bucket[2] += 1
+                    self.suppressed_total += 1
+                    return False
+
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                self.suppressed_total += 1
+                return False
+
+            bucket[0] -= 1.0
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # nit z obvestili nikoli ne caka na disk
+            self.dropped += 1
+
+
+#Stevci namesto vrstice na sporocilo; povzetek se izpise periodicno
+class LogCounters:
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def drain(self) -> Dict[str, int]:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+
+log_counters = LogCounters()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_rate_filter: Optional[RateLimitFilter] = None
+_summary_thread: Optional[threading.Thread] = None
+_summary_stop = threading.Event()
+
+
+def _summary_loop(interval: float):
+    summary_logger = logging.getLogger("sdc.summary")
+    while not _summary_stop.wait(interval):
+        counters = log_counters.drain()
+        if _rate_filter and _rate_filter.suppressed_total:
+            counters["log_suppressed"] = _rate_filter.suppressed_total
+            _rate_filter.suppressed_total = 0
+        if _queue_handler and _queue_handler.dropped:
+            counters["log_dropped"] = _queue_handler.dropped
+            _queue_handler.dropped = 0
+        if counters:
+            summary_logger.info(f"summary for last {interval:.0f}s", extra={"counters": counters})
+
+
+def setup_logging(service: str, level: str = LOG_LEVEL):
+    global _listener, _queue_handler, _rate_filter, _summary_thread
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(StructuredFormatter(service))
+
+    _rate_filter = RateLimitFilter()
+    _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(_rate_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    # sdc11073 in uvicorn imata lastne sinhrone handlerje; vse gre skozi korenski logger
+    for name in ("sdc", "uvicorn", "uvicorn.error", "uvicorn.access"):
+        named = logging.getLogger(name)
+        for handler in list(named.handlers):
+            named.removeHandler(handler)
+        named.propagate = True
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    if LOG_SUMMARY_INTERVAL > 0:
+        _summary_stop.clear()
+        _summary_thread = threading.Thread(target=_summary_loop, args=(LOG_SUMMARY_INTERVAL,),
+                                           daemon=True, name="LogSummary")
+        _summary_thread.start()
+
+
+def shutdown_logging():
+    global _listener
+    _summary_stop.set()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
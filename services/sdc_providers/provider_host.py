@@ -0,0 +1,79 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+from typing import List
+
+from log_setup import setup_logging, shutdown_logging
+from devices import DeviceConfig, load_device_configs, run_devices
+
+# Vec simuliranih naprav v enem procesu: skupen WSDiscovery, razporejevalnik in MDIB.
+#   PROVIDER_HOST_CONFIG   pot do JSON konfiguracije naprav
+#   PROVIDER_HOST_WORKERS  st. procesov, med katere razdelimo naprave
+#   PROVIDER_UUIDS, PROVIDER_UUID_<TIP>  uuid naprav iz okolja (JSON je privzeto), glej devices.apply_uuid_overrides
+PROVIDER_HOST_CONFIG = os.getenv('PROVIDER_HOST_CONFIG', os.path.join(os.path.dirname(__file__), 'providers.json'))
+PROVIDER_HOST_WORKERS = int(os.getenv('PROVIDER_HOST_WORKERS', '1'))
+
+
+def run_shard(configs: List[DeviceConfig], stop_event, shard: int = 0):
+    setup_logging('provider_host')
+    try:
+        run_devices(configs, stop_event, f'SimScheduler-{shard}')
+    finally:
+        shutdown_logging()
+
+
+def _shard_main(configs: List[DeviceConfig], stop_event, shard: int):
+    # SIGTERM/SIGINT obravnava glavni proces, ki nastavi stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    run_shard(configs, stop_event, shard)
+
+
+def split_shards(configs: List[DeviceConfig], workers: int) -> List[List[DeviceConfig]]:
+    workers = max(1, min(workers, len(configs)))
+    return [configs[i::workers] for i in range(workers)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run simulated SDC devices from a config file')
+    parser.add_argument('--config', default=PROVIDER_HOST_CONFIG, help='JSON device config')
+    parser.add_argument('--workers', type=int, default=PROVIDER_HOST_WORKERS,
+                        help='number of processes to shard devices across')
+    args = parser.parse_args()
+
+    configs = load_device_configs(args.config)
+    if not configs:
+        raise SystemExit(f'No devices configured in {args.config}')
+    shards = split_shards(configs, args.workers)
+
+    if len(shards) == 1:
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        try:
+            run_shard(shards[0], stop_event)
+        except KeyboardInterrupt:
+            print("\nStopping provider host...")
+        return
+
+    # "spawn": vsak proces uvozi sdc11073 na novo, brez podedovanih niti
+    ctx = multiprocessing.get_context('spawn')
+    stop_event = ctx.Event()
+    processes = [ctx.Process(target=_shard_main, args=(shard, stop_event, i), name=f'provider-shard-{i}')
+                 for i, shard in enumerate(shards)]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\nStopping provider host...")
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger('sdc.scheduler')
+
+# Razmik med monotono uro in stensko uro, dolocen enkrat ob zagonu; casi dolocitve
+# (DeterminationTime) so tako izracunani iz nacrtovanega roka, ne iz trenutka izvedbe.
+_WALL_OFFSET = time.time() - time.monotonic()
+
+
+def wall_time(monotonic_ts: float) -> float:
+    return monotonic_ts + _WALL_OFFSET
+
+
+class Job:
+    __slots__ = ('period', 'callback', 'start', 'index', 'deadline', 'runs', 'skipped', 'cancelled')
+
+    def __init__(self, period: float, callback: Callable[[float], None], start: float):
+        self.period = period
+        self.callback = callback
+        self.start = start
+        self.index = 0
+        self.deadline = start
+        self.runs = 0
+        self.skipped = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+#Skupni razporejevalnik: roki so start + k * perioda, zato se napake ne sestevajo
+class Scheduler:
+    MAX_BEHIND = 5
+
+    def __init__(self, name: str = 'SimScheduler'):
+        self.name = name
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.max_late_ms = 0.0
+        self.failures = 0
+
+    def every(self, period: float, callback: Callable[[float], None], delay: float = 0.0) -> Job:
+        # callback dobi nacrtovani rok (monotonic), ne dejanskega casa izvedbe
+        if period <= 0:
+            raise ValueError(f"Job period must be positive, got {period}")
+        job = Job(period, callback, time.monotonic() + delay)
+        with self._lock:
+            heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        self._wakeup.set()
+        return job
+
+    def run(self, stop_event: Optional[threading.Event] = None):
+        stop_event = stop_event or self._stop
+        while not stop_event.is_set():
+            with self._lock:
+                if not self._heap:
+                    timeout = None
+                    job = None
+                else:
+                    deadline, _, job = self._heap[0]
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        heapq.heappop(self._heap)
+                    else:
+                        job = None
+            if job is None:
+                self._wakeup.wait(0.5 if timeout is None else min(timeout, 0.5))
+                self._wakeup.clear()
+                continue
+            if job.cancelled:
+                continue
+
+            now = time.monotonic()
+            self.max_late_ms = max(self.max_late_ms, (now - job.deadline) * 1000.0)
+            try:
+                job.callback(job.deadline)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f'Scheduled job failed: {e}', exc_info=True)
+            job.runs += 1
+
+            job.index += 1
+            next_deadline = job.start + job.index * job.period
+            behind = time.monotonic() - next_deadline
+            if behind > self.MAX_BEHIND * job.period:
+                # predolg zaostanek: zamujene roke izpustimo, mreza ostane ista
+                missed = int(behind // job.period)
+                job.index += missed
+                job.skipped += missed
+                next_deadline = job.start + job.index * job.period
+            job.deadline = next_deadline
+            with self._lock:
+                heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
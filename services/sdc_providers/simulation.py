@@ -0,0 +1,252 @@
+import decimal
+import math
+import random
+import time
+from typing import Dict, Iterable, Optional
+
+from sdc11073.xml_types import pm_types
+
+# Simulacija vrednosti za posamezne tipe naprav. Klic step(dt) premakne simulacijo
+# za dt sekund in vrne {handle: vrednost}; nakljucni sprehodi so skalirani z dt,
+# zato je dinamika enaka pri 10 Hz ali 0.2 Hz.
+
+def _q(value: float, places: str = '1.0') -> decimal.Decimal:
+    return decimal.Decimal(value).quantize(decimal.Decimal(places))
+
+
+class SpO2Simulator:
+    HANDLES = ('oxygen_saturation.ch0.spo2',)
+
+    def __init__(self):
+        self.current_spo2 = 98.0
+        self.min_spo2, self.max_spo2 = 85.0, 100.0
+        self.t = 0
+        self.hypoxia_triggered = False
+        self.hypoxia_duration = 0
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        sine_variation = math.sin(self.t / 30.0) * 0.3 * dt
+        noise = random.gauss(0, 0.1 * math.sqrt(dt))
+
+        if self.hypoxia_triggered:
+            self.current_spo2 -= 0.2 * dt
+            self.hypoxia_duration -= dt
+            if self.hypoxia_duration <= 0:
+                self.hypoxia_triggered = False
+        else:
+            self.current_spo2 += (98.0 - self.current_spo2) * min(0.05 * dt, 1.0) + sine_variation + noise
+
+            if random.random() < 0.01 * dt:
+                self.hypoxia_triggered = True
+                self.hypoxia_duration = random.randint(5, 10)
+
+        self.current_spo2 = max(self.min_spo2, min(self.max_spo2, self.current_spo2))
+        self.t += dt
+        return {'oxygen_saturation.ch0.spo2': _q(self.current_spo2)}
+
+
+class TemperatureSimulator:
+    HANDLES = ('temperature.ch0.temperature_gauge',)
+
+    def __init__(self):
+        self.current_temp = 36.8
+        self.min_temp, self.max_temp = 35.5, 38.0
+        self.t = 0
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        sine_variation = math.sin(self.t / 100.0) * 0.2 * dt
+        drift = random.gauss(0, 0.02 * math.sqrt(dt))
+        target_temp = 36.5
+
+        self.current_temp += (target_temp - self.current_temp) * min(0.01 * dt, 1.0) + sine_variation + drift
+        self.current_temp = max(self.min_temp, min(self.max_temp, self.current_temp))
+        self.t += dt
+        return {'temperature.ch0.temperature_gauge': _q(self.current_temp)}
+
+
+class InfusionSimulator:
+    HANDLES = ('drugName.ch0.infusion_pump', 'flowRate.ch0.infusion_pump', 'volumeTotal.ch0.infusion_pump')
+    DRUG_NAMES = ["Propofol", "Saline", "Dopamine", "Fentanyl", "Midazolam"]
+
+    def __init__(self):
+        self.current_drug = random.choice(self.DRUG_NAMES)
+        self.infusion_rate = 25.0
+        self.total_volume = 0.0
+        self.t = 0
+
+    def initial(self) -> Dict[str, str]:
+        return {'drugName.ch0.infusion_pump': self.current_drug}
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        variation = math.sin(self.t / 20.0) * 0.5 + random.gauss(0, 0.2)
+        infusion_rate_dynamic = max(0.0, self.infusion_rate + variation)
+        self.total_volume += infusion_rate_dynamic * dt / 3600.0
+        self.t += dt
+        return {
+            'flowRate.ch0.infusion_pump': _q(infusion_rate_dynamic, '0.1'),
+            'volumeTotal.ch0.infusion_pump': _q(self.total_volume, '1'),
+        }
+
+
+class EcgSimulator:
+    HANDLES = ('heartRate.ch0.ecg_module', 'rrInterval.ch0.ecg_module', 'qrsDuration.ch0.ecg_module')
+    WAVEFORM_HANDLE = 'ecgWaveform.ch0.ecg_module'
+
+    def __init__(self):
+        self.current_hr = 75
+        self.t = 0
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        hr_noise = random.gauss(0, 1.5 * math.sqrt(dt))
+        self.current_hr += (75 - self.current_hr) * min(0.05 * dt, 1.0) + hr_noise
+        self.current_hr = max(50, min(120, self.current_hr))
+        hr_decimal = _q(self.current_hr, '1')
+
+        rr_value = 60000.0 / float(hr_decimal)
+
+        qrs_value = 90 + math.sin(self.t / 30.0) * 10 + random.gauss(0, 3)
+        qrs_value = max(60, min(140, qrs_value))
+        self.t += dt
+        return {
+            'heartRate.ch0.ecg_module': hr_decimal,
+            'rrInterval.ch0.ecg_module': _q(rr_value, '1'),
+            'qrsDuration.ch0.ecg_module': _q(qrs_value, '1'),
+        }
+
+
+class NibpSimulator:
+    HANDLES = ('bps.ch0.nibp_module', 'bpd.ch0.nibp_module', 'bpa.ch0.nibp_module')
+
+    def __init__(self):
+        self.base_sys, self.base_dia = 120.0, 80.0
+        self.t = 0
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        angle = self.t / 30.0
+        sys_variation = math.sin(angle) * 5.0 + random.gauss(0, 1)
+        dia_variation = math.sin(angle + math.pi / 6) * 3.0 + random.gauss(0, 1)
+
+        systolic = self.base_sys + sys_variation
+        diastolic = self.base_dia + dia_variation
+        mean_art = (systolic + 2 * diastolic) / 3.0
+
+        self.t += dt
+        return {
+            'bps.ch0.nibp_module': _q(max(30.0, min(200.0, systolic))),
+            'bpd.ch0.nibp_module': _q(max(30.0, min(200.0, diastolic))),
+            'bpa.ch0.nibp_module': _q(max(30.0, min(200.0, mean_art))),
+        }
+
+
+class CapnographSimulator:
+    HANDLES = ('co2.ch0.capnograph', 'rf.ch0.capnograph')
+    WAVEFORM_HANDLE = 'co2Waveform.ch0.capnograph'
+
+    def __init__(self):
+        self.base_co2 = 40.0
+        self.base_rf = 16.0
+        self.etco2, self.rr = self.base_co2, self.base_rf
+        self.t = 0
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        co2_variation = math.sin(self.t / 10.0) * 5.0 + random.gauss(0, 1)
+        rf_variation = random.gauss(0, 0.5)
+
+        self.etco2 = etco2 = max(0.0, min(100.0, self.base_co2 + co2_variation))
+        self.rr = rr = max(5.0, min(40.0, self.base_rf + rf_variation))
+        self.t += dt
+        return {'co2.ch0.capnograph': _q(etco2), 'rf.ch0.capnograph': _q(rr)}
+
+
+class VentilatorSimulator:
+    HANDLES = ('vol.ch0.mechanical_ventilator', 'rf.ch0.mechanical_ventilator', 'ox_con.ch0.mechanical_ventilator',
+               'peep.ch0.mechanical_ventilator', 'pip.ch0.mechanical_ventilator')
+    PRESSURE_WAVEFORM_HANDLE = 'pawWaveform.ch0.mechanical_ventilator'
+    FLOW_WAVEFORM_HANDLE = 'flowWaveform.ch0.mechanical_ventilator'
+
+    def __init__(self):
+        self.base_vt, self.base_rf, self.base_fio2 = 500.0, 12.0, 40.0
+        self.base_peep, self.base_pip = 5.0, 20.0
+        # zadnje vrednosti koraka (za valovne oblike)
+        self.vt, self.rr, self.peep, self.pip = self.base_vt, self.base_rf, self.base_peep, self.base_pip
+        self.t = 0
+
+    def step(self, dt: float = 1.0) -> Dict[str, decimal.Decimal]:
+        t = self.t
+        vt_val = self.base_vt + math.sin(t / 20.0) * 50 + random.gauss(0, 10)
+        rr_val = self.base_rf + random.gauss(0, 1)
+        fio2_val = self.base_fio2 + random.gauss(0, 2)
+        peep_val = self.base_peep + math.sin(t / 30.0) * 1 + random.gauss(0, 0.5)
+        pip_val = self.base_pip + math.sin(t / 25.0) * 2 + random.gauss(0, 1)
+        self.t += dt
+        self.vt = max(100.0, min(1000.0, vt_val))
+        self.rr = max(5.0, min(40.0, rr_val))
+        self.peep = max(0.0, min(20.0, peep_val))
+        self.pip = max(5.0, min(50.0, pip_val))
+        return {
+            'vol.ch0.mechanical_ventilator': _q(self.vt),
+            'rf.ch0.mechanical_ventilator': _q(self.rr),
+            'ox_con.ch0.mechanical_ventilator': _q(max(21.0, min(100.0, fio2_val))),
+            'peep.ch0.mechanical_ventilator': _q(self.peep),
+            'pip.ch0.mechanical_ventilator': _q(self.pip),
+        }
+
+
+SIMULATORS = {
+    'spo2': SpO2Simulator,
+    'temperature': TemperatureSimulator,
+    'infusion': InfusionSimulator,
+    'ecg': EcgSimulator,
+    'nibp': NibpSimulator,
+    'capnograph': CapnographSimulator,
+    'ventilator': VentilatorSimulator,
+}
+
+
+def init_metric_states(mdib, handles: Iterable[str]):
+    with mdib.metric_state_transaction() as mgr:
+        for handle in handles:
+            state = mgr.get_state(handle)
+            if not state.MetricValue:
+                state.mk_metric_value()
+
+
+def set_sample_rates(mdib, rates: Dict[str, float]):
+    # pred start_all(): SamplePeriod deskriptorja mora ustrezati dejanski frekvenci
+    for handle, rate in rates.items():
+        mdib.descriptions.handle.get_one(handle).SamplePeriod = 1.0 / rate
+
+
+def init_waveform_states(mdib, handles: Iterable[str]):
+    with mdib.rt_sample_state_transaction() as mgr:
+        for handle in handles:
+            state = mgr.get_state(handle)
+            state.ActivationState = pm_types.ComponentActivation.ON
+            if not state.MetricValue:
+                state.mk_metric_value()
+
+
+def apply_metric_values(mdib, values: Dict[str, object], determination_time: Optional[float] = None):
+    # vse vrednosti koraka v eni transakciji (eno porocilo)
+    determination_time = determination_time or time.time()
+    with mdib.metric_state_transaction() as mgr:
+        for handle, value in values.items():
+            state = mgr.get_state(handle)
+            if not state.MetricValue:
+                state.mk_metric_value()
+            state.MetricValue.Value = value
+            state.MetricValue.DeterminationTime = determination_time
+
+
+def apply_waveform_samples(mdib, handle: str, samples, determination_time: float):
+    apply_waveform_chunks(mdib, {handle: samples}, determination_time)
+
+
+def apply_waveform_chunks(mdib, chunks: Dict[str, list], determination_time: float):
+    # vec valovnih oblik iste naprave v eni transakciji
+    with mdib.rt_sample_state_transaction() as mgr:
+        for handle, samples in chunks.items():
+            state = mgr.get_state(handle)
+            state.MetricValue.Samples = samples
+            state.MetricValue.DeterminationTime = determination_time
+            state.MetricValue.MetricQuality.Validity = pm_types.MeasurementValidity.VALID
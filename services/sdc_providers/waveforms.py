@@ -0,0 +1,155 @@
+import decimal
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Sinteza valovnih oblik iz vnaprej izracunanih predlog. Predloga opisuje en cikel
+# (srcni utrip ali vdih) v TABLE_SIZE tockah; ura faze tece s trenutno frekvenco,
+# zato je signal zvezen med kosi in sledi spremembam HR/RR brez ponovnega racunanja.
+TABLE_SIZE = 2048
+_PHASE = np.arange(TABLE_SIZE) / TABLE_SIZE
+
+# (polozaj v ciklu, amplituda mV, sirina) za P, Q, R, S, T
+ECG_WAVES = ((0.2, 0.15, 0.025), (0.35, -0.1, 0.01), (0.38, 1.2, 0.012), (0.41, -0.25, 0.01), (0.65, 0.3, 0.04))
+
+
+def _gaussians(waves) -> np.ndarray:
+    out = np.zeros(TABLE_SIZE)
+    for mu, amplitude, sigma in waves:
+        out += amplitude * np.exp(-((_PHASE - mu) ** 2) / (2 * sigma * sigma))
+    return out
+
+
+def ecg_template_bank(variants: int = 8, seed: Optional[int] = None) -> np.ndarray:
+    # vec rahlo razlicnih utripov, da signal ni strojno ponavljajoc
+    rng = np.random.default_rng(seed)
+    bank = [_gaussians(ECG_WAVES)]
+    for _ in range(variants - 1):
+        bank.append(_gaussians(
+            (mu + rng.normal(0, 0.004), a * rng.uniform(0.9, 1.1), s * rng.uniform(0.92, 1.08))
+            for mu, a, s in ECG_WAVES
+        ))
+    return np.stack(bank)
+
+
+def _sigmoid(x: np.ndarray, center: float, width: float) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-(x - center) / width))
+
+
+def capnogram_template(ie_ratio: float = 2.0) -> np.ndarray:
+    # cikel se zacne z izdihom: hiter dvig, rahlo narascajoc plato, padec ob vdihu (0..1 = EtCO2)
+    expiration = ie_ratio / (1.0 + ie_ratio)
+    rise = _sigmoid(_PHASE, 0.06, 0.012)
+    plateau = 0.9 + 0.1 * np.clip(_PHASE / expiration, 0.0, 1.0)
+    fall = 1.0 - _sigmoid(_PHASE, expiration, 0.008)
+    return rise * plateau * fall
+
+
+def airway_pressure_template(ie_ratio: float = 2.0) -> np.ndarray:
+    # 0 = PEEP, 1 = PIP; tlacno kontroliran vdih in eksponentni izdih
+    inspiration = 1.0 / (1.0 + ie_ratio)
+    out = np.empty(TABLE_SIZE)
+    ins = _PHASE < inspiration
+    out[ins] = 1.0 - np.exp(-_PHASE[ins] / 0.03)
+    end = 1.0 - np.exp(-inspiration / 0.03)
+    out[~ins] = end * np.exp(-(_PHASE[~ins] - inspiration) / 0.04)
+    return out
+
+
+def flow_template(ie_ratio: float = 2.0) -> np.ndarray:
+    # pojemajoc vdihni pretok (+) in eksponentni izdihni pretok (-), normirano na 1
+    inspiration = 1.0 / (1.0 + ie_ratio)
+    out = np.empty(TABLE_SIZE)
+    ins = _PHASE < inspiration
+    out[ins] = np.exp(-_PHASE[ins] / (inspiration * 0.8))
+    out[~ins] = -0.9 * np.exp(-(_PHASE[~ins] - inspiration) / 0.08)
+    return out
+
+
+#Ura faze: vrne indeks cikla in indeks v predlogi za vsak vzorec kosa
+class PhaseClock:
+    def __init__(self, sample_rate: float):
+        self.sample_rate = sample_rate
+        self.phase = 0.0
+
+    def advance(self, count: int, cycles_per_min: float) -> Tuple[np.ndarray, np.ndarray]:
+        step = max(cycles_per_min, 0.0) / 60.0 / self.sample_rate
+        phases = self.phase + step * np.arange(count)
+        cycles = phases.astype(np.int64)
+        index = ((phases - cycles) * TABLE_SIZE).astype(np.int64) % TABLE_SIZE
+        # faza ostane zvezna tudi ob spremembi frekvence med kosi
+        self.phase = phases[-1] + step - cycles[-1] if count else self.phase
+        return cycles, index
+
+
+class EcgWaveform:
+    def __init__(self, sample_rate: float, noise: float = 0.01, seed: Optional[int] = None):
+        self.clock = PhaseClock(sample_rate)
+        self.bank = ecg_template_bank(seed=seed)
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._row = 0
+
+    def samples(self, count: int, heart_rate: float) -> np.ndarray:
+        cycles, index = self.clock.advance(count, heart_rate)
+        # vsak nov utrip dobi nakljucno predlogo iz banke
+        rows = np.concatenate(([self._row], self._rng.integers(len(self.bank), size=int(cycles[-1]))))
+        self._row = int(rows[-1])
+        out = self.bank[rows[cycles], index]
+        if self.noise:
+            out = out + self._rng.normal(0.0, self.noise, count)
+        return out
+
+
+class CapnogramWaveform:
+    def __init__(self, sample_rate: float, noise: float = 0.2, seed: Optional[int] = None):
+        self.clock = PhaseClock(sample_rate)
+        self.template = capnogram_template()
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+
+    def samples(self, count: int, resp_rate: float, etco2: float) -> np.ndarray:
+        _, index = self.clock.advance(count, resp_rate)
+        out = self.template[index] * etco2
+        if self.noise:
+            out = out + self._rng.normal(0.0, self.noise, count)
+        return np.maximum(out, 0.0)
+
+
+class VentilatorWaveforms:
+    def __init__(self, sample_rate: float, noise: float = 0.1, seed: Optional[int] = None):
+        self.clock = PhaseClock(sample_rate)
+        self.pressure = airway_pressure_template()
+        self.flow = flow_template()
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+
+    def samples(self, count: int, resp_rate: float, peep: float, pip: float,
+                tidal_volume: float) -> Tuple[np.ndarray, np.ndarray]:
+        # tlak [cmH2O] in pretok [L/min] iz iste faze dihanja
+        _, index = self.clock.advance(count, resp_rate)
+        pressure = peep + (pip - peep) * self.pressure[index]
+        # vrsni pretok, da vdih v 1/3 cikla doseze dihalni volumen
+        inspiration_s = 60.0 / max(resp_rate, 1.0) / 3.0
+        peak_flow = tidal_volume / 1000.0 / inspiration_s * 60.0 * 1.6
+        flow = peak_flow * self.flow[index]
+        if self.noise:
+            pressure = pressure + self._rng.normal(0.0, self.noise, count)
+            flow = flow + self._rng.normal(0.0, self.noise, count)
+        return pressure, flow
+
+
+_DECIMALS: Dict[Tuple[int, int], decimal.Decimal] = {}
+
+
+def to_decimals(values: np.ndarray, places: int = 3) -> List[decimal.Decimal]:
+    # vzorci so kvantizirani, zato Decimal objekte za ponavljajoce vrednosti delimo
+    scaled = np.rint(np.asarray(values) * 10 ** places).astype(np.int64).tolist()
+    out = []
+    for i in scaled:
+        d = _DECIMALS.get((i, places))
+        if d is None:
+            d = _DECIMALS[(i, places)] = decimal.Decimal(i).scaleb(-places)
+        out.append(d)
+    return out
+